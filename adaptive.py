@@ -0,0 +1,505 @@
+import argparse
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+import models, schemas, analytics, archive, coherence, grading, jobs, mock_cache
+
+# Adaptive sessions pick each question after the previous answer: the candidate's ability is
+# re-estimated from the answers so far, and the next question is the unseen one from the
+# session's stacks that is most informative at that ability under a two-parameter logistic
+# (2PL) model, P(correct | ability) = 1 / (1 + exp(-discrimination * (ability - difficulty))).
+#
+# Question parameters come from `calibrate`, an offline pass over the graded answer history.
+# For selection they are held per stack as NumPy arrays sorted by question id, loaded on first
+# use and cached per engine like the sampling and grading indexes, so picking a question is a
+# handful of vector operations over the stack however many questions it has. Questions without
+# a calibration yet take the prior (discrimination 1, difficulty 0).
+
+DEFAULT_DISCRIMINATION = 1.0
+DEFAULT_DIFFICULTY = 0.0
+# Abilities (and difficulties) live on a standard normal scale, truncated to +-4
+ABILITY_GRID = np.linspace(-4.0, 4.0, 81)
+_LOG_PRIOR = -0.5 * ABILITY_GRID ** 2
+CALIBRATION_BATCH = 10000
+# Calibration bins each response by its session's ability; narrower bins cost memory per question
+ABILITY_BINS = np.linspace(-4.0, 4.0, 33)
+NEWTON_STEPS = 30
+# Pulls sparsely answered questions towards the prior instead of letting them fit to noise
+RIDGE = 1.0
+
+
+@dataclass(frozen=True)
+class StackParameters:
+    ids: np.ndarray
+    discrimination: np.ndarray
+    difficulty: np.ndarray
+
+
+class ItemBank:
+    """Per-stack parameter arrays, each loaded with one column query on first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stacks: Dict[int, StackParameters] = {}
+        # Adds (ids, stack_id) and removals (ids, None) that arrive while stacks are being loaded;
+        # a load may or may not see them, so it replays them before publishing its arrays
+        self._pending: Optional[List[Tuple[np.ndarray, Optional[int]]]] = None
+        self._loads = 0
+
+    def stack(self, db: Session, stack_id: int) -> StackParameters:
+        params = self._stacks.get(stack_id)
+        if params is None:
+            with self._lock:
+                if self._pending is None:
+                    self._pending = []
+                start = len(self._pending)
+                self._loads += 1
+            try:
+                Question, Calibration = models.Question, models.QuestionCalibration
+                rows = db.execute(
+                    select(Question.id, Calibration.discrimination, Calibration.difficulty)
+                    .outerjoin(Calibration, Calibration.question_id == Question.id)
+                    .where(Question.tech_stack_id == stack_id)
+                    .order_by(Question.id)
+                ).all()
+                ids = np.fromiter((row[0] for row in rows), np.int64, len(rows))
+                a = np.fromiter((DEFAULT_DISCRIMINATION if row[1] is None else row[1] for row in rows), np.float64, len(rows))
+                b = np.fromiter((DEFAULT_DIFFICULTY if row[2] is None else row[2] for row in rows), np.float64, len(rows))
+                params = StackParameters(ids, a, b)
+                with self._lock:
+                    if stack_id in self._stacks:
+                        return self._stacks[stack_id]
+                    for question_ids, added_to in self._pending[start:]:
+                        if added_to is None:
+                            params = _without(params, question_ids)
+                        elif added_to == stack_id:
+                            params = _with(params, question_ids)
+                    self._stacks[stack_id] = params
+            finally:
+                with self._lock:
+                    self._loads -= 1
+                    if not self._loads:
+                        self._pending = None
+        return params
+
+    def add(self, stack_id: int, question_ids: Sequence[int]):
+        """Adds new (uncalibrated) questions to a loaded, or loading, stack, keeping the ids sorted."""
+        if not question_ids:
+            return
+        added = np.asarray(question_ids, np.int64)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((added, stack_id))
+            params = self._stacks.get(stack_id)
+            if params is not None:
+                self._stacks[stack_id] = _with(params, added)
+
+    def remove(self, question_ids: Iterable[int]):
+        """Drops deleted questions from every loaded, or loading, stack."""
+        removed = np.asarray(list(question_ids), np.int64)
+        if not len(removed):
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((removed, None))
+            for stack_id, params in list(self._stacks.items()):
+                self._stacks[stack_id] = _without(params, removed)
+
+    def clear(self):
+        with self._lock:
+            self._stacks.clear()
+
+
+def _with(params: StackParameters, question_ids: np.ndarray) -> StackParameters:
+    # Skips those already loaded with the stack; other workers' questions can arrive out of id order
+    ids = np.setdiff1d(question_ids, params.ids)
+    if not len(ids):
+        return params
+    merged = np.concatenate([params.ids, ids])
+    order = np.argsort(merged, kind="stable")
+    return StackParameters(
+        merged[order],
+        np.concatenate([params.discrimination, np.full(len(ids), DEFAULT_DISCRIMINATION)])[order],
+        np.concatenate([params.difficulty, np.full(len(ids), DEFAULT_DIFFICULTY)])[order],
+    )
+
+
+def _without(params: StackParameters, question_ids: np.ndarray) -> StackParameters:
+    keep = ~np.isin(params.ids, question_ids)
+    if keep.all():
+        return params
+    return StackParameters(params.ids[keep], params.discrimination[keep], params.difficulty[keep])
+
+
+_banks: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+
+
+def bank_for(db: Session) -> ItemBank:
+    bind = db.get_bind()
+    with _registry_lock:
+        bank = _banks.get(bind)
+        if bank is None:
+            bank = _banks[bind] = ItemBank()
+        return bank
+
+
+def questions_added(db: Session, rows: Iterable[Tuple[int, int]]):
+    """Feeds freshly committed (id, tech_stack_id) rows into an existing bank."""
+    bank = _banks.get(db.get_bind())
+    if bank is None:
+        return
+    by_stack: Dict[int, List[int]] = {}
+    for question_id, stack_id in rows:
+        by_stack.setdefault(stack_id, []).append(question_id)
+    for stack_id, question_ids in by_stack.items():
+        bank.add(stack_id, question_ids)
+
+
+def questions_removed(db: Session, question_ids: Iterable[int]):
+    bank = _banks.get(db.get_bind())
+    if bank is not None:
+        bank.remove(question_ids)
+
+
+def information(discrimination: np.ndarray, difficulty: np.ndarray, ability: float) -> np.ndarray:
+    """Fisher information of each question at `ability`: a^2 P (1 - P)."""
+    p = 1.0 / (1.0 + np.exp(-discrimination * (ability - difficulty)))
+    return discrimination * discrimination * p * (1.0 - p)
+
+
+def select_question(bank: ItemBank, db: Session, stack_ids: Sequence[int], ability: float,
+                    seen: Sequence[int]) -> Optional[int]:
+    """The most informative question at `ability` among the stacks' questions not in `seen`."""
+    seen_ids = np.array(sorted(seen), np.int64)
+    best_id, best_information = None, -np.inf
+    for stack_id in stack_ids:
+        params = bank.stack(db, stack_id)
+        if not len(params.ids):
+            continue
+        scores = information(params.discrimination, params.difficulty, ability)
+        # Ids are sorted, so the seen ones are found by binary search rather than a set test per question
+        positions = np.searchsorted(params.ids, seen_ids)
+        inside = positions < len(params.ids)
+        scores[positions[inside][params.ids[positions[inside]] == seen_ids[inside]]] = -np.inf
+        i = int(np.argmax(scores))
+        if scores[i] > best_information:
+            best_id, best_information = int(params.ids[i]), scores[i]
+    return best_id
+
+
+def estimate_ability(discrimination: np.ndarray, difficulty: np.ndarray, scores: np.ndarray) -> Tuple[float, float]:
+    """
+    Expected a posteriori ability and its standard error under a standard normal prior, from
+    answers scored 1 (correct), 0.5 (partial) or 0. Stays finite when every answer is right or wrong.
+    """
+    z = np.subtract.outer(ABILITY_GRID, difficulty) * discrimination
+    # log P and log(1 - P), computed without overflow
+    log_likelihood = -(scores * np.logaddexp(0.0, -z) + (1.0 - scores) * np.logaddexp(0.0, z)).sum(axis=1)
+    posterior = log_likelihood + _LOG_PRIOR
+    weights = np.exp(posterior - posterior.max())
+    weights /= weights.sum()
+    ability = float(weights @ ABILITY_GRID)
+    return ability, float(np.sqrt(weights @ (ABILITY_GRID - ability) ** 2))
+
+
+def _parameters(db: Session, question_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+    Calibration = models.QuestionCalibration
+    known = {row.question_id: row for row in db.execute(
+        select(Calibration.question_id, Calibration.discrimination, Calibration.difficulty)
+        .where(Calibration.question_id.in_(question_ids)))}
+    a = np.array([known[qid].discrimination if qid in known else DEFAULT_DISCRIMINATION for qid in question_ids])
+    b = np.array([known[qid].difficulty if qid in known else DEFAULT_DIFFICULTY for qid in question_ids])
+    return a, b
+
+
+def _scored(db: Session, session_id: int) -> Tuple[List[int], List[Optional[models.CorrectnessEnum]]]:
+    SessionAnswer = models.SessionAnswer
+    rows = db.execute(select(SessionAnswer.question_id, SessionAnswer.correctness)
+                      .where(SessionAnswer.mock_session_id == session_id).order_by(SessionAnswer.id)).all()
+    return [row.question_id for row in rows], [row.correctness for row in rows]
+
+
+def _record_answer(db: Session, session_id: int, question_id: int, text: Optional[str]) -> Optional[models.CorrectnessEnum]:
+    """Grades the answer straight away (the next question depends on it) and stores it with its grade."""
+    [label] = grading.classify(grading.index_for(db).score([question_id], [text]))
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    stmt = upsert(models.SessionAnswer).values(mock_session_id=session_id, question_id=question_id,
+                                               candidate_answer=text, correctness=label)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[models.SessionAnswer.mock_session_id, models.SessionAnswer.question_id],
+        set_={"candidate_answer": stmt.excluded.candidate_answer, "correctness": stmt.excluded.correctness},
+    ))
+    return label
+
+
+def _step(db: Session, state: models.AdaptiveSession, answered: int, finished: bool,
+          last: Optional[models.CorrectnessEnum] = None) -> schemas.AdaptiveStep:
+    question = None
+    if state.current_question_id is not None:
+        row = db.get(models.Question, state.current_question_id)
+        question = schemas.CandidateQuestion(id=row.id, question_text=row.question_text, topic=row.topic)
+    return schemas.AdaptiveStep(session_id=state.mock_session_id, question=question, answered=answered,
+                                ability=round(state.ability, 4), standard_error=round(state.standard_error, 4),
+                                last_correctness=last, finished=finished)
+
+
+def _move(db: Session, session_id: int, expected: Optional[int], next_id: Optional[int]) -> bool:
+    """
+    Makes `next_id` the session's current question if it is still `expected`; False when a
+    concurrent request (a double submit, a client retry) has moved the session on already.
+    """
+    AdaptiveSession = models.AdaptiveSession
+    current = AdaptiveSession.current_question_id
+    return db.execute(
+        update(AdaptiveSession)
+        .where(AdaptiveSession.mock_session_id == session_id, current.is_(None) if expected is None else current == expected)
+        .values(current_question_id=next_id).execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+def _current_step(db: Session, session_id: int) -> schemas.AdaptiveStep:
+    """Drops this request's writes and serves the step the request that won the race left behind."""
+    db.rollback()
+    state = db.get(models.AdaptiveSession, session_id)
+    return _step(db, state, len(_scored(db, session_id)[0]), state.current_question_id is None)
+
+
+def _advance(db: Session, state: models.AdaptiveSession, mock_id: int,
+             last: Optional[models.CorrectnessEnum] = None, expected: Optional[int] = None) -> schemas.AdaptiveStep:
+    """
+    Re-estimates the ability, then serves the next question or finishes the session, provided
+    `expected` is still the session's current question. Commits.
+    """
+    question_ids, labels = _scored(db, state.mock_session_id)
+    graded = [(question_id, analytics.SCORES[label]) for question_id, label in zip(question_ids, labels)
+              if label is not None]
+    if graded:
+        a, b = _parameters(db, [question_id for question_id, _ in graded])
+        state.ability, state.standard_error = estimate_ability(a, b, np.array([score for _, score in graded]))
+
+    next_id = None
+    if len(question_ids) < state.max_questions and not (graded and state.standard_error <= state.target_standard_error):
+        while True:
+            next_id = select_question(bank_for(db), db, state.tech_stack_ids, state.ability, question_ids)
+            if next_id is None or db.get(models.Question, next_id) is not None:
+                break
+            # Deleted since its stack was loaded: drop it and take the next best
+            questions_removed(db, [next_id])
+    if not _move(db, state.mock_session_id, expected, next_id):
+        return _current_step(db, state.mock_session_id)
+    if next_id is None:
+        import crud
+
+        state.current_question_id = None
+        db.flush()
+        # Completes it like any submit: analytics, and a grading job for the stored answers
+        crud.submit_session(db, state.mock_session_id, [], load=lambda db, session_id: session_id)
+        return _step(db, state, len(question_ids), True, last)
+
+    # Served questions join the session's mock, so every session view and the submit path see them
+    db.execute(insert(models.mock_questions).values(mock_id=mock_id, question_id=next_id))
+    state.current_question_id = next_id
+    coherence.record(db, coherence.MOCK, [mock_id])
+    db.commit()
+    mock_cache.mock_changed(db, mock_id)
+    return _step(db, state, len(question_ids), False, last)
+
+
+def start_session(db: Session, data: schemas.AdaptiveSessionCreate) -> schemas.AdaptiveStep:
+    """Starts an adaptive session and serves its first question. Raises ValueError for bad input."""
+    if not data.tech_stack_ids:
+        raise ValueError("tech_stack_ids must not be empty")
+    if not 1 <= data.max_questions <= 200 or data.target_standard_error <= 0:
+        raise ValueError("max_questions must be between 1 and 200 and target_standard_error positive")
+    if db.get(models.Candidate, data.candidate_id) is None:
+        raise ValueError("Candidate not found")
+    stack_ids = list(dict.fromkeys(data.tech_stack_ids))
+    names = db.execute(select(models.TechStack.name).where(models.TechStack.id.in_(stack_ids))).scalars().all()
+    if len(names) != len(stack_ids):
+        raise ValueError("Unknown tech stack")
+
+    mock = models.Mock(name=f"Adaptive: {', '.join(names)}", description="Questions chosen one at a time")
+    session = models.MockSession(candidate_id=data.candidate_id, mock=mock, status=models.MockStatusEnum.in_progress)
+    state = models.AdaptiveSession(tech_stack_ids=stack_ids, max_questions=data.max_questions,
+                                   target_standard_error=data.target_standard_error, ability=0.0, standard_error=1.0)
+    db.add_all([mock, session])
+    db.flush()
+    state.mock_session_id = session.id
+    db.add(state)
+    db.flush()
+    return _advance(db, state, mock.id)
+
+
+def next_question(db: Session, session_id: int,
+                  answer: Optional[schemas.SessionAnswerCreate] = None) -> Optional[schemas.AdaptiveStep]:
+    """
+    Records the answer to the current question, if given, and returns the next one. Without an
+    answer the current question is returned again. None if there is no such adaptive session;
+    raises ValueError when it is finished or the answer is to another question.
+    """
+    state = db.get(models.AdaptiveSession, session_id)
+    if state is None:
+        return None
+    session = db.get(models.MockSession, session_id)
+    if session.status == models.MockStatusEnum.completed:
+        raise ValueError("Session is finished")
+    expected = state.current_question_id
+    if expected is not None and db.get(models.Question, expected) is None:
+        # The question being asked was deleted meanwhile: another one takes its place
+        questions_removed(db, [expected])
+        state.current_question_id = None
+        return _advance(db, state, session.mock_id, expected=expected)
+    if answer is None:
+        if expected is not None:
+            return _step(db, state, len(_scored(db, session_id)[0]), False)
+        return _advance(db, state, session.mock_id)
+    if answer.question_id != expected:
+        raise ValueError(f"Answer question {expected}, the one being asked")
+    last = _record_answer(db, session_id, answer.question_id, answer.candidate_answer)
+    state.current_question_id = None
+    return _advance(db, state, session.mock_id, last, expected)
+
+
+def _fit(counts: np.ndarray, sums: np.ndarray, abilities: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ridge-penalised 2PL logistic regression of every question at once (rows of counts/sums per
+    ability bin), by Newton's method on the slope a and intercept c of a * ability + c.
+    """
+    a = np.full(len(counts), DEFAULT_DISCRIMINATION)
+    c = np.zeros(len(counts))
+    for _ in range(NEWTON_STEPS):
+        p = 1.0 / (1.0 + np.exp(-(np.outer(a, abilities) + c[:, None])))
+        residual = sums - counts * p
+        weight = counts * p * (1.0 - p)
+        grad_a = residual @ abilities - RIDGE * (a - DEFAULT_DISCRIMINATION)
+        grad_c = residual.sum(axis=1) - RIDGE * c
+        h_aa = -(weight @ (abilities * abilities)) - RIDGE
+        h_ac = -(weight @ abilities)
+        h_cc = -weight.sum(axis=1) - RIDGE
+        det = h_aa * h_cc - h_ac * h_ac
+        a = np.clip(a - (h_cc * grad_a - h_ac * grad_c) / det, 0.2, 4.0)
+        c = c - (h_aa * grad_c - h_ac * grad_a) / det
+    return a, np.clip(-c / a, ABILITY_GRID[0], ABILITY_GRID[-1])
+
+
+def calibrate(db: Session, batch_size: int = CALIBRATION_BATCH) -> schemas.CalibrationReport:
+    """
+    Fits every answered question's parameters in one streaming pass over the graded answers of
+    completed sessions, archived ones included, and replaces question_calibrations. Commits.
+
+    Each session's ability is taken from its own score (the logit of its smoothed proportion
+    correct, standardised over all sessions), and each answer is counted in the ability bin of
+    its session, so the pass needs memory per question and bin, not per answer.
+    """
+    started = time.perf_counter()
+    question_ids = np.array(db.execute(select(models.Question.id).order_by(models.Question.id)).scalars().all(),
+                            np.int64)
+    counts = np.zeros((len(question_ids), len(ABILITY_BINS)))
+    sums = np.zeros_like(counts)
+    session_bins = np.zeros(len(ABILITY_BINS))
+    step = ABILITY_BINS[1] - ABILITY_BINS[0]
+    pending: Tuple[List[int], List[int], List[float]] = ([], [], [])
+    totals = {"sessions": 0, "answers": 0}
+
+    def flush():
+        rows = np.searchsorted(question_ids, np.array(pending[0], np.int64))
+        np.add.at(counts, (rows, pending[1]), 1.0)
+        np.add.at(sums, (rows, pending[1]), pending[2])
+        for values in pending:
+            values.clear()
+
+    def add_session(rows):
+        graded = [(question_id, analytics.SCORES[label]) for question_id, _, label in rows if label is not None]
+        if not graded:
+            return
+        score = sum(value for _, value in graded)
+        ability = np.log((score + 0.5) / (len(graded) - score + 0.5))
+        ability_bin = int(np.clip(np.rint((ability - ABILITY_BINS[0]) / step), 0, len(ABILITY_BINS) - 1))
+        session_bins[ability_bin] += 1
+        totals["sessions"] += 1
+        totals["answers"] += len(graded)
+        for question_id, value in graded:
+            pending[0].append(question_id)
+            pending[1].append(ability_bin)
+            pending[2].append(value)
+        if len(pending[0]) >= batch_size:
+            flush()
+
+    # Same streaming pass and session grouping as the analytics rebuild
+    rows = db.execute(
+        select(models.SessionAnswer.mock_session_id, models.SessionAnswer.question_id, models.SessionAnswer.correctness)
+        .join(models.MockSession, models.MockSession.id == models.SessionAnswer.mock_session_id)
+        .join(models.Question, models.Question.id == models.SessionAnswer.question_id)
+        .where(models.MockSession.status == models.MockStatusEnum.completed)
+        .order_by(models.SessionAnswer.mock_session_id)
+        .execution_options(yield_per=batch_size)
+    )
+    current, session_rows = None, []
+    for session_id, question_id, label in rows:
+        if session_id != current:
+            add_session(session_rows)
+            current, session_rows = session_id, []
+        session_rows.append((question_id, None, label))
+    add_session(session_rows)
+    for archived_rows in archive.answer_rows(db):
+        add_session(archived_rows)
+    flush()
+
+    # Standardise the bins so abilities, and so difficulties, share the selection prior's scale
+    abilities = ABILITY_BINS
+    if session_bins.sum() > 1:
+        mean = session_bins @ ABILITY_BINS / session_bins.sum()
+        spread = np.sqrt(session_bins @ (ABILITY_BINS - mean) ** 2 / session_bins.sum())
+        abilities = (ABILITY_BINS - mean) / (spread if spread > 0 else 1.0)
+    answered = np.flatnonzero(counts.sum(axis=1))
+    a, b = _fit(counts[answered], sums[answered], abilities)
+    responses = counts[answered].sum(axis=1)
+
+    db.execute(delete(models.QuestionCalibration))
+    calibration_rows = [{"question_id": int(question_ids[i]), "discrimination": float(a[k]),
+                         "difficulty": float(b[k]), "responses": int(responses[k])} for k, i in enumerate(answered)]
+    for start in range(0, len(calibration_rows), batch_size):
+        db.execute(insert(models.QuestionCalibration), calibration_rows[start:start + batch_size])
+    coherence.record(db, coherence.CALIBRATION)
+    db.commit()
+    bank_for(db).clear()
+    return schemas.CalibrationReport(sessions=totals["sessions"], answers=totals["answers"], questions=len(answered),
+                                     elapsed_seconds=round(time.perf_counter() - started, 3))
+
+
+def queue_calibration(db: Session) -> models.Job:
+    job = jobs.enqueue(db, "calibrate_questions", {})
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate question parameters for adaptive sessions.")
+    parser.add_argument("--batch-size", type=int, default=CALIBRATION_BATCH)
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        report = calibrate(db, args.batch_size)
+    finally:
+        db.close()
+    print(f"Calibrated {report.questions} questions from {report.answers} graded answers in "
+          f"{report.sessions} sessions in {report.elapsed_seconds}s")
+
+
+if __name__ == "__main__":
+    main()
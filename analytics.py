@@ -0,0 +1,247 @@
+import argparse
+import math
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+import archive, models, schemas
+from pagination import paginate
+
+# Per-question and per-stack statistics over completed sessions live in question_stats and
+# stack_stats, so reads are primary-key lookups instead of scans over session_answers.
+# The write paths that change what a completed session counts for (submit and grading)
+# snapshot the affected sessions before and after the change and apply only the difference,
+# which keeps resubmits and regrades from counting twice. `rebuild` recomputes everything
+# in one streaming pass over the answers, for backfills and consistency checks.
+
+# A session's score in a stack is the mean of its graded answers there: correct 1, partial 1/2
+SCORES = {models.CorrectnessEnum.correct: 1.0, models.CorrectnessEnum.partial: 0.5,
+          models.CorrectnessEnum.incorrect: 0.0}
+LABELS = (models.CorrectnessEnum.correct, models.CorrectnessEnum.partial, models.CorrectnessEnum.incorrect)
+COUNTERS = ("answers", "correct", "partial", "incorrect")
+SESSION_BATCH = 5000
+REBUILD_BATCH = 10000
+
+# session_id -> [(question_id, tech_stack_id, correctness)] of a completed session's answers
+Snapshot = Dict[int, List[Tuple[int, int, Optional[models.CorrectnessEnum]]]]
+
+
+def snapshot(db: Session, session_ids: Sequence[int]) -> Snapshot:
+    """What the completed sessions among `session_ids` currently count for."""
+    SessionAnswer = models.SessionAnswer
+    result: Snapshot = {}
+    for start in range(0, len(session_ids), SESSION_BATCH):
+        rows = db.execute(
+            select(SessionAnswer.mock_session_id, SessionAnswer.question_id, models.Question.tech_stack_id,
+                   SessionAnswer.correctness)
+            .join(models.MockSession, models.MockSession.id == SessionAnswer.mock_session_id)
+            .join(models.Question, models.Question.id == SessionAnswer.question_id)
+            .where(SessionAnswer.mock_session_id.in_(session_ids[start:start + SESSION_BATCH]),
+                   models.MockSession.status == models.MockStatusEnum.completed)
+        )
+        for session_id, question_id, stack_id, correctness in rows:
+            result.setdefault(session_id, []).append((question_id, stack_id, correctness))
+    return result
+
+
+class _Tally:
+    """Counter values (or deltas) per question and per stack."""
+
+    def __init__(self):
+        self.sessions = 0
+        # question_id -> [tech_stack_id, answers, correct, partial, incorrect]
+        self.questions: Dict[int, list] = {}
+        # tech_stack_id -> [answers, correct, partial, incorrect, scored_sessions, score_sum]
+        self.stacks: Dict[int, list] = {}
+
+    def add_session(self, rows, sign: int = 1):
+        self.sessions += sign
+        points: Dict[int, List[float]] = {}
+        for question_id, stack_id, correctness in rows:
+            question = self.questions.get(question_id)
+            if question is None:
+                question = self.questions[question_id] = [stack_id, 0, 0, 0, 0]
+            stack = self.stacks.get(stack_id)
+            if stack is None:
+                stack = self.stacks[stack_id] = [0, 0, 0, 0, 0, 0.0]
+            question[1] += sign
+            stack[0] += sign
+            if correctness is not None:
+                column = LABELS.index(correctness)
+                question[2 + column] += sign
+                stack[1 + column] += sign
+                total = points.setdefault(stack_id, [0.0, 0])
+                total[0] += SCORES[correctness]
+                total[1] += 1
+        for stack_id, (score, graded) in points.items():
+            self.stacks[stack_id][4] += sign
+            self.stacks[stack_id][5] += sign * score / graded
+
+    def question_rows(self) -> List[dict]:
+        return [{"question_id": question_id, "tech_stack_id": values[0], **dict(zip(COUNTERS, values[1:]))}
+                for question_id, values in self.questions.items()]
+
+    def stack_rows(self) -> List[dict]:
+        return [{"tech_stack_id": stack_id, **dict(zip(COUNTERS + ("scored_sessions", "score_sum"), values))}
+                for stack_id, values in self.stacks.items()]
+
+
+def _upsert_increments(db: Session, table, key: str, columns: Sequence[str], rows: List[dict]):
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    stmt = upsert(table)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c[key]],
+        set_={column: table.c[column] + stmt.excluded[column] for column in columns},
+    ), rows)
+
+
+def apply(db: Session, before: Snapshot, after: Snapshot):
+    """Adds the difference between two snapshots of the same sessions to the stats tables (no commit)."""
+    delta = _Tally()
+    for rows in before.values():
+        delta.add_session(rows, -1)
+    for rows in after.values():
+        delta.add_session(rows, 1)
+    questions = [row for row in delta.question_rows() if any(row[column] for column in COUNTERS)]
+    stacks = [row for row in delta.stack_rows()
+              if any(row[column] for column in COUNTERS + ("scored_sessions",)) or abs(row["score_sum"]) > 1e-12]
+    _upsert_increments(db, models.QuestionStat.__table__, "question_id", COUNTERS, questions)
+    _upsert_increments(db, models.StackStat.__table__, "tech_stack_id", COUNTERS + ("scored_sessions", "score_sum"),
+                       stacks)
+
+
+def _rate(numerator: float, denominator: int) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def _question_stats(row) -> schemas.QuestionStats:
+    graded = row.correct + row.partial + row.incorrect
+    return schemas.QuestionStats(question_id=row.question_id, tech_stack_id=row.tech_stack_id, answers=row.answers,
+                                 graded=graded, correct=row.correct, partial=row.partial, incorrect=row.incorrect,
+                                 pass_rate=_rate(row.correct, graded))
+
+
+def get_question_stats(db: Session, tech_stack_id: Optional[int] = None, skip: int = 0, limit: int = 100,
+                       after_id: Optional[int] = None) -> List[schemas.QuestionStats]:
+    query = db.query(models.QuestionStat)
+    if tech_stack_id is not None:
+        query = query.filter(models.QuestionStat.tech_stack_id == tech_stack_id)
+    return [_question_stats(row) for row in paginate(query, models.QuestionStat.question_id, skip, limit, after_id)]
+
+
+def get_question_stat(db: Session, question_id: int) -> Optional[schemas.QuestionStats]:
+    row = db.get(models.QuestionStat, question_id)
+    return _question_stats(row) if row is not None else None
+
+
+def get_stack_stats(db: Session) -> List[schemas.StackStats]:
+    stats = []
+    for row in db.query(models.StackStat).order_by(models.StackStat.tech_stack_id):
+        graded = row.correct + row.partial + row.incorrect
+        stats.append(schemas.StackStats(
+            tech_stack_id=row.tech_stack_id, answers=row.answers, graded=graded, correct=row.correct,
+            partial=row.partial, incorrect=row.incorrect, pass_rate=_rate(row.correct, graded),
+            scored_sessions=row.scored_sessions, average_score=_rate(row.score_sum, row.scored_sessions),
+        ))
+    return stats
+
+
+def compute(db) -> _Tally:
+    """Streams every answer of completed sessions, in session order, through one tally."""
+    SessionAnswer = models.SessionAnswer
+    rows = db.execute(
+        select(SessionAnswer.mock_session_id, SessionAnswer.question_id, models.Question.tech_stack_id,
+               SessionAnswer.correctness)
+        .join(models.MockSession, models.MockSession.id == SessionAnswer.mock_session_id)
+        .join(models.Question, models.Question.id == SessionAnswer.question_id)
+        .where(models.MockSession.status == models.MockStatusEnum.completed)
+        # Walks the (session, question) unique index, so nothing is sorted
+        .order_by(SessionAnswer.mock_session_id)
+        .execution_options(yield_per=REBUILD_BATCH)
+    )
+    tally = _Tally()
+    current, session_rows = None, []
+    for session_id, question_id, stack_id, correctness in rows:
+        if session_id != current:
+            if session_rows:
+                tally.add_session(session_rows)
+            current, session_rows = session_id, []
+        session_rows.append((question_id, stack_id, correctness))
+    if session_rows:
+        tally.add_session(session_rows)
+    return tally
+
+
+def _mismatches(db, tally: _Tally) -> int:
+    stored_questions = {row.question_id: row for row in db.execute(select(models.QuestionStat.__table__))}
+    stored_stacks = {row.tech_stack_id: row for row in db.execute(select(models.StackStat.__table__))}
+    mismatches = 0
+    for row in tally.question_rows():
+        stored = stored_questions.pop(row["question_id"], None)
+        mismatches += stored is None or any(getattr(stored, column) != row[column] for column in COUNTERS)
+    for row in tally.stack_rows():
+        stored = stored_stacks.pop(row["tech_stack_id"], None)
+        mismatches += (stored is None
+                       or any(getattr(stored, column) != row[column] for column in COUNTERS + ("scored_sessions",))
+                       or not math.isclose(stored.score_sum, row["score_sum"], rel_tol=1e-9, abs_tol=1e-6))
+    # Rows for questions or stacks that no longer have any counted answer
+    mismatches += sum(any(getattr(row, column) for column in COUNTERS) for row in stored_questions.values())
+    mismatches += sum(bool(row.answers or row.scored_sessions) for row in stored_stacks.values())
+    return mismatches
+
+
+def rebuild(db, check: bool = False) -> schemas.AnalyticsRebuildReport:
+    """
+    Recomputes both tables from session_answers and the archived sessions. With `check` the stored
+    rows are only compared and the number of differing rows reported. Works on a Session or a
+    Connection; does not commit.
+    """
+    started = time.perf_counter()
+    tally = compute(db)
+    for rows in archive.answer_rows(db):
+        tally.add_session(rows)
+    mismatches = _mismatches(db, tally)
+    if not check:
+        db.execute(delete(models.QuestionStat.__table__))
+        db.execute(delete(models.StackStat.__table__))
+        for table, rows in ((models.QuestionStat.__table__, tally.question_rows()),
+                            (models.StackStat.__table__, tally.stack_rows())):
+            for start in range(0, len(rows), REBUILD_BATCH):
+                db.execute(insert(table), rows[start:start + REBUILD_BATCH])
+    return schemas.AnalyticsRebuildReport(
+        sessions=tally.sessions,
+        answers=sum(values[0] for values in tally.stacks.values()),
+        questions=len(tally.questions),
+        stacks=len(tally.stacks),
+        mismatches=mismatches,
+        elapsed_seconds=round(time.perf_counter() - started, 3),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute the question and stack analytics tables.")
+    parser.add_argument("--check", action="store_true", help="Only report rows that differ from a fresh computation")
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        report = rebuild(db, check=args.check)
+        db.commit()
+    finally:
+        db.close()
+    action = "Checked" if args.check else "Rebuilt"
+    print(f"{action} {report.questions} questions and {report.stacks} stacks from {report.answers} answers "
+          f"in {report.sessions} sessions in {report.elapsed_seconds}s; {report.mismatches} rows differed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+import weakref
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import Column, DateTime, Enum, Integer, LargeBinary, MetaData, String, Table, Text, delete, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.sql import func
+
+import models, schemas
+
+# Completed sessions older than ARCHIVE_AFTER_DAYS move, with their answers, out of the hot
+# tables into an archive database (a separate SQLite file by default, MOCKTEST_ARCHIVE_DATABASE_URL),
+# BATCH_SIZE sessions at a time. An archived session is one row, its answers a single
+# zlib-compressed JSON blob, so the free-text answers of finished exams no longer take up
+# pages, page cache and backup time in the live database. Each batch is committed to the
+# archive before it is deleted from the hot tables: an interrupted run leaves at most one
+# batch in both places, and the next run overwrites it there and finishes the delete.
+#
+# Session lookups fall back to the archive (session_views.render), the analytics rebuild
+# counts archived sessions too, exports include them (export.stream), and `compact` gives
+# the freed pages back to the filesystem.
+# Candidates and mocks stay in the hot database; a candidate with archived sessions cannot be deleted.
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("MOCKTEST_ARCHIVE_AFTER_DAYS", "180"))
+BATCH_SIZE = 1000
+COMPRESSION_LEVEL = 6
+
+_metadata = MetaData()
+
+archived_sessions = Table(
+    "archived_sessions", _metadata,
+    Column("id", Integer, primary_key=True),
+    Column("candidate_id", Integer, nullable=False, index=True),
+    Column("mock_id", Integer, nullable=False),
+    Column("session_date", DateTime(timezone=True)),
+    Column("status", Enum(models.MockStatusEnum), nullable=False),
+    Column("overall_result", String),
+    Column("soft_skills_feedback", Text),
+    Column("coding_feedback", Text),
+    # zlib-compressed JSON: [[answer id, question_id, candidate_answer, correctness], ...] in answer id order
+    Column("answers", LargeBinary, nullable=False),
+    Column("archived_at", DateTime(timezone=True), server_default=func.now()),
+)
+SESSION_COLUMNS = ("id", "candidate_id", "mock_id", "session_date", "status", "overall_result",
+                   "soft_skills_feedback", "coding_feedback")
+
+# hot-database engine -> archive engine
+_archives: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_ready: "weakref.WeakSet" = weakref.WeakSet()
+_lock = threading.Lock()
+
+
+def attach(engine: Engine, archive_engine: Engine):
+    """Makes lookups through `engine` (a hot database) fall back to `archive_engine`."""
+    with _lock:
+        _archives[engine] = archive_engine
+
+
+def detach(engine: Engine):
+    with _lock:
+        _archives.pop(engine, None)
+
+
+def install():
+    """Attaches the configured archive database to every engine of the app."""
+    import database
+
+    if database.archive_engine is None:
+        return
+    for engine in (database.engine, database.read_engine, database.async_engine, database.async_read_engine):
+        if engine is not None:
+            # Lookups on an AsyncSession run on its sync engine
+            attach(getattr(engine, "sync_engine", engine), database.archive_engine)
+
+
+def engine_for(db) -> Optional[Engine]:
+    """The archive attached to the database a Session or Connection is on, if any."""
+    bind = db.engine if isinstance(db, Connection) else db.get_bind()
+    return _archives.get(bind)
+
+
+def ensure_schema(archive_engine: Engine):
+    with _lock:
+        if archive_engine in _ready:
+            return
+        _metadata.create_all(archive_engine)
+        _ready.add(archive_engine)
+
+
+def _pack(answers: List[list]) -> Tuple[bytes, int]:
+    raw = json.dumps(answers, separators=(",", ":"), ensure_ascii=False).encode()
+    return zlib.compress(raw, COMPRESSION_LEVEL), len(raw)
+
+
+def unpack(blob: bytes) -> List[list]:
+    return json.loads(zlib.decompress(blob))
+
+
+def _upsert(conn: Connection, rows: List[dict]):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(archived_sessions)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[archived_sessions.c.id],
+        set_={name: stmt.excluded[name] for name in SESSION_COLUMNS[1:] + ("answers",)},
+    ), rows)
+
+
+def archive_sessions(db: Session, archive_engine: Engine, older_than: datetime.timedelta,
+                     batch_size: int = BATCH_SIZE, progress=None) -> schemas.ArchiveReport:
+    """
+    Moves completed sessions dated before now - `older_than`, with their answers, to the archive.
+    `progress(sessions)` is called after every batch. Commits each batch on both databases.
+    """
+    MockSession, SessionAnswer = models.MockSession, models.SessionAnswer
+    started = time.perf_counter()
+    ensure_schema(archive_engine)
+    # Naive UTC, like the CURRENT_TIMESTAMP defaults SQLite stores
+    cutoff = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - older_than
+    sessions = answers = raw_bytes = stored_bytes = 0
+    after_id = 0
+    while True:
+        rows = db.execute(
+            select(*(MockSession.__table__.c[name] for name in SESSION_COLUMNS))
+            .where(MockSession.status == models.MockStatusEnum.completed, MockSession.session_date < cutoff,
+                   MockSession.id > after_id)
+            .order_by(MockSession.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        by_session = {}
+        for answer in db.execute(
+            select(SessionAnswer.id, SessionAnswer.mock_session_id, SessionAnswer.question_id,
+                   SessionAnswer.candidate_answer, SessionAnswer.correctness)
+            .where(SessionAnswer.mock_session_id.in_(ids))
+            .order_by(SessionAnswer.mock_session_id, SessionAnswer.id)
+        ):
+            by_session.setdefault(answer.mock_session_id, []).append([
+                answer.id, answer.question_id, answer.candidate_answer,
+                answer.correctness.value if answer.correctness is not None else None,
+            ])
+
+        records = []
+        for row in rows:
+            session_answers = by_session.get(row.id, [])
+            blob, size = _pack(session_answers)
+            records.append({**row._mapping, "answers": blob})
+            answers += len(session_answers)
+            raw_bytes += size
+            stored_bytes += len(blob)
+        with archive_engine.begin() as conn:
+            _upsert(conn, records)
+
+        # Only once the batch is safely in the archive
+        db.execute(delete(models.SubmissionReceipt).where(models.SubmissionReceipt.mock_session_id.in_(ids)))
+        db.execute(delete(models.AdaptiveSession).where(models.AdaptiveSession.mock_session_id.in_(ids)))
+        db.execute(delete(SessionAnswer).where(SessionAnswer.mock_session_id.in_(ids)))
+        db.execute(delete(MockSession).where(MockSession.id.in_(ids)))
+        db.commit()
+        sessions += len(ids)
+        after_id = ids[-1]
+        if progress is not None:
+            progress(sessions)
+
+    elapsed = time.perf_counter() - started
+    return schemas.ArchiveReport(
+        sessions=sessions,
+        answers=answers,
+        raw_bytes=raw_bytes,
+        stored_bytes=stored_bytes,
+        elapsed_seconds=round(elapsed, 3),
+        sessions_per_second=round(sessions / elapsed, 1) if elapsed else 0.0,
+    )
+
+
+def _fetch(db, session_id: int):
+    archive_engine = engine_for(db)
+    if archive_engine is None:
+        return None
+    ensure_schema(archive_engine)
+    with archive_engine.connect() as conn:
+        return conn.execute(select(archived_sessions).where(archived_sessions.c.id == session_id)).first()
+
+
+def load(db: Session, session_id: int, view: str) -> Optional[BaseModel]:
+    """An archived session in one of session_views.VIEWS, with its mock and candidate read from `db`."""
+    row = _fetch(db, session_id)
+    if row is None:
+        return None
+    data = {name: row._mapping[name] for name in SESSION_COLUMNS}
+    answers = [{"id": answer_id, "question_id": question_id, "candidate_answer": text, "correctness": correctness,
+                "mock_session_id": session_id}
+               for answer_id, question_id, text, correctness in unpack(row.answers)]
+    if view == "summary":
+        return schemas.SessionSummary.model_validate(data)
+
+    mock = (db.query(models.Mock).options(selectinload(models.Mock.questions))
+            .filter(models.Mock.id == row.mock_id).first())
+    if view == "candidate":
+        return schemas.SessionCandidateView.model_validate(
+            {**data, "mock": mock, "answers": answers}, from_attributes=True)
+    candidate = db.get(models.Candidate, row.candidate_id)
+    if view == "reviewer":
+        given = {answer["question_id"]: answer for answer in answers}
+        questions = [{"question_id": question.id, "question_text": question.question_text, "topic": question.topic,
+                      "ideal_answer": question.ideal_answer,
+                      "candidate_answer": given.get(question.id, {}).get("candidate_answer"),
+                      "correctness": given.get(question.id, {}).get("correctness")}
+                     for question in (mock.questions if mock else [])]
+        return schemas.SessionReviewerView.model_validate(
+            {**data, "candidate": candidate, "questions": questions}, from_attributes=True)
+    return schemas.MockSession.model_validate(
+        {**data, "answers": answers, "candidate": candidate, "mock": mock}, from_attributes=True)
+
+
+def has_sessions(db, candidate_id: int) -> bool:
+    archive_engine = engine_for(db)
+    if archive_engine is None:
+        return False
+    ensure_schema(archive_engine)
+    with archive_engine.connect() as conn:
+        return conn.execute(select(archived_sessions.c.id)
+                            .where(archived_sessions.c.candidate_id == candidate_id).limit(1)).first() is not None
+
+
+def answer_rows(db) -> Iterator[List[Tuple[int, int, Optional[models.CorrectnessEnum]]]]:
+    """Every archived completed session's answers as analytics counts them: (question_id, tech_stack_id, correctness)."""
+    archive_engine = engine_for(db)
+    if archive_engine is None:
+        return
+    ensure_schema(archive_engine)
+    stacks = dict(db.execute(select(models.Question.id, models.Question.tech_stack_id)).all())
+    with archive_engine.connect() as conn:
+        rows = conn.execution_options(yield_per=BATCH_SIZE).execute(
+            select(archived_sessions.c.answers)
+            .where(archived_sessions.c.status == models.MockStatusEnum.completed)
+        )
+        for (blob,) in rows:
+            # Like the hot tables' join, answers to questions deleted since are not counted
+            yield [(question_id, stacks[question_id],
+                    models.CorrectnessEnum(correctness) if correctness is not None else None)
+                   for _, question_id, _, correctness in unpack(blob) if question_id in stacks]
+
+
+def _size(conn: Connection) -> int:
+    if conn.dialect.name == "sqlite":
+        return (conn.exec_driver_sql("PRAGMA page_count").scalar()
+                * conn.exec_driver_sql("PRAGMA page_size").scalar())
+    return conn.exec_driver_sql("SELECT pg_database_size(current_database())").scalar()
+
+
+def compact(engine: Engine) -> schemas.CompactionReport:
+    """
+    Reclaims the space archived sessions left in the hot database: VACUUM on SQLite (which
+    rewrites the file and needs as much free disk), VACUUM ANALYZE of the session tables on Postgres.
+    """
+    started = time.perf_counter()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        before = _size(conn)
+        if conn.dialect.name == "sqlite":
+            conn.exec_driver_sql("VACUUM")
+            # In WAL mode the rewritten pages reach the main file, and it shrinks, at a checkpoint
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        else:
+            for table in ("session_answers", "mock_sessions", "submission_receipts"):
+                conn.exec_driver_sql(f"VACUUM ANALYZE {table}")
+        after = _size(conn)
+    return schemas.CompactionReport(bytes_before=before, bytes_after=after,
+                                    elapsed_seconds=round(time.perf_counter() - started, 3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move old completed sessions to the archive database.")
+    parser.add_argument("--older-than-days", type=float, default=ARCHIVE_AFTER_DAYS,
+                        help=f"Archive completed sessions older than this (default: {ARCHIVE_AFTER_DAYS})")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--compact", action="store_true", help="Reclaim the freed space afterwards")
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal, archive_engine, engine
+
+    if archive_engine is None:
+        parser.error("archiving is turned off (MOCKTEST_ARCHIVE_DATABASE_URL is empty)")
+    db = SessionLocal()
+    try:
+        report = archive_sessions(db, archive_engine, datetime.timedelta(days=args.older_than_days),
+                                  args.batch_size, progress=lambda n: print(f"  {n} sessions archived"))
+    finally:
+        db.close()
+    ratio = f"{report.raw_bytes / report.stored_bytes:.1f}x" if report.stored_bytes else "n/a"
+    print(f"Archived {report.sessions} sessions ({report.answers} answers) in {report.elapsed_seconds}s, "
+          f"{report.sessions_per_second} sessions/s; answers compressed {ratio}")
+    if args.compact:
+        compaction = compact(engine)
+        print(f"Compacted {compaction.bytes_before:,} -> {compaction.bytes_after:,} bytes "
+              f"in {compaction.elapsed_seconds}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import functools
+from typing import Any, Callable, Optional, Union
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+import crud
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession
+except ImportError:  # greenlet is not installed; only the sync mode is available
+    AsyncSession = None
+
+AnySession = Union[Session, AsyncSession] if AsyncSession else Session
+
+# The crud module stays the single implementation of every query. With an AsyncSession it
+# runs through `run_sync`, which drives the same ORM code over the asyncio driver without
+# blocking the event loop; with a regular Session it is pushed to the threadpool as before.
+
+
+@functools.lru_cache(maxsize=None)
+def _adapter(response_model) -> TypeAdapter:
+    return TypeAdapter(response_model)
+
+
+async def run(db, fn: Callable[..., Any], *args, response_model: Optional[Any] = None, **kwargs):
+    """
+    Calls `fn(session, *args, **kwargs)` without blocking the event loop.
+    When `response_model` is given the result is converted while still inside the
+    database call, so relationship lazy loads never happen on the event loop.
+    """
+    def call(session: Session):
+        result = fn(session, *args, **kwargs)
+        if response_model is not None and result is not None:
+            result = _adapter(response_model).validate_python(result, from_attributes=True)
+        return result
+
+    if AsyncSession is not None and isinstance(db, AsyncSession):
+        return await db.run_sync(call)
+    return await run_in_threadpool(call, db)
+
+
+def _async(fn: Callable[..., Any]):
+    @functools.wraps(fn)
+    async def wrapper(db, *args, **kwargs):
+        return await run(db, fn, *args, **kwargs)
+    return wrapper
+
+
+get_candidate = _async(crud.get_candidate)
+get_candidates = _async(crud.get_candidates)
+create_candidate = _async(crud.create_candidate)
+get_candidate_by_email = _async(crud.get_candidate_by_email)
+update_candidate = _async(crud.update_candidate)
+delete_candidate = _async(crud.delete_candidate)
+get_tech_stack = _async(crud.get_tech_stack)
+get_tech_stack_by_name = _async(crud.get_tech_stack_by_name)
+get_tech_stacks = _async(crud.get_tech_stacks)
+get_tech_stack_summaries = _async(crud.get_tech_stack_summaries)
+create_tech_stack = _async(crud.create_tech_stack)
+create_question = _async(crud.create_question)
+get_questions = _async(crud.get_questions)
+get_mocks = _async(crud.get_mocks)
+get_mock = _async(crud.get_mock)
+create_mock_from_stacks = _async(crud.create_mock_from_stacks)
+create_mock_batch = _async(crud.create_mock_batch)
+create_mock_session = _async(crud.create_mock_session)
+get_session_details = _async(crud.get_session_details)
+upsert_answer_rows = _async(crud.upsert_answer_rows)
+upsert_session_answers = _async(crud.upsert_session_answers)
+get_session_status = _async(crud.get_session_status)
+submit_session = _async(crud.submit_session)
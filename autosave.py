@@ -0,0 +1,215 @@
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+import crud, schemas
+
+logger = logging.getLogger(__name__)
+
+# Autosaves arrive every few seconds per candidate. Writing each one would mean thousands
+# of tiny SQLite transactions per second during an exam, so saves are coalesced in memory
+# per (session, question) and written behind in batches.
+
+FLUSH_INTERVAL = float(os.getenv("MOCKTEST_AUTOSAVE_INTERVAL", "1.0"))
+MAX_PENDING = int(os.getenv("MOCKTEST_AUTOSAVE_MAX_PENDING", "5000"))
+
+AnswerKey = Tuple[int, int]
+
+# Set when a buffer crosses max_pending, so the flusher does not wait for the next tick
+_wake = threading.Event()
+
+
+class AnswerBuffer:
+    """Write-behind buffer of the latest unsaved answer per (session, question)."""
+
+    def __init__(self, session_factory: sessionmaker, max_pending: int = MAX_PENDING):
+        self.session_factory = session_factory
+        self.max_pending = max_pending
+        self._pending: Dict[AnswerKey, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.saves = self.coalesced = self.flushes = self.flushed_rows = self.failed_flushes = 0
+        # Saves that reached a session only after it was submitted; never written
+        self.discarded = 0
+        self.last_flush_seconds = self.max_flush_seconds = self.total_flush_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def put(self, session_id: int, answers: Iterable[schemas.SessionAnswerCreate]) -> int:
+        """Buffers answers; returns how many were accepted."""
+        accepted = 0
+        with self._lock:
+            for ans in answers:
+                key = (session_id, ans.question_id)
+                if key in self._pending:
+                    self.coalesced += 1
+                self._pending[key] = ans.candidate_answer
+                accepted += 1
+            self.saves += accepted
+            full = len(self._pending) >= self.max_pending
+        if full:
+            _wake.set()
+        return accepted
+
+    def _take(self, session_id: Optional[int] = None) -> Dict[AnswerKey, Optional[str]]:
+        with self._lock:
+            if session_id is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {key: text for key, text in self._pending.items() if key[0] == session_id}
+                for key in batch:
+                    del self._pending[key]
+            return batch
+
+    def discard(self, session_id: int) -> int:
+        """Drops a submitted session's pending saves; returns how many there were."""
+        dropped = len(self._take(session_id))
+        self.discarded += dropped
+        return dropped
+
+    def _restore(self, batch: Dict[AnswerKey, Optional[str]]):
+        # Newer saves that arrived during the failed flush take precedence
+        with self._lock:
+            for key, text in batch.items():
+                self._pending.setdefault(key, text)
+
+    def flush(self, db: Optional[Session] = None, session_id: Optional[int] = None) -> int:
+        """
+        Writes pending answers (all, or one session's) in a single transaction.
+        Uses `db` when given, otherwise a session of its own. Returns the number of rows written.
+        """
+        with self._flush_lock:
+            batch = self._take(session_id)
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            own_session = db is None
+            db = db or self.session_factory()
+            try:
+                # A save that raced with the final submit must not overwrite the submitted answers
+                written = crud.upsert_open_answer_rows(db, batch)
+                db.commit()
+            except Exception:
+                # Kept before anything else can fail, so no answer is lost
+                self._restore(batch)
+                self.failed_flushes += 1
+                try:
+                    db.rollback()
+                except Exception:
+                    logger.exception("Rollback after a failed autosave flush failed")
+                raise
+            finally:
+                if own_session:
+                    db.close()
+            elapsed = time.perf_counter() - started
+            self.flushes += 1
+            self.flushed_rows += written
+            self.discarded += len(batch) - written
+            self.last_flush_seconds = elapsed
+            self.total_flush_seconds += elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            return written
+
+    def stats(self) -> schemas.AutosaveStats:
+        return schemas.AutosaveStats(
+            depth=self.depth,
+            saves=self.saves,
+            coalesced=self.coalesced,
+            flushes=self.flushes,
+            flushed_rows=self.flushed_rows,
+            failed_flushes=self.failed_flushes,
+            discarded=self.discarded,
+            last_flush_ms=round(self.last_flush_seconds * 1000, 3),
+            avg_flush_ms=round(self.total_flush_seconds / self.flushes * 1000, 3) if self.flushes else 0.0,
+            max_flush_ms=round(self.max_flush_seconds * 1000, 3),
+        )
+
+
+_buffers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+
+
+def _sync_engine(bind: Engine) -> Engine:
+    """The engine the flusher thread writes through: it has no event loop, so never an asyncio driver's."""
+    if not bind.dialect.is_async:
+        return bind
+    import database
+
+    if database.async_engine is not None and bind is database.async_engine.sync_engine:
+        return database.engine
+    # Same database through the dialect's default (blocking) driver
+    return create_engine(bind.url.set(drivername=bind.url.get_backend_name()))
+
+
+def buffer_for(db) -> AnswerBuffer:
+    """Returns the buffer for the database the (sync or async) session is bound to."""
+    bind = db.get_bind()
+    with _registry_lock:
+        buffer = _buffers.get(bind)
+        if buffer is None:
+            factory = sessionmaker(autocommit=False, autoflush=False, bind=_sync_engine(bind))
+            buffer = _buffers[bind] = AnswerBuffer(factory)
+        return buffer
+
+
+def flush_session(db: Session, session_id: int) -> int:
+    """Synchronously writes a session's pending autosaves through the caller's session (used before final submit)."""
+    buffer = _buffers.get(db.get_bind())
+    return buffer.flush(db, session_id) if buffer is not None else 0
+
+
+def discard_session(db, session_id: int) -> int:
+    """Drops saves that arrived for a session while it was being submitted."""
+    buffer = _buffers.get(db.get_bind())
+    return buffer.discard(session_id) if buffer is not None else 0
+
+
+def flush_all():
+    for buffer in list(_buffers.values()):
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception("Autosave flush failed; answers kept for the next attempt")
+
+
+class _Flusher(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(name="autosave-flusher", daemon=True)
+        self.interval = interval
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            _wake.wait(self.interval)
+            _wake.clear()
+            flush_all()
+
+
+_flusher: Optional[_Flusher] = None
+
+
+def start(interval: float = FLUSH_INTERVAL):
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = _Flusher(interval)
+        _flusher.start()
+
+
+def shutdown():
+    """Stops the timer and writes everything still buffered."""
+    global _flusher
+    if _flusher is not None:
+        _flusher.stopping.set()
+        _wake.set()
+        _flusher.join()
+        _flusher = None
+    flush_all()
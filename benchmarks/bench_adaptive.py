@@ -0,0 +1,111 @@
+"""
+Adaptive question selection latency per pool size, and calibration throughput.
+
+    python -m benchmarks.bench_adaptive --pools 1000 10000 100000 --sessions 20000
+
+Selection picks the next question of a session that has already seen `--seen` questions,
+from a stack of each pool size, through the cached parameter arrays. Calibration runs on a
+temporary SQLite database filled with answers simulated from known 2PL parameters, and also
+reports how closely the fitted difficulties follow the true ones.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import adaptive, migrations, models
+
+
+def bench_selection(pool: int, seen: int, samples: int, rng: np.random.Generator) -> dict:
+    bank = adaptive.ItemBank()
+    ids = np.arange(1, pool + 1, dtype=np.int64)
+    # The bank is filled directly, so only the selection itself is timed
+    bank._stacks[1] = adaptive.StackParameters(ids, rng.uniform(0.5, 2.0, pool), rng.normal(0.0, 1.0, pool))
+    timings = []
+    for _ in range(samples):
+        served = rng.choice(ids, seen, replace=False).tolist()
+        ability = float(rng.normal())
+        started = time.perf_counter()
+        adaptive.select_question(bank, None, [1], ability, served)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    pick = lambda q: round(timings[min(len(timings) - 1, int(len(timings) * q))] * 1000, 3)
+    return {"pool": pool, "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def bench_calibration(sessions: int, questions: int, per_session: int, rng: np.random.Generator) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'calibrate.db')}")
+        migrations.init_db(engine)
+        discrimination = rng.uniform(0.5, 2.0, questions)
+        difficulty = rng.normal(0.0, 1.0, questions)
+        with engine.begin() as conn:
+            stack_id = conn.execute(insert(models.TechStack).values(name="Bench")).inserted_primary_key[0]
+            conn.execute(insert(models.Question), [{"question_text": f"Q{i}?", "tech_stack_id": stack_id}
+                                                   for i in range(questions)])
+            mock_id = conn.execute(insert(models.Mock).values(name="bench")).inserted_primary_key[0]
+            candidate_id = conn.execute(insert(models.Candidate).values(name="C", email="c@example.com")
+                                        ).inserted_primary_key[0]
+            conn.execute(insert(models.MockSession), [
+                {"candidate_id": candidate_id, "mock_id": mock_id, "status": models.MockStatusEnum.completed}
+                for _ in range(sessions)])
+            labels = (models.CorrectnessEnum.incorrect, models.CorrectnessEnum.correct)
+            for start in range(0, sessions, 1000):
+                rows = []
+                for session_id in range(start + 1, min(sessions, start + 1000) + 1):
+                    ability = rng.normal()
+                    asked = rng.choice(questions, per_session, replace=False)
+                    p = 1.0 / (1.0 + np.exp(-discrimination[asked] * (ability - difficulty[asked])))
+                    correct = rng.random(per_session) < p
+                    rows += [{"mock_session_id": session_id, "question_id": int(q) + 1, "candidate_answer": "",
+                              "correctness": labels[int(c)]} for q, c in zip(asked, correct)]
+                conn.execute(insert(models.SessionAnswer), rows)
+
+        db = sessionmaker(bind=engine)()
+        try:
+            report = adaptive.calibrate(db)
+            fitted = {row.question_id: row.difficulty for row in db.query(models.QuestionCalibration)}
+        finally:
+            db.close()
+        engine.dispose()
+    ids = sorted(fitted)
+    correlation = float(np.corrcoef([fitted[i] for i in ids], difficulty[np.array(ids) - 1])[0, 1])
+    return {**report.model_dump(), "answers_per_second": round(report.answers / report.elapsed_seconds),
+            "difficulty_correlation": round(correlation, 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pools", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seen", type=int, default=20, help="Questions the session has already been asked")
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--sessions", type=int, default=20000, help="Simulated sessions to calibrate from")
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--per-session", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    results = {"selection": [], "calibration": None}
+    for pool in args.pools:
+        result = bench_selection(pool, args.seen, args.samples, rng)
+        results["selection"].append(result)
+        print(f"select from {pool:>8,}: p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms")
+    calibration = results["calibration"] = bench_calibration(args.sessions, args.questions, args.per_session, rng)
+    print(f"calibrated {calibration['questions']:,} questions from {calibration['answers']:,} answers in "
+          f"{calibration['elapsed_seconds']}s ({calibration['answers_per_second']:,} answers/s), "
+          f"difficulty correlation {calibration['difficulty_correlation']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
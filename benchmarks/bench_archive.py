@@ -0,0 +1,108 @@
+"""
+Hot database size and session lookup latency before and after archiving.
+
+    python -m benchmarks.datagen --database sqlite:///./bench.db --preset medium
+    python -m benchmarks.bench_archive --database ./bench.db
+
+Works on a copy of the SQLite file: moves every completed session to an archive file,
+compacts the copy, and reports file sizes, archiving throughput, the compression of the
+answers, and lookup latency of live (in-progress) sessions before and after, plus that of
+archived sessions served through the fallback.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+import archive, models, session_views, storage
+
+
+def _lookups(Session, session_ids, samples: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    timings = []
+    db = Session()
+    try:
+        for _ in range(samples):
+            started = time.perf_counter()
+            assert session_views.render(db, rng.choice(session_ids)) is not None
+            timings.append(time.perf_counter() - started)
+            # Every lookup starts from an empty identity map, as a request would
+            db.expunge_all()
+    finally:
+        db.close()
+    timings.sort()
+    pick = lambda q: round(timings[min(len(timings) - 1, int(len(timings) * q))] * 1000, 3)
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def _file_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", required=True, help="Path of a populated SQLite file (it is copied first)")
+    parser.add_argument("--samples", type=int, default=2000, help="Lookups per measurement")
+    parser.add_argument("--batch-size", type=int, default=archive.BATCH_SIZE)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        hot, cold = os.path.join(tmp, "hot.db"), os.path.join(tmp, "archive.db")
+        shutil.copy(args.database, hot)
+        config = storage.StorageConfig(url=f"sqlite:///{hot}", archive_url=f"sqlite:///{cold}", read_pool_size=0)
+        engine, _ = storage.create_engines(config)
+        archive_engine = storage.create_archive_engine(config)
+        archive.attach(engine, archive_engine)
+        Session = sessionmaker(bind=engine, autoflush=False)
+
+        with engine.connect() as conn:
+            status = models.MockSession.status
+            live = conn.execute(select(models.MockSession.id)
+                                .where(status != models.MockStatusEnum.completed)).scalars().all()
+            completed = conn.execute(select(models.MockSession.id)
+                                     .where(status == models.MockStatusEnum.completed)).scalars().all()
+        results = {"hot_bytes_before": _file_size(hot),
+                   "live_lookups_before": _lookups(Session, live, args.samples, 1)}
+
+        db = Session()
+        try:
+            report = archive.archive_sessions(db, archive_engine, datetime.timedelta(0), args.batch_size)
+        finally:
+            db.close()
+        compaction = archive.compact(engine)
+        results.update({
+            "archive": report.model_dump(),
+            "compaction_seconds": compaction.elapsed_seconds,
+            "hot_bytes_after": _file_size(hot),
+            "archive_bytes": _file_size(cold),
+            "live_lookups_after": _lookups(Session, live, args.samples, 1),
+            "archived_lookups": _lookups(Session, completed, args.samples, 2),
+        })
+        engine.dispose()
+        archive_engine.dispose()
+
+    ratio = report.raw_bytes / report.stored_bytes if report.stored_bytes else 0
+    print(f"Archived {report.sessions:,} sessions ({report.answers:,} answers) in {report.elapsed_seconds}s "
+          f"({report.sessions_per_second:,} sessions/s), answers compressed {ratio:.1f}x; "
+          f"VACUUM took {compaction.elapsed_seconds}s")
+    print(f"Hot database {results['hot_bytes_before']:,} -> {results['hot_bytes_after']:,} bytes, "
+          f"archive {results['archive_bytes']:,} bytes")
+    for name in ("live_lookups_before", "live_lookups_after", "archived_lookups"):
+        lookups = results[name]
+        print(f"{name:<20} p50 {lookups['p50_ms']} ms  p95 {lookups['p95_ms']} ms  p99 {lookups['p99_ms']} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Sync vs async database mode throughput.
+
+Each (mode, concurrency) combination runs in a fresh interpreter, because the
+mode is read from MOCKTEST_DB_MODE when `database` is imported:
+
+    python -m benchmarks.bench_async --clients 50 200 1000 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _seed(num_questions: int) -> int:
+    import crud, migrations, schemas
+    from database import SessionLocal, engine
+
+    migrations.init_db(engine)
+    db = SessionLocal()
+    try:
+        stack = crud.create_tech_stack(db, schemas.TechStackCreate(name="Python"))
+        for i in range(num_questions):
+            crud.create_question(db, schemas.QuestionCreate(
+                question_text=f"Benchmark question {i}", topic="Core", ideal_answer="...", tech_stack_id=stack.id
+            ))
+        mock = crud.create_mock_from_stacks(db, schemas.MockCreateFromStacks(
+            name="Benchmark mock", tech_stack_ids=[stack.id], num_questions=20
+        ))
+        return mock.id
+    finally:
+        db.close()
+
+
+async def _drive(app, mock_id: int, clients: int, total_requests: int):
+    import httpx
+
+    per_client = max(1, total_requests // clients)
+    latencies = []
+
+    async def client_loop(http):
+        for i in range(per_client):
+            url = f"/mocks/{mock_id}" if i % 2 == 0 else "/questions/?limit=20"
+            started = time.perf_counter()
+            response = await http.get(url)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(http) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+def worker(mode: str, clients: int, total_requests: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["MOCKTEST_DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["MOCKTEST_DB_MODE"] = mode
+        mock_id = _seed(num_questions=500)
+        from main import app
+
+        latencies, elapsed = asyncio.run(_drive(app, mock_id, clients, total_requests))
+        latencies.sort()
+        print(json.dumps({
+            "mode": mode,
+            "clients": clients,
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies) * 1000, 2),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        }))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--requests", type=int, default=2000, help="Total requests per run")
+    parser.add_argument("--modes", nargs="+", default=["sync", "async"])
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--worker", nargs=2, metavar=("MODE", "CLIENTS"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker(args.worker[0], int(args.worker[1]), args.requests)
+        return
+
+    results = []
+    for clients in args.clients:
+        for mode in args.modes:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_async", "--worker", mode, str(clients),
+                 "--requests", str(args.requests)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{mode:>5} {clients:>5} clients: {result['throughput_rps']:>8} req/s  "
+                  f"p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Throughput and peak Python memory of the session export, small versus full.
+
+    python -m benchmarks.datagen --database sqlite:///./bench.db --preset medium
+    python -m benchmarks.bench_export --database sqlite:///./bench.db
+
+Peak memory is measured with tracemalloc and should be about the same for one mock's
+sessions as for every session in the database.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine, func, select
+
+import export, models
+
+
+def _run(engine, fmt: str, **filters) -> dict:
+    encoder = export.encoder_for(fmt)
+    tracemalloc.start()
+    started = time.perf_counter()
+    written = 0
+    for chunk in export.stream(engine, encoder, **filters):
+        written += len(chunk)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"format": fmt, "bytes": written, "seconds": round(elapsed, 3), "peak_mib": round(peak / 2 ** 20, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", required=True, help="SQLAlchemy URL of a populated database")
+    parser.add_argument("--formats", nargs="+", default=["csv", "ndjson", "parquet"], choices=sorted(export.FORMATS))
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database)
+    with engine.connect() as conn:
+        mock_id = conn.execute(select(func.min(models.MockSession.mock_id))
+                               .where(models.MockSession.status == models.MockStatusEnum.completed)).scalar()
+    results = []
+    for fmt in args.formats:
+        for scope, filters in (("one mock", {"mock_id": mock_id}), ("everything", {})):
+            try:
+                result = {"scope": scope, **_run(engine, fmt, **filters)}
+            except ValueError as e:
+                print(f"{fmt:>8}: skipped ({e})")
+                break
+            results.append(result)
+            print(f"{fmt:>8} {scope:>10}: {result['bytes']:>12,} bytes in {result['seconds']:>7}s  "
+                  f"peak {result['peak_mib']:>6} MiB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Full-text question search (FTS5, bm25 ranked) against a LIKE '%term%' scan.
+
+Builds a synthetic question bank (Zipf-distributed vocabulary) in a temporary
+database, then times both lookups for terms of increasing frequency:
+
+    python -m benchmarks.bench_search --questions 1000000
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+TECH_TERMS = (
+    "python java javascript sql docker kubernetes aws react decorator generator closure "
+    "iterator coroutine thread process lock mutex index join transaction cursor cache "
+    "queue stream buffer socket request response session token schema migration "
+    "partition replica shard cluster container image volume network service pod"
+).split()
+FILLER = "what how why explain describe compare the a of in and with when for between".split()
+SYNTHETIC_TERMS = 20000
+
+
+def _vocabulary(rng: random.Random):
+    # Tech terms take the top ranks of a Zipf distribution over a realistic-size vocabulary
+    letters = "bcdfghklmnprstvz"
+    vowels = "aeiou"
+    words = list(TECH_TERMS)
+    seen = set(words)
+    while len(words) < len(TECH_TERMS) + SYNTHETIC_TERMS:
+        word = "".join(rng.choice(letters) + rng.choice(vowels) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    weights = list(itertools.accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(words))))
+    return words, weights
+
+
+def _question(rng: random.Random, vocabulary, i: int) -> dict:
+    words, weights = vocabulary
+    text = rng.choices(FILLER, k=3) + rng.choices(words, cum_weights=weights, k=6)
+    rng.shuffle(text)
+    return {
+        "question_text": " ".join(text) + f" q{i}?",
+        "topic": rng.choice(TECH_TERMS),
+        "ideal_answer": " ".join(rng.choices(words, cum_weights=weights, k=20)),
+    }
+
+
+def _seed(engine, num_questions: int, num_stacks: int, batch: int = 20000):
+    import models
+
+    rng = random.Random(42)
+    vocabulary = _vocabulary(rng)
+    stacks = models.TechStack.__table__
+    questions = models.Question.__table__
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(stacks.insert(), [{"name": f"Stack {i}"} for i in range(num_stacks)])
+        stack_ids = conn.execute(stacks.select().with_only_columns(stacks.c.id)).scalars().all()
+    for start in range(0, num_questions, batch):
+        rows = []
+        for i in range(start, min(start + batch, num_questions)):
+            row = _question(rng, vocabulary, i)
+            row["tech_stack_id"] = stack_ids[i % len(stack_ids)]
+            rows.append(row)
+        with engine.begin() as conn:
+            conn.execute(questions.insert(), rows)
+    return time.perf_counter() - started
+
+
+def _time(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[max(0, int(len(samples) * 0.95) - 1)] * 1000, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=1_000_000)
+    parser.add_argument("--stacks", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["MOCKTEST_DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        import migrations, models, search
+        from database import SessionLocal, engine
+
+        migrations.init_db(engine)
+        seed_seconds = _seed(engine, args.questions, args.stacks)
+        print(f"Seeded {args.questions} questions in {seed_seconds:.1f}s")
+
+        db = SessionLocal()
+        words, _ = _vocabulary(random.Random(42))
+        cases = {
+            "unique term": f"q{args.questions // 2}",
+            "rare term": words[15000],
+            "mid-frequency term": words[500],
+            "two terms": f"{words[30]} {words[60]}",
+            "prefix": words[200][:3] + "*",
+            "common term": TECH_TERMS[0],
+            "common term + stack filter": TECH_TERMS[0],
+        }
+        results = []
+        try:
+            for name, term in cases.items():
+                stack_id = 1 if "filter" in name else None
+
+                def fts():
+                    search.search_questions(db, term, limit=args.limit, tech_stack_id=stack_id)
+
+                def like():
+                    query = db.query(models.Question)
+                    for word in term.rstrip("*").split():
+                        query = query.filter(models.Question.question_text.like(f"%{word}%"))
+                    if stack_id is not None:
+                        query = query.filter(models.Question.tech_stack_id == stack_id)
+                    query.limit(args.limit).all()
+
+                result = {"case": name, "term": term, "fts": _time(fts, args.repeat), "like": _time(like, args.repeat)}
+                results.append(result)
+                print(f"{name:>28}: fts p50 {result['fts']['p50_ms']:>9} ms  p95 {result['fts']['p95_ms']:>9} ms  |  "
+                      f"like p50 {result['like']['p50_ms']:>9} ms  p95 {result['like']['p95_ms']:>9} ms")
+        finally:
+            db.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"questions": args.questions, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Payload size, latency and SQL statements of each session view for a 50-question mock.
+
+    python -m benchmarks.bench_session_views --questions 50 --repeat 200
+
+"full" is what every session endpoint returned before views existed; the others are
+?view=summary|candidate|reviewer and a ?fields= projection.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.datagen import TECH_TERMS
+
+
+def _time(client, url: str, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url)
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+    samples.sort()
+    return response, {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[max(0, int(len(samples) * 0.95) - 1)] * 1000, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["MOCKTEST_DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ.setdefault("MOCKTEST_JOB_WORKERS", "0")
+        from fastapi.testclient import TestClient
+
+        from benchmarks.run import QueryCounter
+        import database
+        from main import app
+
+        engines = list({database.engine, database.read_engine})
+        engines += [engine.sync_engine for engine in {database.async_engine, database.async_read_engine} - {None}]
+        queries = QueryCounter(engines)
+        with TestClient(app) as client:
+            stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+            # Distinct wording, or near-duplicate detection would keep most of them out of the mock
+            rng = random.Random(42)
+            question_ids = [
+                client.post("/questions/", json={
+                    "question_text": "Explain how " + " and ".join(rng.sample(TECH_TERMS, 4)) + " interact?",
+                    "topic": "Concurrency", "tech_stack_id": stack_id,
+                    "ideal_answer": " ".join(rng.choices(TECH_TERMS, k=60)),
+                }, params={"on_duplicate": "allow"}).json()["id"]
+                for _ in range(args.questions)
+            ]
+            candidate_id = client.post("/candidates/", json={"name": "Bench", "email": "bench@example.com"}).json()["id"]
+            mock_id = client.post("/mocks/generate", json={"name": "bench", "tech_stack_ids": [stack_id],
+                                                           "num_questions": args.questions}).json()["id"]
+            session_id = client.post("/sessions/?view=summary",
+                                     json={"candidate_id": candidate_id, "mock_id": mock_id}).json()["id"]
+            client.post(f"/sessions/{session_id}/submit?view=summary", json=[
+                {"question_id": question_id, "candidate_answer": "It yields control back to the loop. " * 8}
+                for question_id in question_ids
+            ])
+
+            cases = {
+                "full": "?view=full",
+                "reviewer": "?view=reviewer",
+                "candidate": "?view=candidate",
+                "summary": "?view=summary",
+                "fields=status": "?fields=status",
+            }
+            results = []
+            for name, query in cases.items():
+                url = f"/sessions/{session_id}{query}"
+                before = queries.count
+                client.get(url)
+                statements = queries.count - before
+                response, timing = _time(client, url, args.repeat)
+                result = {"view": name, "bytes": len(response.content), "statements": statements, **timing}
+                results.append(result)
+                print(f"{name:>14}: {result['bytes']:>8} bytes  {statements:>2} statements  "
+                      f"p50 {timing['p50_ms']:>7} ms  p95 {timing['p95_ms']:>7} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"questions": args.questions, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
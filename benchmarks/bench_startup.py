@@ -0,0 +1,104 @@
+"""
+Worker startup time and first-request latency, with and without warm-up.
+
+    python -m benchmarks.datagen --database sqlite:///./bench.db --preset medium
+    python -m benchmarks.bench_startup --database ./bench.db
+
+Each scenario starts a fresh interpreter, as a newly spawned worker would, on its own copy
+of the SQLite file, and reports how long importing the app takes, how long startup (schema
+check) takes, when the worker reports ready, and the latency of the first request to each
+endpoint that depends on in-process caches or indexes. "cold" serves them without warming
+up, "warm" once GET /ready answers 200; "no migrate" is the multi-worker setup, where the
+schema was brought up to date once beforehand.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = [
+    ("cold", {"MOCKTEST_WARMUP": "0"}),
+    ("warm", {}),
+    ("warm, no migrate", {"MOCKTEST_AUTO_MIGRATE": "0"}),
+]
+
+
+def _timed(client, method: str, url: str, **kwargs) -> float:
+    started = time.perf_counter()
+    client.request(method, url, **kwargs).raise_for_status()
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def worker(mock_id: int, stack_ids) -> dict:
+    started = time.perf_counter()
+    from fastapi.testclient import TestClient
+
+    from main import app
+    import warmup
+
+    result = {"import_ms": round((time.perf_counter() - started) * 1000, 1)}
+    started = time.perf_counter()
+    with TestClient(app) as client:
+        result["startup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        while client.get("/ready").status_code != 200:
+            time.sleep(0.005)
+        result["ready_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        result["warmup_steps_ms"] = {name: round(seconds * 1000, 1) for name, seconds in warmup.state.steps.items()}
+
+        generate = {"name": "bench", "tech_stack_ids": stack_ids, "num_questions": 10}
+        result["first_request_ms"] = {
+            "GET /tech-stacks/": _timed(client, "GET", "/tech-stacks/"),
+            "GET /mocks/{id}": _timed(client, "GET", f"/mocks/{mock_id}"),
+            "POST /mocks/generate": _timed(client, "POST", "/mocks/generate", json=generate),
+        }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", required=True, help="Path of a populated SQLite file (it is copied first)")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh workers per scenario; the median is reported")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--worker", nargs="+", type=int, metavar="ID", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(args.worker[0], args.worker[1:])))
+        return
+
+    # The newest mock (the kind candidates are taking right now) and two stacks to generate from
+    with sqlite3.connect(args.database) as conn:
+        ids = [conn.execute("SELECT max(id) FROM mocks").fetchone()[0]]
+        ids += [row[0] for row in conn.execute("SELECT id FROM tech_stacks ORDER BY id LIMIT 2")]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        for name, settings in SCENARIOS:
+            runs = []
+            for _ in range(args.repeat):
+                shutil.copy(args.database, path)
+                env = {**os.environ, "MOCKTEST_DATABASE_URL": f"sqlite:///{path}", "MOCKTEST_JOB_WORKERS": "0",
+                       "MOCKTEST_ARCHIVE_DATABASE_URL": "", **settings}
+                output = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--database", path,
+                                         "--worker", *map(str, ids)], env=env, check=True, capture_output=True, text=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            # The run with the median time to ready stands for the scenario
+            result = {"scenario": name, **sorted(runs, key=lambda run: run["ready_ms"])[len(runs) // 2]}
+            results.append(result)
+            requests = "  ".join(f"{route} {ms} ms" for route, ms in result["first_request_ms"].items())
+            print(f"{name:<17} import {result['import_ms']:>7} ms  startup {result['startup_ms']:>7} ms  "
+                  f"ready {result['ready_ms']:>8} ms  | first {requests}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Reader latency and writer throughput under concurrent load, per storage profile.
+
+    python -m benchmarks.bench_storage --processes 4 --readers 4 --writers 1 --pool-size 2 --seconds 5
+
+Each process stands for one app worker: its reader threads fetch a session's answers with
+their questions (what GET /sessions/{id} does) while its writer threads submit sessions
+(rewrite their answers and complete them, in one transaction), all through the worker's
+engines and their connection pools. Each profile starts from a copy of the same SQLite file and adds one
+setting to the previous profile, from rollback-journal defaults to the shipped default.
+Pass --database postgresql://... to run the default profile against Postgres instead.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import replace
+
+from sqlalchemy import create_engine, insert, select, update
+
+import models, storage
+from database import Base
+
+# Each profile changes one thing relative to the one before it
+PROFILES = [
+    ("rollback journal", dict(journal_mode="delete", synchronous="full", cache_size_kib=2000, mmap_size=0,
+                              read_pool_size=0)),
+    ("+ WAL", dict(journal_mode="wal", synchronous="full", cache_size_kib=2000, mmap_size=0, read_pool_size=0)),
+    ("+ synchronous=NORMAL", dict(journal_mode="wal", synchronous="normal", cache_size_kib=2000, mmap_size=0,
+                                  read_pool_size=0)),
+    ("+ cache_size/mmap_size", dict(read_pool_size=0)),
+    ("+ separate read pool (default)", {}),
+]
+
+
+def _populate(url: str, sessions: int, answers: int):
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        stack_id = conn.execute(insert(models.TechStack).values(name="Python")).inserted_primary_key[0]
+        question_ids = [row.id for row in conn.execute(
+            insert(models.Question).returning(models.Question.id),
+            [{"question_text": f"Question {i}?", "topic": "Core", "tech_stack_id": stack_id,
+              "ideal_answer": "an ideal answer " * 10} for i in range(answers)],
+        )]
+        mock_id = conn.execute(insert(models.Mock).values(name="bench")).inserted_primary_key[0]
+        conn.execute(insert(models.mock_questions),
+                     [{"mock_id": mock_id, "question_id": question_id} for question_id in question_ids])
+        candidate_ids = [row.id for row in conn.execute(
+            insert(models.Candidate).returning(models.Candidate.id),
+            [{"name": f"C{i}", "email": f"c{i}@example.com"} for i in range(sessions)],
+        )]
+        session_ids = [row.id for row in conn.execute(
+            insert(models.MockSession).returning(models.MockSession.id),
+            [{"candidate_id": candidate_id, "mock_id": mock_id, "status": models.MockStatusEnum.in_progress}
+             for candidate_id in candidate_ids],
+        )]
+        conn.execute(insert(models.SessionAnswer), [
+            {"mock_session_id": session_id, "question_id": question_id, "candidate_answer": "a draft answer " * 5}
+            for session_id in session_ids for question_id in question_ids
+        ])
+    engine.dispose()
+    return session_ids
+
+
+def _read(engine, session_id: int):
+    SessionAnswer, Question = models.SessionAnswer, models.Question
+    with engine.connect() as conn:
+        conn.execute(select(Question.question_text, Question.ideal_answer, SessionAnswer.candidate_answer,
+                            SessionAnswer.correctness)
+                     .join(Question, Question.id == SessionAnswer.question_id)
+                     .where(SessionAnswer.mock_session_id == session_id)).all()
+
+
+def _write(engine, session_id: int):
+    with engine.begin() as conn:
+        conn.execute(update(models.SessionAnswer).where(models.SessionAnswer.mock_session_id == session_id)
+                     .values(candidate_answer=f"final answer {random.random()} " * 5))
+        conn.execute(update(models.MockSession).where(models.MockSession.id == session_id)
+                     .values(status=models.MockStatusEnum.completed))
+
+
+def _loop(action, bind, session_ids, deadline: float, seed: int, samples: list, errors: list):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            action(bind, rng.choice(session_ids))
+        except Exception as e:  # "database is locked" once busy_timeout runs out, or a pool timeout
+            errors.append(type(e).__name__)
+            continue
+        samples.append(time.perf_counter() - started)
+
+
+def _worker(config: storage.StorageConfig, session_ids, readers: int, writers: int, seconds: float, seed: int,
+            results):
+    """One app worker process: request threads sharing its engines and their pools."""
+    engine, read_engine = storage.create_engines(config)
+    deadline = time.perf_counter() + seconds
+    collected = {"read": ([], []), "write": ([], [])}
+    threads = [threading.Thread(target=_loop, args=(_read, read_engine, session_ids, deadline, seed * 100 + i,
+                                                    *collected["read"])) for i in range(readers)]
+    threads += [threading.Thread(target=_loop, args=(_write, engine, session_ids, deadline, -seed * 100 - i,
+                                                     *collected["write"])) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    read_engine.dispose()
+    results.put({role: (samples, len(errors)) for role, (samples, errors) in collected.items()})
+
+
+def _summary(samples: list, errors: int, seconds: float) -> dict:
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 2) if ordered else None
+    return {"ops_per_second": round(len(samples) / seconds, 1), "p50_ms": pick(0.5), "p95_ms": pick(0.95),
+            "p99_ms": pick(0.99), "errors": errors}
+
+
+def run_profile(config: storage.StorageConfig, session_ids, processes: int, readers: int, writers: int,
+                seconds: float) -> dict:
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_worker,
+                                       args=(config, session_ids, readers, writers, seconds, seed, results))
+               for seed in range(1, processes + 1)]
+    for worker in workers:
+        worker.start()
+    collected = {"read": ([], 0), "write": ([], 0)}
+    for _ in workers:
+        for role, (samples, errors) in results.get().items():
+            collected[role] = (collected[role][0] + samples, collected[role][1] + errors)
+    for worker in workers:
+        worker.join()
+    return {role: _summary(samples, errors, seconds) for role, (samples, errors) in collected.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4, help="App worker processes")
+    parser.add_argument("--readers", type=int, default=4, help="Reading threads per process")
+    parser.add_argument("--writers", type=int, default=1, help="Writing threads per process")
+    parser.add_argument("--pool-size", type=int, default=2, help="Connections per pool (no overflow)")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--answers", type=int, default=20, help="Questions (and answers) per session")
+    parser.add_argument("--database", help="Run only the default profile against this (empty) database")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    pools = dict(pool_size=args.pool_size, max_overflow=0, read_pool_size=args.pool_size, read_max_overflow=0)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database:
+            profiles = [("default", storage.StorageConfig(url=args.database, **pools))]
+            session_ids = _populate(args.database, args.sessions, args.answers)
+        else:
+            template = os.path.join(tmp, "template.db")
+            session_ids = _populate(f"sqlite:///{template}", args.sessions, args.answers)
+            profiles = []
+            for i, (name, settings) in enumerate(PROFILES):
+                path = os.path.join(tmp, f"profile{i}.db")
+                shutil.copy(template, path)
+                profiles.append((name, replace(storage.StorageConfig(url=f"sqlite:///{path}", **pools), **settings)))
+
+        print(f"{args.processes} processes x ({args.readers} readers + {args.writers} writers), "
+              f"pools of {args.pool_size}, {args.seconds}s per profile")
+        for name, config in profiles:
+            result = run_profile(config, session_ids, args.processes, args.readers, args.writers, args.seconds)
+            results.append({"profile": name, **result})
+            read, write = result["read"], result["write"]
+            print(f"{name:<32} reads {read['ops_per_second']:>8}/s p50 {read['p50_ms']} p99 {read['p99_ms']} ms"
+                  f"  | writes {write['ops_per_second']:>6}/s p50 {write['p50_ms']} p99 {write['p99_ms']} ms"
+                  f"  | errors {read['errors'] + write['errors']}")
+            if args.database:
+                with create_engine(args.database).begin() as conn:
+                    Base.metadata.drop_all(conn)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
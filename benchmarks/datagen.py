@@ -0,0 +1,165 @@
+"""
+Synthetic data at production scale, loaded with bulk Core inserts.
+
+    python -m benchmarks.datagen --database sqlite:///./bench.db --stacks 20 \\
+        --questions-per-stack 50000 --candidates 100000 --mocks 2000 --sessions 200000
+
+Load into an empty database. Every table the API reads is filled consistently: mocks
+reference questions of their stacks, sessions pair candidates with mocks, and completed
+sessions carry one answer per mock question. The same --seed always produces the same data.
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.engine import Engine
+
+TECH_TERMS = (
+    "python java javascript sql docker kubernetes aws react decorator generator closure "
+    "iterator coroutine thread process lock mutex index join transaction cursor cache "
+    "queue stream buffer socket request response session token schema migration "
+    "partition replica shard cluster container image volume network service pod"
+).split()
+OPENERS = ["What is", "Explain", "How does", "Why would you use", "Compare", "Describe", "When should you avoid"]
+TOPICS = ["Core", "Concurrency", "Data", "Testing", "Performance", "Security", "Design", "Tooling"]
+CHUNK = 10000
+
+
+@dataclass
+class Scale:
+    stacks: int = 5
+    questions_per_stack: int = 2000
+    candidates: int = 5000
+    mocks: int = 200
+    questions_per_mock: int = 20
+    sessions: int = 10000
+    completed_ratio: float = 0.7
+
+
+PRESETS: Dict[str, Scale] = {
+    "small": Scale(),
+    "medium": Scale(stacks=10, questions_per_stack=20000, candidates=50000, mocks=1000, sessions=100000),
+    "large": Scale(stacks=20, questions_per_stack=50000, candidates=200000, mocks=5000, sessions=500000),
+}
+
+
+def _words(rng: random.Random, k: int) -> str:
+    return " ".join(rng.choices(TECH_TERMS, k=k))
+
+
+def _insert(engine: Engine, table, rows) -> int:
+    """Inserts an iterable of dicts in executemany chunks, one transaction per chunk."""
+    total = 0
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, CHUNK))
+        if not chunk:
+            return total
+        with engine.begin() as conn:
+            conn.execute(insert(table), chunk)
+        total += len(chunk)
+
+
+def generate(engine: Engine, scale: Scale, seed: int = 42) -> Dict[str, float]:
+    """Creates the schema and loads `scale` worth of rows. Returns row counts and elapsed seconds."""
+    import migrations, models, search
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    migrations.init_db(engine)
+    counts: Dict[str, float] = {}
+
+    # The FTS index is rebuilt in one pass after the load, much faster than trigger-per-row
+    with engine.begin() as conn:
+        search.drop_triggers(conn)
+
+    counts["tech_stacks"] = _insert(engine, models.TechStack.__table__,
+                                    ({"name": f"Stack {i}"} for i in range(1, scale.stacks + 1)))
+    with engine.connect() as conn:
+        stack_ids = conn.exec_driver_sql("SELECT id FROM tech_stacks ORDER BY id").scalars().all()
+
+    def questions():
+        for stack_id in stack_ids:
+            for i in range(scale.questions_per_stack):
+                subject = _words(rng, 2)
+                yield {
+                    "question_text": f"{rng.choice(OPENERS)} {subject} (#{stack_id}-{i})?",
+                    "topic": rng.choice(TOPICS),
+                    "ideal_answer": f"{subject} " + _words(rng, 18),
+                    "tech_stack_id": stack_id,
+                }
+
+    counts["questions"] = _insert(engine, models.Question.__table__, questions())
+    with engine.begin() as conn:
+        search.install(conn, rebuild=True)
+        by_stack: Dict[int, List[int]] = {}
+        for question_id, stack_id in conn.exec_driver_sql("SELECT id, tech_stack_id FROM questions"):
+            by_stack.setdefault(stack_id, []).append(question_id)
+
+    counts["candidates"] = _insert(engine, models.Candidate.__table__, (
+        {"name": f"Candidate {i}", "email": f"candidate{i}@example.com", "passing_year": 2015 + i % 10}
+        for i in range(1, scale.candidates + 1)
+    ))
+    counts["mocks"] = _insert(engine, models.Mock.__table__,
+                              ({"name": f"Mock {i}"} for i in range(1, scale.mocks + 1)))
+    with engine.connect() as conn:
+        mock_ids = conn.exec_driver_sql("SELECT id FROM mocks ORDER BY id").scalars().all()
+        candidate_ids = conn.exec_driver_sql("SELECT id FROM candidates ORDER BY id").scalars().all()
+
+    mock_questions: Dict[int, List[int]] = {}
+    for mock_id in mock_ids:
+        pool = by_stack[rng.choice(stack_ids)]
+        mock_questions[mock_id] = rng.sample(pool, min(scale.questions_per_mock, len(pool)))
+    counts["mock_questions"] = _insert(engine, models.mock_questions, (
+        {"mock_id": mock_id, "question_id": question_id}
+        for mock_id, question_ids in mock_questions.items() for question_id in question_ids
+    ))
+
+    completed = int(scale.sessions * scale.completed_ratio)
+    session_mocks = [rng.choice(mock_ids) for _ in range(scale.sessions)]
+    counts["mock_sessions"] = _insert(engine, models.MockSession.__table__, (
+        {
+            "candidate_id": rng.choice(candidate_ids),
+            "mock_id": session_mocks[i],
+            "status": models.MockStatusEnum.completed if i < completed else models.MockStatusEnum.in_progress,
+        }
+        for i in range(scale.sessions)
+    ))
+    with engine.connect() as conn:
+        session_ids = conn.exec_driver_sql("SELECT id FROM mock_sessions ORDER BY id").scalars().all()
+
+    counts["session_answers"] = _insert(engine, models.SessionAnswer.__table__, (
+        {"mock_session_id": session_id, "question_id": question_id, "candidate_answer": _words(rng, 12)}
+        for session_id, mock_id in zip(session_ids[:completed], session_mocks)
+        for question_id in mock_questions[mock_id]
+    ))
+    counts["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", required=True, help="SQLAlchemy URL of the database to fill")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    for field, default in asdict(Scale()).items():
+        parser.add_argument("--" + field.replace("_", "-"), type=type(default), default=None)
+    args = parser.parse_args(argv)
+
+    scale = Scale(**{
+        field: getattr(args, field) if getattr(args, field) is not None else value
+        for field, value in asdict(PRESETS[args.preset]).items()
+    })
+    engine = create_engine(args.database)
+    counts = generate(engine, scale, args.seed)
+    engine.dispose()
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":
+    main()
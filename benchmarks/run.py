@@ -0,0 +1,294 @@
+"""
+Per-endpoint micro benchmarks and an exam-flow macro benchmark, driven in-process
+against the FastAPI app over httpx's ASGI transport (no network, no server).
+
+    python -m benchmarks.run --preset small --json results.json
+    python -m benchmarks.run --database sqlite:///./bench.db --baseline results.json
+
+Without --database a fresh dataset is generated with benchmarks.datagen. Every result
+reports p50/p95/p99 latency, throughput and SQL statements per request; --baseline
+prints the change against an earlier --json output.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_samples))))
+    return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+
+class QueryCounter:
+    """Counts statements sent to the database through SQLAlchemy engine events."""
+
+    def __init__(self, engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        self._lock = threading.Lock()
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.count += 1
+
+
+class Bench:
+    def __init__(self, client, queries: QueryCounter, rng: random.Random):
+        self.client = client
+        self.queries = queries
+        self.rng = rng
+        self.stack_ids: List[int] = []
+        self.candidate_ids: List[int] = []
+        self.mock_ids: List[int] = []
+        self.mock_questions: Dict[int, List[int]] = {}
+        self.open_sessions: List[dict] = []
+
+    async def load_ids(self, engine):
+        with engine.connect() as conn:
+            self.stack_ids = conn.exec_driver_sql("SELECT id FROM tech_stacks").scalars().all()
+            self.candidate_ids = conn.exec_driver_sql("SELECT id FROM candidates LIMIT 10000").scalars().all()
+            rows = conn.exec_driver_sql(
+                "SELECT mock_id, question_id FROM mock_questions"
+                " WHERE mock_id IN (SELECT DISTINCT mock_id FROM mock_questions ORDER BY mock_id LIMIT 1000)")
+            for mock_id, question_id in rows:
+                self.mock_questions.setdefault(mock_id, []).append(question_id)
+        self.mock_ids = sorted(self.mock_questions)
+        if not (self.stack_ids and self.candidate_ids and self.mock_ids):
+            raise SystemExit("The database needs stacks, candidates and mocks; generate it with benchmarks.datagen")
+
+    async def new_session(self) -> dict:
+        mock_id = self.rng.choice(self.mock_ids)
+        response = await self.client.post("/sessions/", json={
+            "candidate_id": self.rng.choice(self.candidate_ids), "mock_id": mock_id,
+        })
+        response.raise_for_status()
+        return {"id": response.json()["id"], "mock_id": mock_id}
+
+    def answers(self, session: dict, count: Optional[int] = None) -> List[dict]:
+        question_ids = self.mock_questions[session["mock_id"]]
+        if count is not None:
+            question_ids = self.rng.sample(question_ids, min(count, len(question_ids)))
+        return [{"question_id": question_id, "candidate_answer": f"answer {self.rng.random():.6f} about the topic"}
+                for question_id in question_ids]
+
+
+# --- micro scenarios: (name, setup, request) ---
+
+async def _prepare_sessions(bench: Bench, iterations: int):
+    bench.open_sessions = [await bench.new_session() for _ in range(iterations)]
+
+
+async def _prepare_submitted(bench: Bench, iterations: int):
+    await _prepare_sessions(bench, iterations)
+    for session in bench.open_sessions:
+        response = await bench.client.post(f"/sessions/{session['id']}/submit", json=bench.answers(session))
+        response.raise_for_status()
+
+
+MICRO: List[tuple] = [
+    ("GET /", None, lambda b, i: b.client.get("/")),
+    ("GET /tech-stacks/", None, lambda b, i: b.client.get("/tech-stacks/")),
+    ("GET /questions/?limit=100", None,
+     lambda b, i: b.client.get("/questions/", params={"limit": 100, "tech_stack_id": b.rng.choice(b.stack_ids)})),
+    ("GET /questions/search", None,
+     lambda b, i: b.client.get("/questions/search", params={"q": b.rng.choice(["decorator", "kubernetes pod",
+                                                                                  "cache*", "transaction lock"])})),
+    ("GET /candidates/?limit=100", None, lambda b, i: b.client.get("/candidates/", params={"limit": 100})),
+    ("GET /mocks/{id}", None, lambda b, i: b.client.get(f"/mocks/{b.rng.choice(b.mock_ids)}")),
+    ("POST /mocks/generate", None,
+     lambda b, i: b.client.post("/mocks/generate", json={"name": f"bench {i}", "num_questions": 20,
+                                                         "tech_stack_ids": [b.rng.choice(b.stack_ids)]})),
+    ("POST /mocks/generate/batch (100 mocks)", None,
+     lambda b, i: b.client.post("/mocks/generate/batch", json={
+         "name": f"cohort {i}", "num_questions": 20, "tech_stack_ids": [b.rng.choice(b.stack_ids)],
+         "candidate_ids": b.rng.sample(b.candidate_ids, 100), "create_sessions": True})),
+    ("POST /sessions/", None,
+     lambda b, i: b.client.post("/sessions/", json={"candidate_id": b.rng.choice(b.candidate_ids),
+                                                    "mock_id": b.rng.choice(b.mock_ids)})),
+    ("PATCH /sessions/{id}/answers", _prepare_sessions,
+     lambda b, i: b.client.patch(f"/sessions/{b.open_sessions[i]['id']}/answers",
+                                 json=b.answers(b.open_sessions[i], 3))),
+    ("POST /sessions/{id}/submit", _prepare_sessions,
+     lambda b, i: b.client.post(f"/sessions/{b.open_sessions[i]['id']}/submit", json=b.answers(b.open_sessions[i]))),
+    ("POST /sessions/{id}/grade", _prepare_submitted,
+     lambda b, i: b.client.post(f"/sessions/{b.open_sessions[i]['id']}/grade")),
+    ("GET /jobs/stats", None, lambda b, i: b.client.get("/jobs/stats")),
+]
+
+
+def _summarize(name: str, kind: str, latencies: List[float], elapsed: float, queries: int, errors: int) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "name": name,
+        "kind": kind,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "queries_per_request": round(queries / len(latencies), 2) if latencies else 0.0,
+    }
+
+
+async def run_micro(bench: Bench, iterations: int, warmup: int, only: Optional[List[str]] = None) -> List[dict]:
+    results = []
+    for name, setup, request in MICRO:
+        if only and not any(pattern in name for pattern in only):
+            continue
+        if setup is not None:
+            await setup(bench, iterations + warmup)
+        for i in range(warmup):
+            await request(bench, iterations + i)
+        latencies, errors = [], 0
+        queries_before = bench.queries.count
+        started = time.perf_counter()
+        for i in range(iterations):
+            request_started = time.perf_counter()
+            response = await request(bench, i)
+            latencies.append(time.perf_counter() - request_started)
+            errors += response.status_code >= 400
+        elapsed = time.perf_counter() - started
+        results.append(_summarize(name, "micro", latencies, elapsed, bench.queries.count - queries_before, errors))
+    return results
+
+
+async def run_exam_flow(bench: Bench, users: int, flows_per_user: int) -> dict:
+    """Concurrent candidates: open a session, load the mock, autosave three times, submit."""
+    latencies: List[float] = []
+    errors = 0
+
+    async def timed(call):
+        nonlocal errors
+        started = time.perf_counter()
+        response = await call
+        latencies.append(time.perf_counter() - started)
+        errors += response.status_code >= 400
+        return response
+
+    async def candidate():
+        for _ in range(flows_per_user):
+            mock_id = bench.rng.choice(bench.mock_ids)
+            response = await timed(bench.client.post("/sessions/", json={
+                "candidate_id": bench.rng.choice(bench.candidate_ids), "mock_id": mock_id}))
+            if response.status_code >= 400:
+                continue
+            session = {"id": response.json()["id"], "mock_id": mock_id}
+            await timed(bench.client.get(f"/mocks/{mock_id}"))
+            for _ in range(3):
+                await timed(bench.client.patch(f"/sessions/{session['id']}/answers", json=bench.answers(session, 5)))
+            await timed(bench.client.post(f"/sessions/{session['id']}/submit", json=bench.answers(session)))
+
+    queries_before = bench.queries.count
+    started = time.perf_counter()
+    await asyncio.gather(*(candidate() for _ in range(users)))
+    elapsed = time.perf_counter() - started
+    result = _summarize(f"exam flow x{users} users", "macro", latencies, elapsed,
+                        bench.queries.count - queries_before, errors)
+    result["flows_per_second"] = round(users * flows_per_user / elapsed, 1)
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[dict], baseline: List[dict]):
+    previous = {result["name"]: result for result in baseline}
+    print("\nChange against baseline (negative latency is better):")
+    for result in results:
+        old = previous.get(result["name"])
+        if not old:
+            continue
+        changes = []
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "queries_per_request"):
+            if old.get(metric):
+                changes.append(f"{metric} {100 * (result[metric] - old[metric]) / old[metric]:+.1f}%")
+        print(f"  {result['name']:<36} " + "  ".join(changes))
+
+
+async def _run(args, dataset) -> dict:
+    import httpx
+    import database
+    from main import app
+
+    engines = list({database.engine, database.read_engine})
+    for async_engine in {database.async_engine, database.async_read_engine} - {None}:
+        engines.append(async_engine.sync_engine)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        bench = Bench(client, QueryCounter(engines), random.Random(args.seed))
+        await bench.load_ids(database.engine)
+        results = await run_micro(bench, args.iterations, args.warmup, args.only)
+        if not args.only:
+            results.append(await run_exam_flow(bench, args.users, args.flows))
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "db_mode": os.getenv("MOCKTEST_DB_MODE", "sync"),
+            "dataset": dataset,
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    from benchmarks import datagen
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", help="Benchmark an existing database instead of generating one")
+    parser.add_argument("--preset", choices=sorted(datagen.PRESETS), default="small")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--users", type=int, default=50, help="Concurrent candidates in the exam-flow run")
+    parser.add_argument("--flows", type=int, default=4, help="Exam flows per candidate")
+    parser.add_argument("--only", nargs="+", help="Run only micro benchmarks whose name contains one of these")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Earlier --json output to compare against")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        # The app reads its database URL at import time
+        os.environ["MOCKTEST_DATABASE_URL"] = url
+        from database import engine
+
+        dataset = url if args.database else datagen.generate(engine, datagen.PRESETS[args.preset])
+        report = asyncio.run(_run(args, dataset))
+
+    for result in report["results"]:
+        print(f"{result['name']:<36} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+              f"p99 {result['p99_ms']:>9.2f} ms  {result['throughput_rps']:>8.1f} req/s  "
+              f"{result['queries_per_request']:>6.2f} q/req" + (f"  {result['errors']} errors" if result["errors"] else ""))
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report["results"], json.load(f)["results"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
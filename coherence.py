@@ -0,0 +1,192 @@
+import os
+import socket
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+import adaptive, dedup, grading, mock_cache, models, sampling
+
+# Every worker process keeps its own caches (mock payloads, the question indexes behind
+# sampling, dedup and grading, the adaptive parameter arrays) and updates them on its own
+# writes. Other workers learn about those writes from the entity_versions table: each write
+# path a cache depends on logs (entity, id) in its own transaction, and every worker reads
+# the rows it has not seen yet before serving a request, at most once per
+# MOCKTEST_COHERENCE_INTERVAL seconds. A committed write therefore reaches every worker's
+# caches within about one interval, through the same incremental updates the writer made,
+# so a new question costs the other workers one row each instead of an index rebuild.
+# Between checks a request costs nothing; a check is one range query on the primary key.
+#
+# Tech stack listings are not cached in process (they are one GROUP BY query), so stack
+# writes are not logged.
+
+INTERVAL = float(os.getenv("MOCKTEST_COHERENCE_INTERVAL", "1.0"))
+# Logged changes are kept this long; a worker that has not checked for half of it starts over
+RETENTION_SECONDS = float(os.getenv("MOCKTEST_COHERENCE_RETENTION_SECONDS", str(24 * 3600)))
+# Versions are handed out before commit, so on Postgres a version can become visible after
+# a later one. A missing version is waited for this long before it is taken as rolled back.
+GAP_SECONDS = 60.0
+APPLY_CHUNK = 5000
+
+QUESTION = "question"
+MOCK = "mock"
+CALIBRATION = "calibration"
+
+
+def origin() -> str:
+    # Computed per call: process pool children and forked workers are other processes
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def record(db: Session, entity: str, entity_ids: Iterable[Optional[int]] = (None,)):
+    """Logs changes in the caller's transaction, so other workers see them exactly when they commit."""
+    now, source = _utcnow(), origin()
+    rows = [{"entity": entity, "entity_id": entity_id, "origin": source, "changed_at": now}
+            for entity_id in entity_ids]
+    if rows:
+        db.execute(insert(models.EntityVersion), rows)
+
+
+class ChangeFeed:
+    """What this process has replayed from one database's change log."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Every version up to `low` is applied; `_applied` holds those above it
+        self.low: Optional[int] = None
+        self._applied: Set[int] = set()
+        # Versions above `low` not visible yet, with when they were first missed
+        self._missing: Dict[int, float] = {}
+        self.checked = self.pruned = 0.0
+        self.checks = self.applied = self.resets = 0
+
+    def due(self) -> bool:
+        return time.monotonic() - self.checked >= INTERVAL
+
+    def refresh(self, db: Session, force: bool = False) -> int:
+        """Replays the changes other processes committed since the last check; returns how many."""
+        if not (force or self.due()):
+            return 0
+        # One thread per worker checks; the others keep serving from the caches meanwhile
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            now = time.monotonic()
+            idle = now - self.checked > RETENTION_SECONDS / 2
+            self.checked = now
+            self.checks += 1
+            if self.low is None or idle:
+                # Start from the current version. After a long idle spell the changes in between
+                # may already be pruned, so everything cached is dropped and rebuilt on use.
+                if self.low is not None:
+                    reset(db)
+                    self.resets += 1
+                self.low = db.execute(select(func.max(models.EntityVersion.version))).scalar() or 0
+                self._applied, self._missing = set(), {}
+                applied = 0
+            else:
+                applied = self._replay(db, now)
+            if now - self.pruned > RETENTION_SECONDS / 24:
+                self.pruned = now
+                prune(db)
+            db.commit()
+            return applied
+        finally:
+            self._lock.release()
+
+    def _replay(self, db: Session, now: float) -> int:
+        Version = models.EntityVersion
+        rows = db.execute(
+            select(Version.version, Version.entity, Version.entity_id, Version.origin)
+            .where(Version.version > self.low).order_by(Version.version)
+        ).all()
+        fresh = [row for row in rows if row.version not in self._applied]
+        source = origin()
+        foreign = [row for row in fresh if row.origin != source]
+        apply(db, foreign)
+        self._applied.update(row.version for row in fresh)
+        self.applied += len(foreign)
+
+        top = max(self._applied, default=self.low)
+        for version in range(self.low + 1, top + 1):
+            if version not in self._applied:
+                self._missing.setdefault(version, now)
+        for version, since in list(self._missing.items()):
+            if now - since > GAP_SECONDS:
+                self._applied.add(version)
+        while self.low + 1 in self._applied:
+            self.low += 1
+            self._applied.discard(self.low)
+            self._missing.pop(self.low, None)
+        return len(foreign)
+
+
+def apply(db: Session, changes: List) -> None:
+    """Applies logged (entity, entity_id) changes to this process's caches of the session's database."""
+    questions = {change.entity_id for change in changes if change.entity == QUESTION}
+    mocks = {change.entity_id for change in changes if change.entity == MOCK}
+    Question = models.Question
+    ordered = sorted(questions)
+    for start in range(0, len(ordered), APPLY_CHUNK):
+        chunk = ordered[start:start + APPLY_CHUNK]
+        rows = db.execute(
+            select(Question.id, Question.tech_stack_id, Question.topic, Question.question_text, Question.ideal_answer)
+            .where(Question.id.in_(chunk))
+        ).all()
+        removed = set(chunk) - {row.id for row in rows}
+        sampling.questions_removed(db, removed)
+        adaptive.questions_removed(db, removed)
+        sampling.questions_added(db, [(row.id, row.tech_stack_id, row.topic) for row in rows])
+        grading.questions_added(db, [(row.id, row.ideal_answer) for row in rows])
+        dedup.questions_added(db, [(row.id, row.question_text) for row in rows])
+        adaptive.questions_added(db, [(row.id, row.tech_stack_id) for row in rows])
+        for question_id in chunk:
+            mock_cache.question_changed(db, question_id)
+    for mock_id in mocks:
+        mock_cache.mock_changed(db, mock_id)
+    if any(change.entity == CALIBRATION for change in changes):
+        adaptive.bank_for(db).clear()
+
+
+def reset(db: Session):
+    """Drops every in-process cache of the session's database."""
+    sampling.forget(db)
+    dedup.forget(db)
+    grading.forget(db)
+    adaptive.bank_for(db).clear()
+    mock_cache.cache_for(db).clear()
+
+
+def prune(db: Session) -> int:
+    cutoff = _utcnow() - timedelta(seconds=RETENTION_SECONDS)
+    return db.execute(delete(models.EntityVersion).where(models.EntityVersion.changed_at < cutoff)).rowcount
+
+
+_feeds: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+
+
+def feed_for(db) -> ChangeFeed:
+    """Returns the change feed for the database the (sync or async) session is bound to."""
+    bind = db.get_bind()
+    with _registry_lock:
+        feed = _feeds.get(bind)
+        if feed is None:
+            feed = _feeds[bind] = ChangeFeed()
+        return feed
+
+
+def refresh(db: Session, force: bool = False) -> int:
+    """
+    Brings this process's caches up to date with other processes' writes, if a check is due.
+    Call it before a unit of work: it ends the session's transaction.
+    """
+    return feed_for(db).refresh(db, force)
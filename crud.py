@@ -1,16 +1,21 @@
-from sqlalchemy.orm import Session
 import random
-from typing import List
+import time
+from collections import Counter, defaultdict
+from sqlalchemy import Integer, Text, column, func, insert, select, values
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import Dict, List, Optional, Tuple
 
-import models, schemas
+import models, schemas, adaptive, analytics, archive, coherence, dedup, grading, jobs, sampling
+from pagination import paginate
 
 
 def get_candidate(db: Session, candidate_id: int):
     return db.query(models.Candidate).filter(models.Candidate.id == candidate_id).first()
 
 
-def get_candidates(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Candidate).offset(skip).limit(limit).all()
+def get_candidates(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    return paginate(db.query(models.Candidate), models.Candidate.id, skip, limit, after_id).all()
 
 
 def create_candidate(db: Session, candidate: schemas.CandidateCreate):
@@ -27,14 +32,89 @@ def create_candidate(db: Session, candidate: schemas.CandidateCreate):
     return db_candidate
 
 
+def get_candidate_by_email(db: Session, email: str):
+    return db.query(models.Candidate).filter(models.Candidate.email == email).first()
+
+
+def update_candidate(db: Session, candidate_id: int, changes: schemas.CandidateUpdate):
+    """
+    Applies the fields set in `changes`; None if the candidate does not exist.
+    Raises IntegrityError, with nothing written, when the email belongs to another candidate.
+    """
+    db_candidate = get_candidate(db, candidate_id)
+    if db_candidate is None:
+        return None
+    for name, value in changes.model_dump(exclude_unset=True).items():
+        setattr(db_candidate, name, value)
+    # The unique email index decides, so a concurrent registration cannot slip in between
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise
+    db.commit()
+    db.refresh(db_candidate)
+    return db_candidate
+
+
+def delete_candidate(db: Session, candidate_id: int) -> bool:
+    """False if the candidate does not exist. Raises ValueError if they have sessions, which keep their history."""
+    db_candidate = get_candidate(db, candidate_id)
+    if db_candidate is None:
+        return False
+    if (db.query(models.MockSession.id).filter(models.MockSession.candidate_id == candidate_id).first()
+            or archive.has_sessions(db, candidate_id)):
+        raise ValueError("Candidate has sessions and cannot be deleted")
+    db.delete(db_candidate)
+    db.commit()
+    return True
+
+
 def get_tech_stack(db: Session, stack_id: int):
     return db.query(models.TechStack).filter(models.TechStack.id == stack_id).first()
 
 def get_tech_stack_by_name(db: Session, name: str):
     return db.query(models.TechStack).filter(models.TechStack.name == name).first()
 
-def get_tech_stacks(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.TechStack).offset(skip).limit(limit).all()
+def get_tech_stacks(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    return paginate(db.query(models.TechStack), models.TechStack.id, skip, limit, after_id).all()
+
+def get_tech_stack_summaries(db: Session, skip: int = 0, limit: int = 100, include_questions: bool = False,
+                             after_id: Optional[int] = None):
+    """
+    Lists stacks with question counts from one GROUP BY query.
+    Questions are only embedded on request, and then loaded with one eager IN query rather than one per stack.
+    """
+    if include_questions:
+        query = db.query(models.TechStack).options(selectinload(models.TechStack.questions))
+    else:
+        query = db.query(models.TechStack.id, models.TechStack.name)
+    stacks = paginate(query, models.TechStack.id, skip, limit, after_id).all()
+    if not stacks:
+        return []
+
+    question_counts = defaultdict(int)
+    topic_counts = defaultdict(dict)
+    rows = (db.query(models.Question.tech_stack_id, models.Question.topic, func.count(models.Question.id))
+            .filter(models.Question.tech_stack_id.in_([stack.id for stack in stacks]))
+            .group_by(models.Question.tech_stack_id, models.Question.topic))
+    for stack_id, topic, count in rows:
+        question_counts[stack_id] += count
+        if topic is not None:
+            topic_counts[stack_id][topic] = count
+
+    summaries = []
+    for stack in stacks:
+        summary = schemas.TechStackSummary(
+            id=stack.id,
+            name=stack.name,
+            question_count=question_counts[stack.id],
+            topic_counts=topic_counts[stack.id],
+        )
+        if include_questions:
+            summary.questions = [schemas.Question.model_validate(q) for q in stack.questions]
+        summaries.append(summary)
+    return summaries
 
 def create_tech_stack(db: Session, stack: schemas.TechStackCreate):
     existing_stack = get_tech_stack_by_name(db, stack.name)
@@ -49,21 +129,50 @@ def create_tech_stack(db: Session, stack: schemas.TechStackCreate):
 def create_question(db: Session, question: schemas.QuestionCreate):
     db_question = models.Question(**question.model_dump())
     db.add(db_question)
+    db.flush()
+    coherence.record(db, coherence.QUESTION, [db_question.id])
     db.commit()
     db.refresh(db_question)
+    sampling.questions_added(db, [(db_question.id, db_question.tech_stack_id, db_question.topic)])
+    grading.questions_added(db, [(db_question.id, db_question.ideal_answer)])
+    dedup.questions_added(db, [(db_question.id, db_question.question_text)])
+    adaptive.questions_added(db, [(db_question.id, db_question.tech_stack_id)])
     return db_question
 
-def get_questions(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Question).offset(skip).limit(limit).all()
+def get_questions(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None,
+                  tech_stack_id: Optional[int] = None, topic: Optional[str] = None):
+    query = db.query(models.Question)
+    if tech_stack_id is not None:
+        query = query.filter(models.Question.tech_stack_id == tech_stack_id)
+    if topic is not None:
+        query = query.filter(models.Question.topic == topic)
+    return paginate(query, models.Question.id, skip, limit, after_id).all()
 
 
-def get_mocks(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Mock).offset(skip).limit(limit).all()
+def get_mocks(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    return paginate(db.query(models.Mock), models.Mock.id, skip, limit, after_id).all()
 
 def get_mock(db: Session, mock_id: int):
-    return db.query(models.Mock).filter(models.Mock.id == mock_id).first()
+    return (db.query(models.Mock).options(selectinload(models.Mock.questions))
+            .filter(models.Mock.id == mock_id).first())
 
 
+def _sample_distinct(index: sampling.QuestionIndex, duplicates: dedup.DuplicateIndex, stack_id: int, limit: int,
+                     topics: Optional[List[str]], clusters: set) -> List[int]:
+    """Samples up to `limit` ids with at most one question per near-duplicate cluster across the mock."""
+    if topics:
+        available = sum(index.count(stack_id, topic) for topic in set(topics))
+    else:
+        available = index.count(stack_id)
+    draw = limit
+    while True:
+        picked = duplicates.pick_distinct(index.sample(stack_id, draw, topics=topics), limit, clusters)
+        # Oversample when duplicates were dropped, until the whole pool has been seen
+        if len(picked) >= limit or draw >= available:
+            clusters.update(duplicates.cluster_of(question_id) for question_id in picked)
+            return picked
+        draw = min(available, draw * 2)
+
 def create_mock_from_stacks(db: Session, mock_data: schemas.MockCreateFromStacks):
     # 1. Create the Mock object
     db_mock = models.Mock(name=mock_data.name, description=mock_data.description)
@@ -78,17 +187,22 @@ def create_mock_from_stacks(db: Session, mock_data: schemas.MockCreateFromStacks
     questions_per_stack = mock_data.num_questions // len(mock_data.tech_stack_ids)
     remainder = mock_data.num_questions % len(mock_data.tech_stack_ids)
 
-    selected_questions = []
-    
+    index = sampling.index_for(db)
+    duplicates = dedup.index_for(db)
+    selected_ids = []
+    clusters = set()
+
     for i, stack_id in enumerate(mock_data.tech_stack_ids):
         limit = questions_per_stack + (1 if i < remainder else 0)
-        
-        # Fetch all questions for this stack (in a real app, might want to filter by difficulty)
-        stack_questions = db.query(models.Question).filter(models.Question.tech_stack_id == stack_id).all()
-        
-        if stack_questions:
-            # Randomly sample
-            selected_questions.extend(random.sample(stack_questions, min(len(stack_questions), limit)))
+        # Draw ids from the in-memory index instead of loading every question in the stack
+        selected_ids.extend(_sample_distinct(index, duplicates, stack_id, limit, mock_data.topics, clusters))
+
+    # Fetch only the sampled rows, in one IN query, keeping the sampled order
+    selected_questions = []
+    if selected_ids:
+        found = {q.id: q for q in db.query(models.Question).filter(models.Question.id.in_(selected_ids))}
+        selected_questions = [found[qid] for qid in selected_ids if qid in found]
+        sampling.questions_removed(db, set(selected_ids) - found.keys())
 
     # 3. Associate questions with Mock
     db_mock.questions = selected_questions
@@ -96,7 +210,87 @@ def create_mock_from_stacks(db: Session, mock_data: schemas.MockCreateFromStacks
     db.refresh(db_mock)
     return db_mock
 
-def create_mock_session(db: Session, session_data: schemas.MockSessionCreate):
+MOCK_BATCH_MAX = 5000
+
+def create_mock_batch(db: Session, batch: schemas.MockBatchCreate) -> schemas.MockBatchResult:
+    """
+    Generates a cohort of mocks (and optionally their sessions) in one transaction of bulk inserts.
+    Questions are dealt from a shuffled deck per stack, so across the cohort every eligible question
+    is used about equally often, and no mock holds two questions of one near-duplicate cluster.
+    Raises ValueError for an invalid batch.
+    """
+    started = time.perf_counter()
+    candidate_ids = batch.candidate_ids or []
+    count = len(candidate_ids) if candidate_ids else (batch.count or 0)
+    if candidate_ids and batch.count is not None and batch.count != len(candidate_ids):
+        raise ValueError("count must match the number of candidate_ids")
+    if not 0 < count <= MOCK_BATCH_MAX:
+        raise ValueError(f"A batch holds between 1 and {MOCK_BATCH_MAX} mocks (candidate_ids or count)")
+    if not batch.tech_stack_ids:
+        raise ValueError("tech_stack_ids must not be empty")
+    if batch.create_sessions and not candidate_ids:
+        raise ValueError("create_sessions needs candidate_ids")
+    if candidate_ids:
+        known = set(db.execute(select(models.Candidate.id).where(models.Candidate.id.in_(set(candidate_ids)))).scalars())
+        missing = sorted(set(candidate_ids) - known)
+        if missing:
+            raise ValueError(f"Unknown candidate ids: {missing[:20]}")
+
+    rng = random.Random(batch.seed)
+    index = sampling.index_for(db)
+    duplicates = dedup.index_for(db)
+    per_stack = batch.num_questions // len(batch.tech_stack_ids)
+    remainder = batch.num_questions % len(batch.tech_stack_ids)
+    decks = [(sampling.ExposureDeck(index.ids(stack_id, batch.topics), rng), per_stack + (1 if i < remainder else 0))
+             for i, stack_id in enumerate(batch.tech_stack_ids)]
+
+    cluster_cache: Dict[int, int] = {}
+    def cluster_of(question_id: int) -> int:
+        cluster = cluster_cache.get(question_id)
+        if cluster is None:
+            cluster = cluster_cache[question_id] = duplicates.cluster_of(question_id)
+        return cluster
+
+    hands = []
+    for _ in range(count):
+        clusters = set()
+        hands.append([question_id for deck, quota in decks for question_id in deck.deal(quota, cluster_of, clusters)])
+
+    # Multi-row INSERT ... RETURNING does not promise row order, so ids are matched back by a
+    # value unique within the batch (asking SQLAlchemy to sort makes SQLite insert row by row)
+    names = [f"{batch.name} #{i}" for i in range(1, count + 1)]
+    inserted = dict(db.execute(
+        insert(models.Mock).returning(models.Mock.name, models.Mock.id),
+        [{"name": name, "description": batch.description} for name in names],
+    ).all())
+    mock_ids = [inserted[name] for name in names]
+    links = [{"mock_id": mock_id, "question_id": question_id} for mock_id, hand in zip(mock_ids, hands) for question_id in hand]
+    if links:
+        db.execute(insert(models.mock_questions), links)
+    session_ids = [None] * count
+    if batch.create_sessions:
+        inserted = dict(db.execute(
+            insert(models.MockSession).returning(models.MockSession.mock_id, models.MockSession.id),
+            [{"candidate_id": candidate_id, "mock_id": mock_id, "status": models.MockStatusEnum.scheduled}
+             for candidate_id, mock_id in zip(candidate_ids, mock_ids)],
+        ).all())
+        session_ids = [inserted[mock_id] for mock_id in mock_ids]
+    db.commit()
+
+    exposure = Counter(question_id for hand in hands for question_id in hand)
+    uses = [exposure[question_id] for question_id in {q for deck, _ in decks for q in deck.ids}] or [0]
+    return schemas.MockBatchResult(
+        mocks=[schemas.GeneratedMock(mock_id=mock_id, candidate_id=candidate_id, session_id=session_id, question_ids=hand)
+               for mock_id, candidate_id, session_id, hand
+               in zip(mock_ids, candidate_ids or [None] * count, session_ids, hands)],
+        questions_used=len(exposure),
+        min_exposure=min(uses),
+        max_exposure=max(uses),
+        elapsed_seconds=round(time.perf_counter() - started, 3),
+    )
+
+def create_mock_session(db: Session, session_data: schemas.MockSessionCreate, load=None):
+    """Starts a session and returns `load(db, session_id)` (by default the full get_session_details)."""
     db_session = models.MockSession(
         candidate_id=session_data.candidate_id,
         mock_id=session_data.mock_id,
@@ -104,19 +298,122 @@ def create_mock_session(db: Session, session_data: schemas.MockSessionCreate):
     )
     db.add(db_session)
     db.commit()
-    db.refresh(db_session)
-    return db_session
+    return (load or get_session_details)(db, db_session.id)
+
+def get_session_details(db: Session, session_id: int):
+    """Loads a session with everything schemas.MockSession serializes, without any lazy loads."""
+    return (db.query(models.MockSession)
+            .options(
+                joinedload(models.MockSession.candidate),
+                joinedload(models.MockSession.mock).selectinload(models.Mock.questions),
+                selectinload(models.MockSession.answers),
+            )
+            .filter(models.MockSession.id == session_id)
+            .populate_existing()
+            .first())
+
+ANSWER_UPSERT_BATCH = 5000  # rows per statement, well inside SQLite's bound-parameter limit
 
-def submit_session(db: Session, session_id: int, answers: List[schemas.SessionAnswerCreate]):
-    db_session = db.query(models.MockSession).filter(models.MockSession.id == session_id).first()
-    if not db_session:
+def upsert_answer_rows(db: Session, rows: Dict[Tuple[int, int], Optional[str]]):
+    """
+    Writes {(session_id, question_id): answer} with batched INSERT ... ON CONFLICT statements.
+    An existing (session, question) answer is replaced and its grade cleared.
+    """
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    items = list(rows.items())
+    for start in range(0, len(items), ANSWER_UPSERT_BATCH):
+        stmt = insert(models.SessionAnswer).values([
+            {"mock_session_id": session_id, "question_id": question_id, "candidate_answer": text}
+            for (session_id, question_id), text in items[start:start + ANSWER_UPSERT_BATCH]
+        ])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[models.SessionAnswer.mock_session_id, models.SessionAnswer.question_id],
+            set_={"candidate_answer": stmt.excluded.candidate_answer, "correctness": None},
+        ))
+
+def upsert_session_answers(db: Session, session_id: int, answers: List[schemas.SessionAnswerCreate]):
+    # Last answer per question wins
+    upsert_answer_rows(db, {(session_id, ans.question_id): ans.candidate_answer for ans in answers})
+
+def upsert_open_answer_rows(db: Session, rows: Dict[Tuple[int, int], Optional[str]]) -> int:
+    """
+    Like upsert_answer_rows, but only for sessions that are not completed; returns the rows written.
+    The INSERT ... SELECT reads the status itself, so nothing can commit a submit between the check and
+    the write. Postgres evaluates it against the statement's snapshot, so there the sessions are also locked
+    FOR UPDATE first, which holds a concurrent submit off until commit.
+    """
+    if not rows:
+        return 0
+    MockSession, SessionAnswer = models.MockSession, models.SessionAnswer
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        db.execute(select(MockSession.id).where(MockSession.id.in_({key[0] for key in rows})).with_for_update())
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    items = [(session_id, question_id, text) for (session_id, question_id), text in rows.items()]
+    written = 0
+    for start in range(0, len(items), ANSWER_UPSERT_BATCH):
+        saves = (values(column("mock_session_id", Integer), column("question_id", Integer),
+                        column("candidate_answer", Text), name="saves")
+                 .data(items[start:start + ANSWER_UPSERT_BATCH]).cte())
+        stmt = insert(SessionAnswer).from_select(
+            ["mock_session_id", "question_id", "candidate_answer"],
+            select(saves.c.mock_session_id, saves.c.question_id, saves.c.candidate_answer)
+            .join(MockSession, MockSession.id == saves.c.mock_session_id)
+            .where(MockSession.status != models.MockStatusEnum.completed),
+        )
+        written += len(db.execute(stmt.on_conflict_do_update(
+            index_elements=[SessionAnswer.mock_session_id, SessionAnswer.question_id],
+            set_={"candidate_answer": stmt.excluded.candidate_answer, "correctness": None},
+        ).returning(SessionAnswer.id)).all())
+    return written
+
+def get_session_status(db: Session, session_id: int):
+    row = db.query(models.MockSession.status).filter(models.MockSession.id == session_id).first()
+    return row.status if row else None
+
+def submit_session(db: Session, session_id: int, answers: List[schemas.SessionAnswerCreate],
+                   idempotency_key: Optional[str] = None, load=None):
+    """
+    Stores the answers, completes the session and queues its grading. With an idempotency key, a retried
+    submit finds its receipt and returns the stored result without writing again.
+    Returns `load(db, session_id)`, by default the full get_session_details.
+    Raises ValueError when the key was already used for a different session.
+    """
+    load = load or get_session_details
+    exists = db.query(models.MockSession.id).filter(models.MockSession.id == session_id).first()
+    if not exists:
         return None
-    
-    for ans in answers:
-        db_answer = models.SessionAnswer(mock_session_id=session_id, question_id=ans.question_id, candidate_answer=ans.candidate_answer)
-        db.add(db_answer)
-    
-    db_session.status = models.MockStatusEnum.completed
-    db.commit()
-    db.refresh(db_session)
-    return db_session
\ No newline at end of file
+
+    if idempotency_key:
+        receipt = db.get(models.SubmissionReceipt, idempotency_key)
+        if receipt is not None:
+            if receipt.mock_session_id != session_id:
+                raise ValueError("Idempotency key was already used for another session")
+            return load(db, session_id)
+
+    # A resubmit replaces what the session counted for in the analytics, rather than adding to it
+    counted_before = analytics.snapshot(db, [session_id])
+    upsert_session_answers(db, session_id, answers)
+    db.query(models.MockSession).filter(models.MockSession.id == session_id).update(
+        {models.MockSession.status: models.MockStatusEnum.completed}, synchronize_session=False
+    )
+    analytics.apply(db, counted_before, analytics.snapshot(db, [session_id]))
+    # Grading runs in the background worker; the job commits together with the submission
+    jobs.enqueue(db, "grade_session", {"session_id": session_id})
+    if idempotency_key:
+        db.add(models.SubmissionReceipt(idempotency_key=idempotency_key, mock_session_id=session_id))
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key committed first; its result is the answer
+        db.rollback()
+        receipt = db.get(models.SubmissionReceipt, idempotency_key) if idempotency_key else None
+        if receipt is None or receipt.mock_session_id != session_id:
+            raise
+    return load(db, session_id)
@@ -1,12 +1,35 @@
-from sqlalchemy import create_engine
+import os
+
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import declarative_base
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+import storage
+from storage import to_async_url  # noqa: F401 (kept importable from here)
+
+# URL, pools and SQLite pragmas: see storage.py for the settings and their MOCKTEST_* variables
+config = storage.load_config()
+SQLALCHEMY_DATABASE_URL = config.url
+
+# "sync" serves requests from the threadpool with the regular engine,
+# "async" uses an asyncio driver (aiosqlite locally, asyncpg for Postgres) so requests never hold a worker thread.
+DB_MODE = os.getenv("MOCKTEST_DB_MODE", "sync")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Writes (and anything that must read its own writes) go through `engine`; read-only
+# requests through `read_engine`, which is the same engine when reads are not split off.
+engine, read_engine = storage.create_engines(config)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+async_engine = async_read_engine = None
+AsyncSessionLocal = AsyncReadSessionLocal = None
+if DB_MODE == "async":
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine, async_read_engine = storage.create_async_engines(config)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False)
+
+# Old completed sessions moved out of the hot tables (archive.py); None when archiving is off
+archive_engine = storage.create_archive_engine(config)
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
@@ -0,0 +1,359 @@
+import os
+import threading
+import weakref
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models, schemas
+from grading import STOP_WORDS, TOKEN_RE
+
+# Near-duplicate questions ("What is a decorator?" / "What's a decorator in Python?") are found
+# with MinHash signatures over character shingles of the normalized text, and LSH banding:
+# two questions become candidates only if one band of their signatures is identical, so a
+# lookup touches a handful of buckets instead of the whole bank. Candidates are confirmed
+# by the signature agreement (the estimated Jaccard similarity) and grouped into clusters.
+# A question with no content words left after normalizing ("What is it?") has nothing to
+# compare and is never a duplicate.
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 4
+THRESHOLD = float(os.getenv("MOCKTEST_DEDUP_THRESHOLD", "0.7"))
+BUILD_BATCH = 20000
+MERGE_AT = 20000  # rows added since the band tables were sorted before they are rebuilt
+
+QUESTION_WORDS = STOP_WORDS | frozenset("what whats how why when which explain describe define do does can you your".split())
+
+# Permutations are a*x + b mod 2**32 with odd a, computed in native uint32 wraparound.
+# Fixed seed: signatures must not change between processes or restarts
+_seed = np.random.default_rng(20240601)
+_A = _seed.integers(1, 1 << 32, NUM_PERM, dtype=np.uint32) | np.uint32(1)
+_B = _seed.integers(0, 1 << 32, NUM_PERM, dtype=np.uint32)
+_BAND_MIX = _seed.integers(1, 1 << 63, ROWS, dtype=np.uint64) | np.uint64(1)
+# Signature of a text with nothing left after normalizing
+BLANK = np.uint32(0xFFFFFFFF)
+
+
+def normalize(text: Optional[str]) -> str:
+    """
+    Lowercased content words, plurals folded, sorted: rewordings that only reorder words shingle
+    alike. Single characters are kept, as they tell "What is C?" from "What is R?".
+    """
+    words = set()
+    for word in TOKEN_RE.findall((text or "").lower()):
+        if word in QUESTION_WORDS:
+            continue
+        words.add(word[:-1] if len(word) > 3 and word.endswith("s") else word)
+    return " ".join(sorted(words))
+
+
+def signatures(texts: Sequence[Optional[str]]) -> np.ndarray:
+    """
+    MinHash signatures (len(texts) x NUM_PERM, uint32) for a batch. All texts are packed into
+    one byte buffer, each 4-byte shingle is read as an integer, and every permutation is
+    applied to the whole batch at once with a segmented minimum. Texts that normalize to
+    nothing get a signature of BLANK (see blank), which the index leaves out.
+    """
+    pieces, starts, total, empty = [], [], 0, []
+    for i, text in enumerate(texts):
+        encoded = normalize(text).encode()[:2048]
+        if not encoded:
+            empty.append(i)
+        # Shorter texts are padded to one shingle
+        encoded = encoded.ljust(SHINGLE)
+        starts.append(total)
+        pieces.append(encoded)
+        total += len(encoded)
+    buffer = np.frombuffer(b"".join(pieces), dtype=np.uint8).astype(np.uint32)
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.diff(np.append(starts, total))
+
+    grams = buffer[:-3] << np.uint32(24) | buffer[1:-2] << np.uint32(16) | buffer[2:-1] << np.uint32(8) | buffer[3:]
+    # Keep only shingles that start and end inside one text
+    valid = np.ones(len(grams), dtype=bool)
+    ends = starts + lengths
+    for back in range(1, SHINGLE):
+        cut = ends - back
+        valid[cut[cut < len(grams)]] = False
+    grams = grams[valid]
+    per_text = lengths - (SHINGLE - 1)
+    offsets = np.concatenate(([0], np.cumsum(per_text)[:-1]))
+
+    out = np.empty((len(texts), NUM_PERM), dtype=np.uint32)
+    hashed = np.empty_like(grams)
+    for p in range(NUM_PERM):
+        np.multiply(grams, _A[p], out=hashed)
+        hashed += _B[p]
+        out[:, p] = np.minimum.reduceat(hashed, offsets)
+    out[empty] = BLANK
+    return out
+
+
+def blank(sigs: np.ndarray) -> np.ndarray:
+    """Which signatures are of texts that normalize to nothing."""
+    return (sigs == BLANK).all(axis=1)
+
+
+def band_keys(sigs: np.ndarray) -> np.ndarray:
+    """One 64-bit key per band (rows x BANDS)."""
+    banded = sigs.astype(np.uint64).reshape(len(sigs), BANDS, ROWS)
+    return (banded * _BAND_MIX).sum(axis=2, dtype=np.uint64)
+
+
+class DuplicateIndex:
+    """
+    In-memory MinHash/LSH index and union-find clustering of the question bank, kept per
+    database like the sampling index. Rows are numbered in insertion order; question ids
+    map to rows through a dense array because ids are autoincrement integers.
+    """
+
+    def __init__(self, threshold: float = THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._count = 0
+        self._ids = np.empty(0, dtype=np.int64)
+        # Low 16 bits of each MinHash value are enough to estimate agreement, at half the memory
+        self._sigs = np.empty((0, NUM_PERM), dtype=np.uint16)
+        self._keys = np.empty((0, BANDS), dtype=np.uint64)
+        self._parent = np.empty(0, dtype=np.int64)
+        self._row_of = np.full(0, -1, dtype=np.int64)
+        self._members: Dict[int, List[int]] = {}  # root row -> rows, for clusters of two or more
+        self._sorted: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._sorted_upto = 0
+        self._delta: Dict[Tuple[int, int], List[int]] = {}
+        self.built = False
+
+    def __len__(self):
+        return self._count
+
+    # --- storage ---
+
+    def _reserve(self, extra: int, max_id: int):
+        needed = self._count + extra
+        if needed > len(self._ids):
+            capacity = max(needed, 2 * len(self._ids), 1024)
+            self._ids = np.resize(self._ids, capacity)
+            self._sigs = np.resize(self._sigs, (capacity, NUM_PERM))
+            self._keys = np.resize(self._keys, (capacity, BANDS))
+            self._parent = np.resize(self._parent, capacity)
+        if max_id >= len(self._row_of):
+            grown = np.full(max(max_id + 1, 2 * len(self._row_of)), -1, dtype=np.int64)
+            grown[:len(self._row_of)] = self._row_of
+            self._row_of = grown
+
+    def _append(self, ids: Sequence[int], sigs: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        self._reserve(len(ids), int(ids.max()) if len(ids) else 0)
+        rows = np.arange(self._count, self._count + len(ids))
+        self._ids[rows] = ids
+        self._sigs[rows] = sigs
+        self._keys[rows] = band_keys(sigs)
+        self._parent[rows] = rows
+        self._row_of[ids] = rows
+        self._count += len(ids)
+        return rows
+
+    def _sort_bands(self):
+        keys = self._keys[:self._count]
+        self._sorted = []
+        for band in range(BANDS):
+            order = np.argsort(keys[:, band], kind="stable")
+            self._sorted.append((keys[order, band], order))
+        self._sorted_upto = self._count
+        self._delta.clear()
+
+    # --- clustering ---
+
+    def _find(self, row: int) -> int:
+        root = row
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[row] != root:
+            self._parent[row], row = root, self._parent[row]
+        return int(root)
+
+    def _union(self, a: int, b: int):
+        a, b = self._find(a), self._find(b)
+        if a == b:
+            return
+        members_a = self._members.pop(a, [a])
+        members_b = self._members.pop(b, [b])
+        if len(members_a) < len(members_b):
+            a, b, members_a, members_b = b, a, members_b, members_a
+        self._parent[b] = a
+        members_a.extend(members_b)
+        self._members[a] = members_a
+
+    def _similar(self, row: int, candidates: np.ndarray) -> np.ndarray:
+        agreement = (self._sigs[candidates] == self._sigs[row]).mean(axis=1)
+        return candidates[agreement >= self.threshold]
+
+    def _candidates(self, keys: np.ndarray) -> Set[int]:
+        found: Set[int] = set()
+        for band, key in enumerate(keys):
+            if self._sorted:
+                sorted_keys, rows = self._sorted[band]
+                lo = np.searchsorted(sorted_keys, key, side="left")
+                hi = np.searchsorted(sorted_keys, key, side="right")
+                found.update(rows[lo:hi].tolist())
+            found.update(self._delta.get((band, int(key)), ()))
+        return found
+
+    # --- public API ---
+
+    def build(self, db: Session):
+        rows = db.execute(
+            select(models.Question.id, models.Question.question_text)
+            .order_by(models.Question.id).execution_options(yield_per=BUILD_BATCH)
+        )
+        with self._lock:
+            self._reset()
+            for batch in rows.partitions(BUILD_BATCH):
+                sigs = signatures([row[1] for row in batch])
+                keep = np.flatnonzero(~blank(sigs))
+                self._append([batch[i][0] for i in keep.tolist()], sigs[keep])
+            self._sort_bands()
+            # Rows sharing a band key sit next to each other in the sorted band. Every pair in
+            # such a run is a candidate: a row can be similar to one two places down without
+            # being similar to the row in between. Each step pairs every row with the one `step`
+            # places on while both are still in the same run, so the work is the number of candidates.
+            pairs = []
+            for sorted_keys, order in self._sorted:
+                same = np.flatnonzero(sorted_keys[1:] == sorted_keys[:-1])
+                step = 1
+                while len(same):
+                    pairs.append(np.stack([order[same], order[same + step]], axis=1))
+                    step += 1
+                    same = same[same + step < len(sorted_keys)]
+                    same = same[sorted_keys[same + step] == sorted_keys[same]]
+            if pairs:
+                pairs = np.unique(np.concatenate(pairs), axis=0)
+                agreement = (self._sigs[pairs[:, 0]] == self._sigs[pairs[:, 1]]).mean(axis=1)
+                for a, b in pairs[agreement >= self.threshold].tolist():
+                    self._union(a, b)
+            self.built = True
+
+    def add_many(self, rows: Iterable[Tuple[int, Optional[str]]]):
+        rows = [(question_id, text) for question_id, text in rows]
+        if not rows:
+            return
+        sigs = signatures([text for _, text in rows])
+        keep = np.flatnonzero(~blank(sigs))
+        rows, sigs = [rows[i] for i in keep.tolist()], sigs[keep]
+        with self._lock:
+            fresh = [i for i, (question_id, _) in enumerate(rows)
+                     if question_id >= len(self._row_of) or self._row_of[question_id] < 0]
+            if not fresh:
+                return
+            new_rows = self._append([rows[i][0] for i in fresh], sigs[fresh])
+            for row in new_rows.tolist():
+                candidates = np.fromiter(self._candidates(self._keys[row]), dtype=np.int64)
+                for other in self._similar(row, candidates[candidates != row]).tolist():
+                    self._union(row, other)
+                for band, key in enumerate(self._keys[row].tolist()):
+                    self._delta.setdefault((band, key), []).append(row)
+            if self._count - self._sorted_upto >= MERGE_AT:
+                self._sort_bands()
+
+    def find(self, text: Optional[str]) -> List[Tuple[int, float]]:
+        """Existing questions similar to `text`, most similar first, as (question_id, similarity)."""
+        sig = signatures([text])[0]
+        if blank(sig[None])[0]:
+            return []
+        with self._lock:
+            candidates = np.fromiter(self._candidates(band_keys(sig[None])[0]), dtype=np.int64)
+            if not len(candidates):
+                return []
+            agreement = (self._sigs[candidates] == sig.astype(np.uint16)).mean(axis=1)
+            keep = agreement >= self.threshold
+            matches = sorted(zip(self._ids[candidates[keep]].tolist(), agreement[keep].tolist()),
+                             key=lambda match: -match[1])
+            return [(question_id, round(similarity, 3)) for question_id, similarity in matches]
+
+    def cluster_of(self, question_id: int) -> int:
+        """Cluster key of a question: the id of its cluster's representative (itself when unique)."""
+        with self._lock:
+            row = self._row_of[question_id] if question_id < len(self._row_of) else -1
+            return int(self._ids[self._find(row)]) if row >= 0 else question_id
+
+    def pick_distinct(self, question_ids: Iterable[int], limit: int, seen: Set[int]) -> List[int]:
+        """Keeps ids (in order, up to `limit`) whose cluster is not in `seen` and not picked twice."""
+        picked, clusters = [], set()
+        for question_id in question_ids:
+            cluster = self.cluster_of(question_id)
+            if cluster in seen or cluster in clusters:
+                continue
+            clusters.add(cluster)
+            picked.append(question_id)
+            if len(picked) == limit:
+                break
+        return picked
+
+    def clusters(self, min_size: int = 2) -> List[List[int]]:
+        """Question ids of every cluster with at least `min_size` members, largest first."""
+        with self._lock:
+            groups = [self._ids[members].tolist() for members in self._members.values() if len(members) >= min_size]
+        for group in groups:
+            group.sort()
+        return sorted(groups, key=lambda group: (-len(group), group[0]))
+
+
+_indexes: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+
+
+def index_for(db: Session) -> DuplicateIndex:
+    """Returns the (lazily built) duplicate index for the database the session is bound to."""
+    bind = db.get_bind()
+    with _registry_lock:
+        index = _indexes.get(bind)
+        if index is None:
+            index = _indexes[bind] = DuplicateIndex()
+    if not index.built:
+        with index._lock:
+            if not index.built:
+                index.build(db)
+    return index
+
+
+def questions_added(db: Session, rows: Iterable[Tuple[int, Optional[str]]]):
+    """Feeds freshly committed (id, question_text) rows into an already built index."""
+    index = _indexes.get(db.get_bind())
+    if index is not None and index.built:
+        index.add_many(rows)
+
+
+def forget(db: Session):
+    """Forgets the duplicate index of the session's database; the next lookup rebuilds it."""
+    with _registry_lock:
+        _indexes.pop(db.get_bind(), None)
+
+
+def find_duplicates(db: Session, question_text: str) -> List[schemas.DuplicateMatch]:
+    return [schemas.DuplicateMatch(question_id=question_id, similarity=similarity)
+            for question_id, similarity in index_for(db).find(question_text)]
+
+
+def duplicate_report(db: Session, skip: int = 0, limit: int = 100, min_size: int = 2) -> List[schemas.DuplicateCluster]:
+    """Existing clusters of near-duplicate questions, largest first."""
+    groups = index_for(db).clusters(min_size)[skip:skip + limit]
+    wanted = [question_id for group in groups for question_id in group]
+    found = {}
+    if wanted:
+        found = {q.id: q for q in db.query(models.Question).filter(models.Question.id.in_(wanted))}
+    report = []
+    for group in groups:
+        questions = [found[question_id] for question_id in group if question_id in found]
+        if len(questions) >= min_size:
+            report.append(schemas.DuplicateCluster(
+                cluster_id=group[0], size=len(questions),
+                questions=[schemas.Question.model_validate(q) for q in questions],
+            ))
+    return report
@@ -0,0 +1,353 @@
+import argparse
+import csv
+import datetime
+import io
+import json
+import sys
+import time
+from typing import AsyncIterator, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.engine import Connection, Engine
+
+import archive, models
+from async_crud import AsyncSession
+
+# Sessions and their answers are exported one row per answer (sessions without answers get
+# a single row with empty answer columns). Rows come off a server-side cursor in batches of
+# BATCH_SIZE and are encoded and handed on batch by batch, so memory stays flat however many
+# rows are exported. Sessions moved to the archive database are exported too, ahead of the
+# hot tables' (they are the older ones), BATCH_SIZE archived sessions at a time with their
+# candidate, mock and question details read from the hot database. Parquet needs pyarrow, which is optional and imported on first use;
+# its rows are buffered up to one row group.
+
+BATCH_SIZE = 5000
+PARQUET_ROW_GROUP = 100000
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+COLUMNS = [
+    ("session_id", models.MockSession.id),
+    ("session_date", models.MockSession.session_date),
+    ("status", models.MockSession.status),
+    ("overall_result", models.MockSession.overall_result),
+    ("candidate_id", models.MockSession.candidate_id),
+    ("candidate_name", models.Candidate.name),
+    ("candidate_email", models.Candidate.email),
+    ("mock_id", models.MockSession.mock_id),
+    ("mock_name", models.Mock.name),
+    ("question_id", models.SessionAnswer.question_id),
+    ("tech_stack_id", models.Question.tech_stack_id),
+    ("tech_stack", models.TechStack.name),
+    ("topic", models.Question.topic),
+    ("question_text", models.Question.question_text),
+    ("candidate_answer", models.SessionAnswer.candidate_answer),
+    ("correctness", models.SessionAnswer.correctness),
+]
+HEADER = [name for name, _ in COLUMNS]
+_ENUMS = [i for i, (name, _) in enumerate(COLUMNS) if name in ("status", "correctness")]
+_DATES = [i for i, (name, _) in enumerate(COLUMNS) if name == "session_date"]
+
+
+def build_query(status: Optional[models.MockStatusEnum] = models.MockStatusEnum.completed,
+                date_from: Optional[datetime.datetime] = None, date_to: Optional[datetime.datetime] = None,
+                mock_id: Optional[int] = None, tech_stack_id: Optional[int] = None):
+    """Sessions (by status, session date range and mock) joined to their answers, optionally only one stack's."""
+    MockSession, SessionAnswer, Question = models.MockSession, models.SessionAnswer, models.Question
+    stmt = (select(*(column.label(name) for name, column in COLUMNS))
+            .select_from(MockSession)
+            .outerjoin(models.Candidate, models.Candidate.id == MockSession.candidate_id)
+            .outerjoin(models.Mock, models.Mock.id == MockSession.mock_id)
+            .outerjoin(SessionAnswer, SessionAnswer.mock_session_id == MockSession.id)
+            .outerjoin(Question, Question.id == SessionAnswer.question_id)
+            .outerjoin(models.TechStack, models.TechStack.id == Question.tech_stack_id)
+            .order_by(MockSession.id, SessionAnswer.question_id))
+    if status is not None:
+        stmt = stmt.where(MockSession.status == status)
+    if date_from is not None:
+        stmt = stmt.where(MockSession.session_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(MockSession.session_date < date_to)
+    if mock_id is not None:
+        stmt = stmt.where(MockSession.mock_id == mock_id)
+    if tech_stack_id is not None:
+        stmt = stmt.where(Question.tech_stack_id == tech_stack_id)
+    return stmt
+
+
+def _archived_batch(conn: Connection, after_id: int,
+                    status: Optional[models.MockStatusEnum] = models.MockStatusEnum.completed,
+                    date_from: Optional[datetime.datetime] = None, date_to: Optional[datetime.datetime] = None,
+                    mock_id: Optional[int] = None, tech_stack_id: Optional[int] = None) -> Tuple[List[tuple], Optional[int]]:
+    """
+    Rows, as build_query's, of the next BATCH_SIZE archived sessions after `after_id` that the
+    filters select, and the last session id read (None once there are no more). `conn` is on the hot database.
+    """
+    archive_engine = archive.engine_for(conn)
+    # Only completed sessions are archived
+    if archive_engine is None or status not in (None, models.MockStatusEnum.completed):
+        return [], None
+    archived = archive.archived_sessions
+    stmt = (select(archived.c.id, archived.c.session_date, archived.c.status, archived.c.overall_result,
+                   archived.c.candidate_id, archived.c.mock_id, archived.c.answers)
+            .where(archived.c.id > after_id).order_by(archived.c.id).limit(BATCH_SIZE))
+    if date_from is not None:
+        stmt = stmt.where(archived.c.session_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(archived.c.session_date < date_to)
+    if mock_id is not None:
+        stmt = stmt.where(archived.c.mock_id == mock_id)
+    archive.ensure_schema(archive_engine)
+    with archive_engine.connect() as archive_conn:
+        sessions = archive_conn.execute(stmt).all()
+    if not sessions:
+        return [], None
+
+    answers = {session.id: sorted(archive.unpack(session.answers), key=lambda answer: answer[1])
+               for session in sessions}
+    question_ids = {answer[1] for session_answers in answers.values() for answer in session_answers}
+    Question = models.Question
+    candidates = {row.id: row for row in conn.execute(
+        select(models.Candidate.id, models.Candidate.name, models.Candidate.email)
+        .where(models.Candidate.id.in_({session.candidate_id for session in sessions})))}
+    mocks = dict(conn.execute(select(models.Mock.id, models.Mock.name)
+                              .where(models.Mock.id.in_({session.mock_id for session in sessions}))).all())
+    questions = {row.id: row for row in conn.execute(
+        select(Question.id, Question.tech_stack_id, models.TechStack.name.label("tech_stack"), Question.topic,
+               Question.question_text)
+        .outerjoin(models.TechStack, models.TechStack.id == Question.tech_stack_id)
+        .where(Question.id.in_(question_ids)))}
+
+    rows = []
+    for session in sessions:
+        candidate = candidates.get(session.candidate_id)
+        head = (session.id, session.session_date, session.status, session.overall_result, session.candidate_id,
+                candidate.name if candidate else None, candidate.email if candidate else None,
+                session.mock_id, mocks.get(session.mock_id))
+        session_rows = []
+        for _, question_id, text, correctness in answers[session.id]:
+            question = questions.get(question_id)
+            session_rows.append(head + (
+                question_id,
+                *((question.tech_stack_id, question.tech_stack, question.topic, question.question_text)
+                  if question else (None,) * 4),
+                text, models.CorrectnessEnum(correctness) if correctness is not None else None,
+            ))
+        if tech_stack_id is not None:
+            # Like the hot tables' join: only that stack's answers, and no row for sessions without any
+            session_rows = [row for row in session_rows if row[10] == tech_stack_id]
+        elif not session_rows:
+            session_rows = [head + (None,) * 7]
+        rows.extend(session_rows)
+    return rows, sessions[-1].id
+
+
+def _plain(rows: Sequence[Sequence]) -> List[list]:
+    """Enums as their API values, like every other response."""
+    plain = []
+    for row in rows:
+        row = list(row)
+        for i in _ENUMS:
+            if row[i] is not None:
+                row[i] = row[i].value
+        plain.append(row)
+    return plain
+
+
+class CsvEncoder:
+    def start(self) -> bytes:
+        return self.encode_rows([HEADER])
+
+    def encode(self, rows: Sequence[Sequence]) -> bytes:
+        return self.encode_rows(_plain(rows))
+
+    @staticmethod
+    def encode_rows(rows) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class NdjsonEncoder:
+    def start(self) -> bytes:
+        return b""
+
+    def encode(self, rows: Sequence[Sequence]) -> bytes:
+        lines = []
+        for row in _plain(rows):
+            for i in _DATES:
+                if row[i] is not None:
+                    row[i] = row[i].isoformat()
+            lines.append(json.dumps(dict(zip(HEADER, row)), ensure_ascii=False))
+        lines.append("")
+        return "\n".join(lines).encode()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _Drain:
+    """Write-only file object whose contents are taken out after every row group."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+class ParquetEncoder:
+    def __init__(self, row_group: int = PARQUET_ROW_GROUP):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.pa = pa
+        types = {"session_date": pa.timestamp("us"), "session_id": pa.int64(), "candidate_id": pa.int64(),
+                 "mock_id": pa.int64(), "question_id": pa.int64(), "tech_stack_id": pa.int64()}
+        self.schema = pa.schema([(name, types.get(name, pa.string())) for name in HEADER])
+        self.row_group = row_group
+        self.pending: List[list] = []
+        self.sink = _Drain()
+        self.writer = pq.ParquetWriter(self.sink, self.schema, compression="zstd")
+
+    def start(self) -> bytes:
+        return self.sink.take()
+
+    def _write(self):
+        columns = list(zip(*self.pending))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema,
+        ), row_group_size=self.row_group)
+        self.pending = []
+
+    def encode(self, rows: Sequence[Sequence]) -> bytes:
+        self.pending.extend(_plain(rows))
+        if len(self.pending) >= self.row_group:
+            self._write()
+        return self.sink.take()
+
+    def finish(self) -> bytes:
+        if self.pending:
+            self._write()
+        self.writer.close()
+        return self.sink.take()
+
+
+def encoder_for(fmt: str):
+    """Raises ValueError for an unknown format, or for Parquet without pyarrow."""
+    if fmt == "csv":
+        return CsvEncoder()
+    if fmt == "ndjson":
+        return NdjsonEncoder()
+    if fmt == "parquet":
+        return ParquetEncoder()
+    raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+
+
+def stream(engine: Engine, encoder, **filters) -> Iterator[bytes]:
+    """
+    Encoded chunks of the rows build_query(**filters) selects, archived sessions' first, the
+    hot tables' read through a server-side cursor on a connection of its own.
+    """
+    yield encoder.start()
+    with engine.connect() as conn:
+        after_id = 0
+        while after_id is not None:
+            rows, after_id = _archived_batch(conn, after_id, **filters)
+            if rows:
+                yield encoder.encode(rows)
+        result = conn.execution_options(yield_per=BATCH_SIZE).execute(build_query(**filters))
+        for rows in result.partitions():
+            chunk = encoder.encode(rows)
+            if chunk:
+                yield chunk
+    yield encoder.finish()
+
+
+async def stream_async(engine, encoder, **filters) -> AsyncIterator[bytes]:
+    yield encoder.start()
+    async with engine.connect() as conn:
+        after_id = 0
+        while after_id is not None:
+            rows, after_id = await conn.run_sync(_archived_batch, after_id, **filters)
+            if rows:
+                yield encoder.encode(rows)
+        result = await conn.stream(build_query(**filters).execution_options(yield_per=BATCH_SIZE))
+        async for rows in result.partitions():
+            chunk = encoder.encode(rows)
+            if chunk:
+                yield chunk
+    yield encoder.finish()
+
+
+def stream_for(db, encoder, **filters):
+    """Streams over the database the (sync or async) request session is bound to."""
+    if AsyncSession is not None and isinstance(db, AsyncSession):
+        return stream_async(db.bind, encoder, **filters)
+    return stream(db.get_bind(), encoder, **filters)
+
+
+def _date(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export sessions and their answers as CSV, NDJSON or Parquet.")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--output", help="File to write (default: standard output)")
+    parser.add_argument("--status", choices=[status.value for status in models.MockStatusEnum] + ["any"],
+                        default=models.MockStatusEnum.completed.value)
+    parser.add_argument("--from", dest="date_from", type=_date, help="Sessions on or after this ISO date")
+    parser.add_argument("--to", dest="date_to", type=_date, help="Sessions before this ISO date")
+    parser.add_argument("--mock-id", type=int)
+    parser.add_argument("--tech-stack-id", type=int)
+    args = parser.parse_args(argv)
+
+    import database
+
+    archive.install()
+    status = None if args.status == "any" else models.MockStatusEnum(args.status)
+    filters = dict(status=status, date_from=args.date_from, date_to=args.date_to, mock_id=args.mock_id,
+                   tech_stack_id=args.tech_stack_id)
+    try:
+        encoder = encoder_for(args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    started = time.perf_counter()
+    written = 0
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream(database.engine, encoder, **filters):
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+    print(f"Exported {written:,} bytes in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,7 @@ const TakeMockTest = ({ mockId }) => {
         setMock(mockRes.data);
 
         // 2. Create Session (using candidate_id 1 from seed data)
-        const sessionRes = await axios.post(`${API_URL}/sessions/`, { 
+        const sessionRes = await axios.post(`${API_URL}/sessions/?view=summary`, { 
           candidate_id: 1, 
           mock_id: mockId 
         });
@@ -33,8 +33,26 @@ const TakeMockTest = ({ mockId }) => {
     if (mockId) initSession();
   }, [mockId]);
 
+  // Autosave: send what changed since the last save, at most every 2 seconds.
+  // The backend buffers these and writes them in batches.
+  const [dirty, setDirty] = useState({});
+  useEffect(() => {
+    if (!sessionId || submitted || Object.keys(dirty).length === 0) return;
+    const timer = setTimeout(() => {
+      const payload = Object.entries(dirty).map(([qId, ans]) => ({
+        question_id: parseInt(qId),
+        candidate_answer: ans
+      }));
+      setDirty({});
+      axios.patch(`${API_URL}/sessions/${sessionId}/answers`, payload)
+        .catch(err => console.error("Autosave failed:", err));
+    }, 2000);
+    return () => clearTimeout(timer);
+  }, [dirty, sessionId, submitted]);
+
   const handleAnswerChange = (questionId, text) => {
     setAnswers(prev => ({ ...prev, [questionId]: text }));
+    setDirty(prev => ({ ...prev, [questionId]: text }));
   };
 
   const handleSubmit = () => {
@@ -44,7 +62,7 @@ const TakeMockTest = ({ mockId }) => {
       candidate_answer: ans
     }));
 
-    axios.post(`${API_URL}/sessions/${sessionId}/submit`, payload)
+    axios.post(`${API_URL}/sessions/${sessionId}/submit?view=summary`, payload)
       .then(() => setSubmitted(true))
       .catch(err => console.error(err));
   };
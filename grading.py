@@ -0,0 +1,338 @@
+import argparse
+import multiprocessing
+import os
+import re
+import threading
+import time
+import weakref
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+import models, schemas, analytics
+
+# Answers are scored by TF-IDF cosine similarity against the question's ideal answer.
+# Terms are hashed into a fixed feature space so vectors are plain (column, weight) arrays,
+# and every pair in a batch is scored at once with NumPy instead of one by one.
+
+HASH_BITS = 20
+FEATURES = 1 << HASH_BITS
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was were will with".split()
+)
+PARALLEL_THRESHOLD = 20000  # below this many answers a process pool costs more than it saves
+PROCESS_CHUNK = 5000
+
+
+@dataclass(frozen=True)
+class GradingThresholds:
+    correct: float = float(os.getenv("MOCKTEST_GRADE_CORRECT", "0.6"))
+    partial: float = float(os.getenv("MOCKTEST_GRADE_PARTIAL", "0.3"))
+
+
+class _ColumnCache(dict):
+    """token -> hashed column (-1 for stop words), memoised so each distinct token is hashed once."""
+
+    def __missing__(self, token: str) -> int:
+        column = -1 if token in STOP_WORDS else zlib.crc32(token.encode()) & (FEATURES - 1)
+        if len(self) < 1_000_000:
+            self[token] = column
+        return column
+
+
+_columns = _ColumnCache()
+
+
+def vectorize_many(texts: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Vectorizes texts into CSR arrays (indptr, columns, counts), sorted by column within a row.
+    Tokenizing is the only per-token Python work; counting happens in NumPy.
+    Runs in worker processes for big batches.
+    """
+    columns: List[int] = []
+    lengths = np.zeros(len(texts), np.int64)
+    for i, text in enumerate(texts):
+        tokens = TOKEN_RE.findall(text.lower()) if text else ()
+        columns.extend(map(_columns.__getitem__, tokens))
+        lengths[i] = len(tokens)
+    cols = np.array(columns, np.int64)
+    owners = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+    keep = cols >= 0
+    keys, counts = np.unique(owners[keep] * FEATURES + cols[keep], return_counts=True)
+    indptr = np.zeros(len(texts) + 1, np.int64)
+    np.cumsum(np.bincount(keys // FEATURES, minlength=len(texts)), out=indptr[1:])
+    return indptr, keys % FEATURES, counts.astype(np.float64)
+
+
+def vectorize(text: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the (hashed term columns, term counts) of a text."""
+    _, cols, counts = vectorize_many([text])
+    return cols, counts
+
+
+def _vectorize_parallel(texts: List[Optional[str]], processes: Optional[int]):
+    if processes == 1 or len(texts) < PARALLEL_THRESHOLD:
+        return vectorize_many(texts)
+    chunks = [texts[i:i + PROCESS_CHUNK] for i in range(0, len(texts), PROCESS_CHUNK)]
+    # Spawned, not forked: a fork would copy the server's threads' locks and open connections
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        parts = list(pool.map(vectorize_many, chunks))
+    offsets = np.cumsum([0] + [part[0][-1] for part in parts])
+    indptr = np.concatenate([[0]] + [part[0][1:] + offset for part, offset in zip(parts, offsets)])
+    return indptr, np.concatenate([part[1] for part in parts]), np.concatenate([part[2] for part in parts])
+
+
+def _expand_rows(indptr: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """For each requested row, the positions of its CSR entries and the index of the request they belong to."""
+    starts, lengths = indptr[rows], indptr[rows + 1] - indptr[rows]
+    owners = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return starts[owners] + offsets, owners
+
+
+def _l2_normalize(weights: np.ndarray, owners: np.ndarray, n: int) -> np.ndarray:
+    norms = np.sqrt(np.bincount(owners, weights=weights * weights, minlength=n))
+    norms[norms == 0] = 1.0
+    return weights / norms[owners]
+
+
+class IdealAnswerIndex:
+    """
+    Term counts of every ideal answer plus the corpus document frequencies.
+    New questions are added incrementally; IDF weights are applied at scoring time,
+    so the cached vectors never go stale when the corpus grows.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vectors: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._df = np.zeros(FEATURES, np.int32)
+        self.built = False
+
+    def build(self, db: Session):
+        rows = db.execute(
+            select(models.Question.id, models.Question.ideal_answer).execution_options(yield_per=5000)
+        )
+        with self._lock:
+            self._vectors.clear()
+            self._df[:] = 0
+            for question_id, ideal_answer in rows:
+                self._add(question_id, ideal_answer)
+            self.built = True
+
+    def _add(self, question_id: int, ideal_answer: Optional[str]):
+        old = self._vectors.pop(question_id, None)
+        if old is not None:
+            self._df[old[0]] -= 1
+        cols, tf = vectorize(ideal_answer)
+        if len(cols):
+            self._vectors[question_id] = (cols, tf)
+            self._df[cols] += 1
+
+    def add(self, question_id: int, ideal_answer: Optional[str]):
+        with self._lock:
+            self._add(question_id, ideal_answer)
+
+    def idf(self) -> np.ndarray:
+        n = len(self._vectors)
+        return np.log((1.0 + n) / (1.0 + self._df)) + 1.0
+
+    def score(self, question_ids: Sequence[int], answers: Sequence[Optional[str]],
+              processes: Optional[int] = None) -> np.ndarray:
+        """
+        Cosine similarity of each answer to its question's ideal answer.
+        NaN marks questions without a usable ideal answer.
+        """
+        n = len(question_ids)
+        if n == 0:
+            return np.zeros(0)
+        cand_indptr, cand_cols, cand_tf = _vectorize_parallel(list(answers), processes)
+
+        with self._lock:
+            idf = self.idf()
+            unique_ids = list(dict.fromkeys(question_ids))
+            known = [qid for qid in unique_ids if qid in self._vectors]
+            ideal_rows = {qid: row for row, qid in enumerate(known)}
+            ideal_indptr = np.zeros(len(known) + 1, np.int64)
+            ideal_indptr[1:] = np.cumsum([len(self._vectors[qid][0]) for qid in known])
+            ideal_cols = np.concatenate([self._vectors[qid][0] for qid in known]) if known else np.zeros(0, np.int64)
+            ideal_tf = np.concatenate([self._vectors[qid][1] for qid in known]) if known else np.zeros(0)
+
+        # Ideal vectors: TF-IDF, L2-normalised per question
+        ideal_owner = np.repeat(np.arange(len(known)), np.diff(ideal_indptr))
+        ideal_w = _l2_normalize(ideal_tf * idf[ideal_cols], ideal_owner, len(known))
+
+        # Candidate vectors: TF-IDF, L2-normalised per answer
+        cand_owner = np.repeat(np.arange(n), np.diff(cand_indptr))
+        cand_w = _l2_normalize(cand_tf * idf[cand_cols], cand_owner, n)
+
+        # Lay each pair's ideal vector next to its answer vector and join them on (pair, column)
+        pair_rows = np.array([ideal_rows.get(qid, -1) for qid in question_ids], np.int64)
+        graded = np.flatnonzero(pair_rows >= 0)
+        positions, owners = _expand_rows(ideal_indptr, pair_rows[graded])
+        ideal_keys = graded[owners] * FEATURES + ideal_cols[positions]
+        cand_keys = cand_owner * FEATURES + cand_cols
+        _, ideal_at, cand_at = np.intersect1d(ideal_keys, cand_keys, assume_unique=True, return_indices=True)
+        scores = np.bincount(cand_owner[cand_at], weights=ideal_w[positions][ideal_at] * cand_w[cand_at], minlength=n)
+        # bincount of nothing comes back as integers
+        scores = scores.astype(np.float64, copy=False)
+        scores[pair_rows < 0] = np.nan
+        return scores
+
+
+def classify(scores: np.ndarray, thresholds: GradingThresholds = GradingThresholds()) -> List[Optional[models.CorrectnessEnum]]:
+    labels = np.where(scores >= thresholds.correct, 2, np.where(scores >= thresholds.partial, 1, 0))
+    mapping = (models.CorrectnessEnum.incorrect, models.CorrectnessEnum.partial, models.CorrectnessEnum.correct)
+    return [None if np.isnan(score) else mapping[label] for score, label in zip(scores, labels)]
+
+
+def format_result(labels: Iterable[Optional[models.CorrectnessEnum]]) -> str:
+    """Same summary format the review spreadsheets use."""
+    counts = Counter(labels)
+    return (f"correct: {counts[models.CorrectnessEnum.correct]} | "
+            f"incorrect: {counts[models.CorrectnessEnum.incorrect]} | "
+            f"partially correct: {counts[models.CorrectnessEnum.partial]}")
+
+
+_indexes: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+
+
+def index_for(db: Session) -> IdealAnswerIndex:
+    bind = db.get_bind()
+    with _registry_lock:
+        index = _indexes.get(bind)
+        if index is None:
+            index = _indexes[bind] = IdealAnswerIndex()
+    if not index.built:
+        index.build(db)
+    return index
+
+
+def questions_added(db: Session, rows: Iterable[Tuple[int, Optional[str]]]):
+    """Feeds freshly committed (id, ideal_answer) rows into an already built index."""
+    index = _indexes.get(db.get_bind())
+    if index is not None and index.built:
+        for question_id, ideal_answer in rows:
+            index.add(question_id, ideal_answer)
+
+
+def forget(db: Session):
+    with _registry_lock:
+        _indexes.pop(db.get_bind(), None)
+
+
+SESSION_BATCH = 5000
+
+
+def grade_sessions(db: Session, session_ids: Sequence[int], processes: Optional[int] = None,
+                   thresholds: GradingThresholds = GradingThresholds()) -> schemas.GradingReport:
+    """
+    Grades every answer of the given sessions, writes SessionAnswer.correctness with one
+    executemany UPDATE and MockSession.overall_result with another, then commits once.
+    """
+    started = time.perf_counter()
+    answer_ids, owners, question_ids, texts = [], [], [], []
+    counted_before: analytics.Snapshot = {}
+    for start in range(0, len(session_ids), SESSION_BATCH):
+        rows = db.execute(
+            select(models.SessionAnswer.id, models.SessionAnswer.mock_session_id,
+                   models.SessionAnswer.question_id, models.SessionAnswer.candidate_answer,
+                   models.SessionAnswer.correctness, models.Question.tech_stack_id, models.MockSession.status)
+            .join(models.MockSession, models.MockSession.id == models.SessionAnswer.mock_session_id)
+            .outerjoin(models.Question, models.Question.id == models.SessionAnswer.question_id)
+            .where(models.SessionAnswer.mock_session_id.in_(session_ids[start:start + SESSION_BATCH]))
+        )
+        for answer_id, session_id, question_id, text, correctness, stack_id, status in rows:
+            answer_ids.append(answer_id)
+            owners.append(session_id)
+            question_ids.append(question_id)
+            texts.append(text)
+            if status == models.MockStatusEnum.completed and stack_id is not None:
+                counted_before.setdefault(session_id, []).append((question_id, stack_id, correctness))
+
+    labels = classify(index_for(db).score(question_ids, texts, processes), thresholds)
+    # (session, question) is unique, so this finds each counted answer's new grade
+    question_labels = {(session_id, question_id): label
+                       for session_id, question_id, label in zip(owners, question_ids, labels)}
+
+    per_session: Dict[int, List[Optional[models.CorrectnessEnum]]] = {session_id: [] for session_id in session_ids}
+    for session_id, label in zip(owners, labels):
+        per_session[session_id].append(label)
+
+    # Core executemany UPDATEs by primary key; no ORM objects are loaded
+    answers, sessions = models.SessionAnswer.__table__, models.MockSession.__table__
+    if answer_ids:
+        db.execute(
+            update(answers).where(answers.c.id == bindparam("answer_id")).values(correctness=bindparam("label")),
+            [{"answer_id": answer_id, "label": label} for answer_id, label in zip(answer_ids, labels)],
+        )
+    if per_session:
+        db.execute(
+            update(sessions).where(sessions.c.id == bindparam("session_id")).values(overall_result=bindparam("result")),
+            [{"session_id": session_id, "result": format_result(session_labels)}
+             for session_id, session_labels in per_session.items()],
+        )
+    analytics.apply(db, counted_before, {
+        session_id: [(question_id, stack_id, question_labels[(session_id, question_id)])
+                     for question_id, stack_id, _ in rows]
+        for session_id, rows in counted_before.items()
+    })
+    db.commit()
+
+    graded = [label for label in labels if label is not None]
+    return schemas.GradingReport(
+        sessions=len(per_session),
+        answers=len(answer_ids),
+        graded=len(graded),
+        result=format_result(graded),
+        elapsed_seconds=round(time.perf_counter() - started, 3),
+    )
+
+
+def completed_session_ids(db: Session, mock_id: Optional[int] = None) -> List[int]:
+    query = select(models.MockSession.id).where(models.MockSession.status == models.MockStatusEnum.completed)
+    if mock_id is not None:
+        query = query.where(models.MockSession.mock_id == mock_id)
+    return list(db.execute(query).scalars())
+
+
+def grade_session(db: Session, session_id: int, **kwargs) -> Optional[schemas.GradingReport]:
+    if db.get(models.MockSession, session_id) is None:
+        return None
+    return grade_sessions(db, [session_id], **kwargs)
+
+
+def grade_mock(db: Session, mock_id: int, **kwargs) -> schemas.GradingReport:
+    """Grades the whole completed cohort of a mock."""
+    return grade_sessions(db, completed_session_ids(db, mock_id), **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade completed sessions against the ideal answers.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--mock-id", type=int, help="Grade the completed cohort of one mock")
+    target.add_argument("--all", action="store_true", help="Grade every completed session")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        report = grade_sessions(db, completed_session_ids(db, args.mock_id), processes=args.processes)
+    finally:
+        db.close()
+    print(f"Graded {report.graded}/{report.answers} answers in {report.sessions} sessions "
+          f"in {report.elapsed_seconds}s - {report.result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+import argparse
+import csv
+import io
+import itertools
+import math
+import os
+import re
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models, schemas, adaptive, coherence, dedup, grading, sampling
+
+
+# Spreadsheet headers vary between sheets ("Question", "Ideal Answer", "tech stack"...),
+# so every header is normalised and mapped onto a Question column.
+QUESTION_COLUMNS = {
+    "question": "question_text",
+    "questiontext": "question_text",
+    "topic": "topic",
+    "idealanswer": "ideal_answer",
+    "answer": "ideal_answer",
+    "techstack": "tech_stack",
+    "stack": "tech_stack",
+    "techstackid": "tech_stack_id",
+}
+
+CANDIDATE_COLUMNS = {
+    "name": "name",
+    "fullname": "name",
+    "candidate": "name",
+    "candidatename": "name",
+    "email": "email",
+    "emailid": "email",
+    "emailaddress": "email",
+    "mail": "email",
+    "profileexp": "profile_exp",
+    "profile": "profile_exp",
+    "experience": "profile_exp",
+    "passingyear": "passing_year",
+    "yearofpassing": "passing_year",
+    "graduationyear": "passing_year",
+    "graduationdetails": "graduation_details",
+    "graduation": "graduation_details",
+    "education": "graduation_details",
+}
+CANDIDATE_DUPLICATE_MODES = ("skip", "update")
+# An ASCII dot-atom local part, which email-validator accepts and leaves unchanged
+_PLAIN_LOCAL_PART = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*")
+_EMAIL = TypeAdapter(EmailStr)
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+def _normalize_header(value) -> str:
+    return "".join(ch for ch in str(value or "").lower() if ch.isalnum())
+
+
+def _clean(value) -> Optional[str]:
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def _rows_from_table(rows: Iterable[tuple], columns: Dict[str, str]) -> Iterator[dict]:
+    """Turns raw sheet/CSV tuples into dicts keyed by model column, using the first non-empty row as header."""
+    header = None
+    for values in rows:
+        if header is None:
+            if not any(_clean(v) for v in values):
+                continue
+            header = [columns.get(_normalize_header(v)) for v in values]
+            if not any(header):
+                return  # Not a table we know how to read (e.g. the "Index" sheet)
+            continue
+        if not any(_clean(v) for v in values):
+            continue
+        row = {}
+        for key, value in zip(header, values):
+            if key and key not in row:
+                row[key] = _clean(value)
+        yield row
+
+
+def read_csv_rows(fileobj, columns: Dict[str, str] = QUESTION_COLUMNS) -> Iterator[dict]:
+    """Streams rows from a CSV file object (text or binary)."""
+    if not isinstance(fileobj, io.TextIOBase):
+        fileobj = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    yield from _rows_from_table(csv.reader(fileobj), columns)
+
+
+def read_xlsx_rows(fileobj, columns: Dict[str, str] = QUESTION_COLUMNS) -> Iterator[dict]:
+    """
+    Streams rows from every sheet of an Excel workbook.
+    openpyxl's read-only mode parses the sheet XML lazily, so memory stays flat
+    regardless of how many rows the workbook holds.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield from _rows_from_table(sheet.iter_rows(values_only=True), columns)
+    finally:
+        workbook.close()
+
+
+def detect_format(filename: Optional[str] = None, content_type: Optional[str] = None) -> str:
+    if content_type and ("spreadsheet" in content_type or "excel" in content_type):
+        return "xlsx"
+    if content_type and "csv" in content_type:
+        return "csv"
+    if filename and filename.lower().endswith((".xlsx", ".xlsm")):
+        return "xlsx"
+    return "csv"
+
+
+def read_rows(fileobj, fmt: str, columns: Dict[str, str] = QUESTION_COLUMNS) -> Iterator[dict]:
+    if fmt == "xlsx":
+        return read_xlsx_rows(fileobj, columns)
+    if fmt == "csv":
+        return read_csv_rows(fileobj, columns)
+    raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _resolve_stacks(db: Session, names: Iterable[str], cache: Dict[str, int]) -> int:
+    """Looks up (or creates) every unseen stack name with one SELECT and one INSERT; returns how many were created."""
+    missing = {name for name in names if name not in cache}
+    if not missing:
+        return 0
+    for stack_id, name in db.execute(
+        select(models.TechStack.id, models.TechStack.name).where(models.TechStack.name.in_(missing))
+    ):
+        cache[name] = stack_id
+    to_create = sorted(missing - cache.keys())
+    if to_create:
+        created = db.execute(
+            insert(models.TechStack).returning(models.TechStack.id, models.TechStack.name),
+            [{"name": name} for name in to_create],
+        )
+        for stack_id, name in created:
+            cache[name] = stack_id
+    return len(to_create)
+
+
+def _parse_id(value) -> Optional[int]:
+    """A whole, finite number as an int (spreadsheets hand ids over as floats like 3.0), else None."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number) or not number.is_integer():
+        return None
+    return int(number)
+
+
+def _find_stack_ids(db: Session, ids: Iterable[int], known: Set[int]):
+    """Adds those of `ids` that are existing stacks to `known`, with one SELECT for the unseen ones."""
+    unseen = set(ids) - known
+    if unseen:
+        known.update(db.execute(select(models.TechStack.id).where(models.TechStack.id.in_(unseen))).scalars())
+
+
+def import_questions(
+    db: Session,
+    rows: Iterable[dict],
+    default_tech_stack: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    progress: Optional[Callable[[int, int, float], None]] = None,
+) -> schemas.BulkImportResult:
+    """
+    Inserts questions in chunks: stacks are resolved once per name and each chunk
+    is written with a single batched INSERT and committed as one transaction.
+    """
+    stack_ids: Dict[str, int] = {}
+    known_stack_ids: Set[int] = set()
+    inserted = skipped = stacks_created = processed = 0
+    errors: List[schemas.ImportRowError] = []
+    started = time.perf_counter()
+
+    def reject(row_number: int, message: str):
+        nonlocal skipped
+        skipped += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(schemas.ImportRowError(row=row_number, error=message))
+
+    for chunk in chunked(rows, chunk_size):
+        stack_names = {row.get("tech_stack") or default_tech_stack for row in chunk if not row.get("tech_stack_id")}
+        stacks_created += _resolve_stacks(db, filter(None, stack_names), stack_ids)
+        given_ids = (_parse_id(row["tech_stack_id"]) for row in chunk if row.get("tech_stack_id"))
+        _find_stack_ids(db, filter(None, given_ids), known_stack_ids)
+
+        values = []
+        for offset, row in enumerate(chunk, start=processed + 1):
+            if not row.get("question_text"):
+                reject(offset, "missing question text")
+                continue
+            stack_id = row.get("tech_stack_id")
+            if stack_id:
+                parsed = _parse_id(stack_id)
+                if parsed is None:
+                    reject(offset, f"invalid tech_stack_id {stack_id!r}")
+                    continue
+                if parsed not in known_stack_ids:
+                    reject(offset, f"unknown tech_stack_id {parsed}")
+                    continue
+                stack_id = parsed
+            else:
+                stack_name = row.get("tech_stack") or default_tech_stack
+                if not stack_name:
+                    reject(offset, "missing tech stack")
+                    continue
+                stack_id = stack_ids[stack_name]
+            values.append({
+                "question_text": row["question_text"],
+                "topic": row.get("topic"),
+                "ideal_answer": row.get("ideal_answer"),
+                "tech_stack_id": stack_id,
+            })
+        processed += len(chunk)
+
+        added = []
+        if values:
+            added = db.execute(
+                insert(models.Question).returning(
+                    models.Question.id, models.Question.tech_stack_id, models.Question.topic,
+                    models.Question.question_text, models.Question.ideal_answer,
+                ),
+                values,
+            ).all()
+            inserted += len(values)
+            coherence.record(db, coherence.QUESTION, [row.id for row in added])
+        db.commit()
+        sampling.questions_added(db, [(row.id, row.tech_stack_id, row.topic) for row in added])
+        grading.questions_added(db, [(row.id, row.ideal_answer) for row in added])
+        dedup.questions_added(db, [(row.id, row.question_text) for row in added])
+        adaptive.questions_added(db, [(row.id, row.tech_stack_id) for row in added])
+
+        if progress:
+            progress(processed, inserted, time.perf_counter() - started)
+
+    elapsed = time.perf_counter() - started
+    return schemas.BulkImportResult(
+        inserted=inserted,
+        skipped=skipped,
+        stacks_created=stacks_created,
+        elapsed_seconds=round(elapsed, 3),
+        rows_per_second=round(inserted / elapsed, 1) if elapsed > 0 else 0.0,
+        errors=errors,
+    )
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}" for item in error.errors())
+
+
+class _EmailValidator:
+    """
+    EmailStr validation for many addresses. The IDNA domain check is most of its cost and
+    a candidate list has few distinct domains, so a domain is checked once and plain
+    addresses at a known domain only need their local part matched.
+    """
+
+    def __init__(self):
+        self.domains: Dict[str, str] = {}
+
+    def __call__(self, value) -> str:
+        """The normalized address. Raises ValidationError."""
+        if isinstance(value, str):
+            local, _, domain = value.rpartition("@")
+            normalized = self.domains.get(domain)
+            if (normalized is not None and len(local) <= 64 and len(value) <= 254
+                    and _PLAIN_LOCAL_PART.fullmatch(local)):
+                return f"{local}@{normalized}"
+        email = _EMAIL.validate_python(value)
+        self.domains[value.rpartition("@")[2]] = email.rpartition("@")[2]
+        return email
+
+
+def _write_candidates(db: Session, chunk: List[tuple], update_existing: bool) -> Tuple[int, int, List[tuple]]:
+    """
+    One SELECT finds which emails of the chunk already exist; the rest go in with one INSERT
+    and, when updating, the existing ones are rewritten with one UPDATE by primary key.
+    Returns (inserted, updated, [(row number, existing candidate id)] of skipped rows).
+    """
+    existing = dict(db.execute(
+        select(models.Candidate.email, models.Candidate.id)
+        .where(models.Candidate.email.in_([values["email"] for _, values in chunk]))
+    ).all())
+    new = [values for _, values in chunk if values["email"] not in existing]
+    if new:
+        db.execute(insert(models.Candidate), new)
+    if update_existing:
+        # Columns the row leaves empty keep their stored value
+        changed = [{**{name: value for name, value in values.items() if value is not None},
+                    "id": existing[values["email"]]}
+                   for _, values in chunk if values["email"] in existing]
+        if changed:
+            db.execute(update(models.Candidate), changed)
+        return len(new), len(changed), []
+    return len(new), 0, [(row, existing[values["email"]]) for row, values in chunk if values["email"] in existing]
+
+
+def import_candidates(
+    db: Session,
+    rows: Iterable[dict],
+    on_duplicate: str = "skip",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    progress: Optional[Callable[[int, int, float], None]] = None,
+) -> schemas.CandidateImportResult:
+    """
+    Validates rows like schemas.CandidateCreate and writes them a chunk (one transaction) at a time.
+    Candidates whose email is already registered are skipped and reported, or with
+    on_duplicate="update" overwritten with the row. Raises ValueError for an unknown mode.
+    """
+    if on_duplicate not in CANDIDATE_DUPLICATE_MODES:
+        raise ValueError(f"on_duplicate must be one of: {', '.join(CANDIDATE_DUPLICATE_MODES)}")
+    inserted = updated = skipped = processed = 0
+    errors: List[schemas.ImportRowError] = []
+    # email -> first row it appeared on, so a repeated row is reported against the original
+    seen: Dict[str, int] = {}
+    emails = _EmailValidator()
+    started = time.perf_counter()
+
+    def reject(row_number: int, message: str):
+        nonlocal skipped
+        skipped += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(schemas.ImportRowError(row=row_number, error=message))
+
+    for chunk in chunked(rows, chunk_size):
+        valid = []
+        for offset, row in enumerate(chunk, start=processed + 1):
+            year = row.get("passing_year")
+            if year:
+                try:
+                    row["passing_year"] = int(float(year))
+                except ValueError:
+                    pass  # Left for validation to report
+            try:
+                email = emails(row.get("email"))
+            except ValidationError as e:
+                reject(offset, "email: " + "; ".join(item["msg"] for item in e.errors()))
+                continue
+            try:
+                values = schemas.CandidateImportRow.model_validate({**row, "email": email}).model_dump()
+            except ValidationError as e:
+                reject(offset, _validation_message(e))
+                continue
+            first = seen.setdefault(values["email"], offset)
+            if first != offset:
+                reject(offset, f"duplicate of row {first} ({values['email']})")
+                continue
+            valid.append((offset, values))
+        processed += len(chunk)
+
+        if valid:
+            try:
+                counts = _write_candidates(db, valid, on_duplicate == "update")
+            except IntegrityError:
+                # Someone registered one of the emails since the lookup; look again
+                db.rollback()
+                counts = _write_candidates(db, valid, on_duplicate == "update")
+            inserted += counts[0]
+            updated += counts[1]
+            for row_number, candidate_id in counts[2]:
+                reject(row_number, f"email already registered (candidate {candidate_id})")
+        db.commit()
+
+        if progress:
+            progress(processed, inserted + updated, time.perf_counter() - started)
+
+    elapsed = time.perf_counter() - started
+    return schemas.CandidateImportResult(
+        inserted=inserted,
+        updated=updated,
+        skipped=skipped,
+        elapsed_seconds=round(elapsed, 3),
+        rows_per_second=round((inserted + updated) / elapsed, 1) if elapsed > 0 else 0.0,
+        errors=errors,
+    )
+
+
+def import_file(db: Session, path: str, default_tech_stack: Optional[str] = None,
+                chunk_size: int = DEFAULT_CHUNK_SIZE, progress=None) -> schemas.BulkImportResult:
+    fmt = detect_format(filename=path)
+    with open(path, "rb") as fileobj:
+        return import_questions(db, read_rows(fileobj, fmt), default_tech_stack, chunk_size, progress)
+
+
+def import_candidates_file(db: Session, path: str, on_duplicate: str = "skip", chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           progress=None) -> schemas.CandidateImportResult:
+    fmt = detect_format(filename=path)
+    with open(path, "rb") as fileobj:
+        return import_candidates(db, read_rows(fileobj, fmt, CANDIDATE_COLUMNS), on_duplicate, chunk_size, progress)
+
+
+def _print_progress(processed: int, inserted: int, elapsed: float):
+    rate = inserted / elapsed if elapsed > 0 else 0.0
+    print(f"\r{processed} rows read, {inserted} inserted ({rate:,.0f} rows/s)", end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import questions (or candidates) from an .xlsx workbook or a .csv file.")
+    parser.add_argument("path", help="Workbook or CSV file to import")
+    parser.add_argument("--tech-stack", help="Tech stack name for rows without a tech stack column")
+    parser.add_argument("--candidates", action="store_true", help="The file lists candidates rather than questions")
+    parser.add_argument("--on-duplicate", choices=CANDIDATE_DUPLICATE_MODES, default="skip",
+                        help="What to do with candidates whose email is already registered")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        parser.error(f"file not found: {args.path}")
+
+    import migrations
+    from database import SessionLocal, engine
+    migrations.init_db(engine)
+
+    db = SessionLocal()
+    try:
+        if args.candidates:
+            result = import_candidates_file(db, args.path, args.on_duplicate, args.chunk_size,
+                                            progress=_print_progress)
+        else:
+            result = import_file(db, args.path, args.tech_stack, args.chunk_size, progress=_print_progress)
+    finally:
+        db.close()
+    print(file=sys.stderr)
+    if args.candidates:
+        print(f"Inserted {result.inserted} candidates and updated {result.updated} ({result.skipped} skipped) "
+              f"in {result.elapsed_seconds}s - {result.rows_per_second:,.0f} rows/s")
+    else:
+        print(f"Inserted {result.inserted} questions ({result.skipped} skipped, "
+              f"{result.stacks_created} new tech stacks) in {result.elapsed_seconds}s "
+              f"- {result.rows_per_second:,.0f} rows/s")
+    for error in result.errors:
+        print(f"  row {error.row}: {error.error}")
+
+
+if __name__ == "__main__":
+    main()
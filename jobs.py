@@ -0,0 +1,412 @@
+import argparse
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, func, or_, select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+import models, schemas, coherence
+
+logger = logging.getLogger(__name__)
+
+# Work that follows a submit (grading, rollups, notifications) is queued in the `jobs` table
+# inside the submit transaction and drained by a worker in this process. The request returns
+# straight away, queued work survives restarts, and no external broker is needed.
+
+WORKERS = int(os.getenv("MOCKTEST_JOB_WORKERS", "2"))  # 0 disables the in-process worker
+EXECUTOR = os.getenv("MOCKTEST_JOB_EXECUTOR", "thread")  # thread | process
+BATCH_SIZE = int(os.getenv("MOCKTEST_JOB_BATCH", "100"))
+POLL_INTERVAL = float(os.getenv("MOCKTEST_JOB_POLL_INTERVAL", "1.0"))
+MAX_ATTEMPTS = int(os.getenv("MOCKTEST_JOB_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE = float(os.getenv("MOCKTEST_JOB_BACKOFF", "2.0"))
+BACKOFF_MAX = 300.0
+# The worker renews the heartbeat of the jobs it runs every HEARTBEAT seconds. A running job
+# whose heartbeat is older than STALE_AFTER belonged to a worker that died: it is claimed
+# again, or marked failed if that was its last attempt.
+STALE_AFTER = float(os.getenv("MOCKTEST_JOB_STALE_AFTER", "600"))
+HEARTBEAT = STALE_AFTER / 4
+
+Handler = Callable[[Session, List[dict]], None]
+_handlers: Dict[str, Handler] = {}
+
+# Set after a commit that queued work, so the worker does not wait for the next poll
+_wake = threading.Event()
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def handler(kind: str):
+    """Registers the function that runs jobs of `kind`; it receives the payloads of a claimed batch at once."""
+    def register(fn: Handler) -> Handler:
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+@handler("grade_session")
+def _grade_sessions(db: Session, payloads: List[dict]):
+    import grading
+
+    # One vectorized pass over the whole batch instead of one per session
+    grading.grade_sessions(db, [payload["session_id"] for payload in payloads])
+
+
+@handler("calibrate_questions")
+def _calibrate_questions(db: Session, payloads: List[dict]):
+    import adaptive
+
+    # However many were queued, one pass over the history serves them all
+    adaptive.calibrate(db)
+
+
+def enqueue(db: Session, kind: str, payload: dict, delay: float = 0,
+            max_attempts: int = MAX_ATTEMPTS) -> models.Job:
+    """Adds a job to the caller's transaction; the worker sees it once that transaction commits."""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    now = utcnow()
+    job = models.Job(kind=kind, payload=payload, max_attempts=max_attempts,
+                     created_at=now, run_after=now + timedelta(seconds=delay))
+    db.add(job)
+    return job
+
+
+def notify():
+    _wake.set()
+
+
+def backoff(attempts: int) -> float:
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+
+
+def _stale(now: datetime):
+    Job = models.Job
+    # Jobs claimed before heartbeats existed have only their start time
+    return and_(Job.status == models.JobStatusEnum.running,
+                func.coalesce(Job.heartbeat_at, Job.started_at) < now - timedelta(seconds=STALE_AFTER))
+
+
+def _claimable(now: datetime):
+    Job = models.Job
+    return or_(
+        and_(Job.status == models.JobStatusEnum.queued, Job.run_after <= now),
+        and_(_stale(now), Job.attempts < Job.max_attempts),
+    )
+
+
+def claim(db: Session, limit: int = BATCH_SIZE) -> Tuple[str, List[models.Job]]:
+    """
+    Marks up to `limit` due jobs as running under a fresh claim token and returns them.
+    The claim condition is repeated on the UPDATE itself, so two workers racing for
+    the same rows cannot both take them.
+    """
+    Job = models.Job
+    now = utcnow()
+    token = uuid.uuid4().hex
+    # A worker died during the last attempt of these: nothing will ever finish them
+    db.execute(
+        update(Job).where(_stale(now), Job.attempts >= Job.max_attempts)
+        .values(status=models.JobStatusEnum.failed, finished_at=now, claimed_by=None,
+                last_error="Worker stopped responding during the last attempt")
+        .execution_options(synchronize_session=False)
+    )
+    due = select(Job.id).where(_claimable(now)).order_by(Job.id).limit(limit)
+    db.execute(
+        update(Job).where(Job.id.in_(due), _claimable(now))
+        .values(status=models.JobStatusEnum.running, claimed_by=token, started_at=now, heartbeat_at=now,
+                attempts=Job.attempts + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    claimed = db.scalars(select(Job).where(Job.claimed_by == token, Job.status == models.JobStatusEnum.running)
+                         .order_by(Job.id)).all()
+    return token, list(claimed)
+
+
+def renew(db: Session, token: str) -> int:
+    """Renews the heartbeat of a claim's running jobs; returns how many it still holds."""
+    renewed = db.execute(
+        update(models.Job).where(models.Job.claimed_by == token, models.Job.status == models.JobStatusEnum.running)
+        .values(heartbeat_at=utcnow()).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return renewed
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a claim every HEARTBEAT seconds while its batch runs, so a long job is not taken for a dead one."""
+
+    def __init__(self, session_factory: Callable[[], Session], token: str):
+        super().__init__(name="job-heartbeat", daemon=True)
+        self.session_factory = session_factory
+        self.token = token
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(HEARTBEAT):
+            db = self.session_factory()
+            try:
+                renew(db, self.token)
+            except Exception:
+                logger.exception("Could not renew the heartbeat of claim %s", self.token)
+            finally:
+                db.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopping.set()
+        self.join()
+
+
+def _call(session_factory: Callable[[], Session], kind: str, payloads: List[dict]) -> Optional[str]:
+    db = session_factory()
+    try:
+        # Handlers read the in-process indexes, which may be behind other workers' writes
+        coherence.refresh(db)
+        _handlers[kind](db, payloads)
+        db.commit()
+        return None
+    except Exception:
+        db.rollback()
+        logger.exception("Job batch %r of %d failed", kind, len(payloads))
+        return traceback.format_exc(limit=5)
+    finally:
+        db.close()
+
+
+def execute(session_factory: Callable[[], Session], kind: str,
+            payloads: List[dict]) -> Tuple[List[Optional[str]], float]:
+    """
+    Runs a batch of one kind; returns the error (or None) of every payload and the time taken.
+    A failed batch is retried one job at a time so a single bad payload only fails itself.
+    """
+    started = time.perf_counter()
+    error = _call(session_factory, kind, payloads)
+    if error is None:
+        errors = [None] * len(payloads)
+    elif len(payloads) == 1:
+        errors = [error]
+    else:
+        errors = [_call(session_factory, kind, [payload]) for payload in payloads]
+    return errors, time.perf_counter() - started
+
+
+def _execute_in_child(kind: str, payloads: List[dict]):
+    # Process pools cannot receive the parent's engine; children open the configured database
+    from database import SessionLocal
+
+    return execute(SessionLocal, kind, payloads)
+
+
+class _Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.completed = self.retried = 0
+        self.total_wait = self.total_run = self.max_run = 0.0
+
+    def record(self, jobs: List[models.Job], errors: List[Optional[str]], seconds: float):
+        with self.lock:
+            for job, error in zip(jobs, errors):
+                if error is None:
+                    self.completed += 1
+                elif job.attempts < job.max_attempts:
+                    self.retried += 1
+                self.total_wait += max(0.0, (job.started_at - job.run_after).total_seconds())
+            self.total_run += seconds
+            self.max_run = max(self.max_run, seconds)
+
+
+_counters = _Counters()
+
+
+def _finish(db: Session, token: str, jobs: List[models.Job], errors: List[Optional[str]]):
+    Job = models.Job.__table__
+    now = utcnow()
+    rows = []
+    for job, error in zip(jobs, errors):
+        if error is None:
+            status, run_after = models.JobStatusEnum.done, job.run_after
+        elif job.attempts >= job.max_attempts:
+            status, run_after = models.JobStatusEnum.failed, job.run_after
+        else:
+            status, run_after = models.JobStatusEnum.queued, now + timedelta(seconds=backoff(job.attempts))
+        rows.append({"job_id": job.id, "new_status": status, "new_run_after": run_after, "error": error,
+                     "finished": now if status != models.JobStatusEnum.queued else None})
+    # Only the claim that is still current may record an outcome
+    db.execute(
+        update(Job).where(Job.c.id == bindparam("job_id"), Job.c.claimed_by == token)
+        .values(status=bindparam("new_status"), run_after=bindparam("new_run_after"),
+                last_error=bindparam("error"), finished_at=bindparam("finished")),
+        rows,
+    )
+    db.commit()
+
+
+def run_pending(session_factory: Callable[[], Session], executor: Optional[Executor] = None,
+                parallelism: int = 1, limit: int = BATCH_SIZE) -> int:
+    """
+    Claims one batch of due jobs, runs it (inline, or split across `executor`) and records
+    the outcome with retry and exponential backoff. Returns how many jobs were claimed.
+    """
+    db = session_factory()
+    try:
+        token, jobs = claim(db, limit)
+        if not jobs:
+            return 0
+        by_kind: Dict[str, List[models.Job]] = defaultdict(list)
+        for job in jobs:
+            by_kind[job.kind].append(job)
+
+        parts = []
+        done_jobs, done_errors = [], []
+        with _Heartbeat(session_factory, token):
+            for kind, group in by_kind.items():
+                if kind not in _handlers:
+                    parts.append((group, ([f"Unknown job kind: {kind}"] * len(group), 0.0)))
+                    continue
+                size = -(-len(group) // max(1, parallelism))
+                for start in range(0, len(group), size):
+                    chunk = group[start:start + size]
+                    payloads = [job.payload for job in chunk]
+                    if executor is None:
+                        outcome = execute(session_factory, kind, payloads)
+                    elif isinstance(executor, ProcessPoolExecutor):
+                        outcome = executor.submit(_execute_in_child, kind, payloads)
+                    else:
+                        outcome = executor.submit(execute, session_factory, kind, payloads)
+                    parts.append((chunk, outcome))
+
+            for chunk, outcome in parts:
+                errors, seconds = outcome if isinstance(outcome, tuple) else outcome.result()
+                _counters.record(chunk, errors, seconds)
+                done_jobs.extend(chunk)
+                done_errors.extend(errors)
+        _finish(db, token, done_jobs, done_errors)
+        return len(jobs)
+    finally:
+        db.close()
+
+
+def drain(db: Session, limit: int = BATCH_SIZE) -> int:
+    """Runs every due job of the caller's database inline; used by tests and `python jobs.py --once`."""
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+    total = 0
+    while True:
+        ran = run_pending(session_factory, limit=limit)
+        if not ran:
+            return total
+        total += ran
+
+
+def get_job(db: Session, job_id: int) -> Optional[models.Job]:
+    return db.get(models.Job, job_id)
+
+
+def stats(db: Session) -> schemas.JobStats:
+    Job = models.Job
+    now = utcnow()
+    counts = dict(db.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+    due, oldest = db.execute(
+        select(func.count(), func.min(Job.run_after))
+        .where(Job.status == models.JobStatusEnum.queued, Job.run_after <= now)
+    ).one()
+    finished = _counters.completed + _counters.retried
+    return schemas.JobStats(
+        queued=counts.get(models.JobStatusEnum.queued, 0),
+        due=due,
+        running=counts.get(models.JobStatusEnum.running, 0),
+        done=counts.get(models.JobStatusEnum.done, 0),
+        failed=counts.get(models.JobStatusEnum.failed, 0),
+        oldest_due_age_seconds=round((now - oldest).total_seconds(), 3) if oldest else 0.0,
+        completed=_counters.completed,
+        retried=_counters.retried,
+        avg_wait_ms=round(_counters.total_wait / finished * 1000, 3) if finished else 0.0,
+        avg_run_ms=round(_counters.total_run / finished * 1000, 3) if finished else 0.0,
+        max_run_ms=round(_counters.max_run * 1000, 3),
+    )
+
+
+class _Worker(threading.Thread):
+    def __init__(self, session_factory: sessionmaker, executor: Executor, parallelism: int, interval: float):
+        super().__init__(name="job-worker", daemon=True)
+        self.session_factory = session_factory
+        self.executor = executor
+        self.parallelism = parallelism
+        self.interval = interval
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                ran = run_pending(self.session_factory, self.executor, self.parallelism)
+            except Exception:
+                logger.exception("Job worker could not claim a batch")
+                ran = 0
+            if not ran:
+                _wake.wait(self.interval)
+                _wake.clear()
+
+
+_worker: Optional[_Worker] = None
+
+
+def start(session_factory: sessionmaker, workers: int = WORKERS, executor: str = EXECUTOR,
+          interval: float = POLL_INTERVAL):
+    global _worker
+    if workers <= 0 or (_worker is not None and _worker.is_alive()):
+        return
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    _worker = _Worker(session_factory, pool_class(max_workers=workers), workers, interval)
+    _worker.start()
+
+
+def shutdown():
+    """Stops claiming new jobs and waits for the running batch; unfinished jobs stay queued."""
+    global _worker
+    if _worker is not None:
+        _worker.stopping.set()
+        _wake.set()
+        _worker.join()
+        _worker.executor.shutdown(wait=True)
+        _worker = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run queued background jobs outside the API process.")
+    parser.add_argument("--once", action="store_true", help="Drain the jobs that are due, then exit")
+    parser.add_argument("--workers", type=int, default=max(WORKERS, 1))
+    parser.add_argument("--executor", choices=["thread", "process"], default=EXECUTOR)
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal
+
+    if args.once:
+        db = SessionLocal()
+        try:
+            print(f"Ran {drain(db)} jobs.")
+        finally:
+            db.close()
+        return
+    start(SessionLocal, args.workers, args.executor)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,37 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import List, Literal, Optional, Union
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
+import datetime
+import tempfile
+import zipfile
 
-import models, schemas, crud
-from database import SessionLocal, engine
+from sqlalchemy.exc import IntegrityError
 
-models.Base.metadata.create_all(bind=engine)
+import models, schemas, crud, async_crud, adaptive, analytics, archive, autosave, coherence, dedup, export, grading, importer, jobs, metrics, migrations, mock_cache, pagination, search, session_views, warmup
+from async_crud import AnySession
+from database import DB_MODE, AsyncReadSessionLocal, AsyncSessionLocal, ReadSessionLocal, SessionLocal
 
-app = FastAPI()
+archive.install()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Importing the app touches no database; the schema is brought up to date here (see warmup.py)
+    await run_in_threadpool(warmup.migrate)
+    warmup.state.reset()
+    warming = asyncio.create_task(warmup.run())
+    autosave.start()
+    jobs.start(SessionLocal)
+    yield
+    warming.cancel()
+    # Nothing buffered may be lost on shutdown
+    autosave.shutdown()
+    jobs.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS to allow requests from your React frontend
 app.add_middleware(
@@ -18,56 +41,410 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so the latency includes every other middleware
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.install()
 
 # Dependency
-def get_db():
+# Handlers on get_db may use this worker's caches, so other workers' writes are replayed first (coherence.py)
+def get_sync_db():
     db = SessionLocal()
     try:
+        coherence.refresh(db)
         yield db
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        if coherence.feed_for(db).due():
+            await async_crud.run(db, coherence.refresh)
+        yield db
+
+def get_sync_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+# Handlers go through async_crud, which accepts either session flavour
+get_db = get_async_db if DB_MODE == "async" else get_sync_db
+# Read-only handlers that go straight to the tables use the read pool. Those served from
+# in-process indexes or caches (keyed by engine) stay on get_db, so they share the writers' copy.
+get_read_db = get_async_read_db if DB_MODE == "async" else get_sync_read_db
+
+def get_after_id(cursor: Optional[str] = None) -> Optional[int]:
+    """Decodes the opaque `cursor` query parameter used by keyset-paginated listings."""
+    try:
+        return pagination.decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def get_session_renderer(view: Literal["summary", "candidate", "reviewer", "full"] = session_views.DEFAULT_VIEW,
+                         fields: Optional[str] = None):
+    """Resolves ?view= and the comma-separated ?fields= projection of session responses."""
+    try:
+        return session_views.renderer(view, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def upload_format(request: Request, format: Optional[str] = None) -> str:
+    fmt = format or importer.detect_format(content_type=request.headers.get("content-type"))
+    if fmt not in ("csv", "xlsx"):
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'xlsx'")
+    return fmt
+
+async def spool_upload(request: Request, upload):
+    """Copies the raw request body into `upload` (a spooled temporary file) and rewinds it."""
+    async for chunk in request.stream():
+        upload.write(chunk)
+    upload.seek(0)
+
+# Documents every shape a session response can take; the body itself is pre-rendered JSON
+SessionResponse = Union[schemas.MockSession, schemas.SessionReviewerView, schemas.SessionCandidateView,
+                        schemas.SessionSummary]
+
+def set_next_cursor(response: Response, items, limit: int, key: str = "id"):
+    cursor = pagination.next_cursor(items, limit, key)
+    if cursor:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = cursor
+    return items
+
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Mock Test Module API is running"}
 
+@app.get("/ready", response_model=schemas.ReadinessReport)
+async def read_readiness(response: Response):
+    # 503 until this worker has warmed up, so it only gets traffic once it is fast
+    report = warmup.state.report()
+    if not report.ready:
+        response.status_code = 503
+    return report
+
 @app.post("/tech-stacks/", response_model=schemas.TechStack)
-def create_tech_stack(stack: schemas.TechStackCreate, db: Session = Depends(get_db)):
-    db_stack = crud.get_tech_stack_by_name(db, stack.name)
+async def create_tech_stack(stack: schemas.TechStackCreate, db: AnySession = Depends(get_db)):
+    db_stack = await async_crud.get_tech_stack_by_name(db, stack.name)
     if db_stack:
         raise HTTPException(status_code=409, detail="Tech stack with this name already exists")
-    return crud.create_tech_stack(db=db, stack=stack) # This will now always create a new one
+    return await async_crud.create_tech_stack(db, stack=stack, response_model=schemas.TechStack) # This will now always create a new one
 
-@app.get("/tech-stacks/", response_model=List[schemas.TechStack])
-def read_tech_stacks(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_tech_stacks(db, skip=skip, limit=limit)
+@app.get("/tech-stacks/", response_model=List[schemas.TechStackSummary], response_model_exclude_unset=True)
+async def read_tech_stacks(response: Response, skip: int = 0, limit: int = 100, include: Optional[str] = None,
+                           after_id: Optional[int] = Depends(get_after_id), db: AnySession = Depends(get_read_db)):
+    # Stacks are listed with counts only; pass ?include=questions to embed the full question list
+    if include not in (None, "questions"):
+        raise HTTPException(status_code=400, detail="include only supports 'questions'")
+    stacks = await async_crud.get_tech_stack_summaries(db, skip=skip, limit=limit, after_id=after_id,
+                                                       include_questions=include == "questions")
+    return set_next_cursor(response, stacks, limit)
 
 @app.post("/questions/", response_model=schemas.Question)
-def create_question(question: schemas.QuestionCreate, db: Session = Depends(get_db)):
-    return crud.create_question(db=db, question=question)
+async def create_question(question: schemas.QuestionCreate, response: Response, on_duplicate: str = "warn",
+                          db: AnySession = Depends(get_db)):
+    # Near-duplicates of existing questions are listed in a header (warn), refused (reject) or ignored (allow)
+    if on_duplicate not in ("warn", "reject", "allow"):
+        raise HTTPException(status_code=400, detail="on_duplicate must be 'warn', 'reject' or 'allow'")
+    duplicates = []
+    if on_duplicate != "allow":
+        duplicates = await async_crud.run(db, dedup.find_duplicates, question.question_text)
+    if duplicates and on_duplicate == "reject":
+        raise HTTPException(status_code=409, detail={
+            "message": "Question is a near-duplicate of existing questions",
+            "duplicates": [match.model_dump() for match in duplicates],
+        })
+    if duplicates:
+        response.headers["X-Near-Duplicates"] = ",".join(str(match.question_id) for match in duplicates)
+    return await async_crud.create_question(db, question=question, response_model=schemas.Question)
+
+@app.get("/questions/duplicates", response_model=List[schemas.DuplicateCluster])
+async def read_duplicate_clusters(skip: int = 0, limit: int = 100, min_size: int = 2,
+                                  db: AnySession = Depends(get_db)):
+    return await async_crud.run(db, dedup.duplicate_report, skip=skip, limit=limit, min_size=max(min_size, 2))
+
+@app.post("/questions/bulk", response_model=schemas.BulkImportResult)
+async def bulk_import_questions(request: Request, format: Optional[str] = None, tech_stack: Optional[str] = None,
+                                db: AnySession = Depends(get_db)):
+    """
+    Imports a CSV or .xlsx file sent as the raw request body.
+    The upload is spooled to disk instead of being held in memory, then streamed into the database in chunks.
+    """
+    fmt = upload_format(request, format)
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as upload:
+        await spool_upload(request, upload)
+        try:
+            return await async_crud.run(
+                db, importer.import_questions, importer.read_rows(upload, fmt), default_tech_stack=tech_stack
+            )
+        except (ValueError, zipfile.BadZipFile) as e:
+            await async_crud.run(db, lambda session: session.rollback())
+            raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/questions/search", response_model=List[schemas.QuestionSearchHit])
+async def search_questions(q: str, skip: int = 0, limit: int = 20, tech_stack_id: Optional[int] = None,
+                           topic: Optional[str] = None, prefix: bool = False, db: AnySession = Depends(get_read_db)):
+    # Ranked full-text search; `term*` or prefix=true (search-as-you-type) matches prefixes
+    try:
+        return await async_crud.run(db, search.search_questions, q, skip=skip, limit=limit,
+                                    tech_stack_id=tech_stack_id, topic=topic, prefix=prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/questions/", response_model=List[schemas.Question])
-def read_questions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_questions(db, skip=skip, limit=limit)
+async def read_questions(response: Response, skip: int = 0, limit: int = 100, tech_stack_id: Optional[int] = None,
+                         topic: Optional[str] = None, after_id: Optional[int] = Depends(get_after_id),
+                         db: AnySession = Depends(get_read_db)):
+    questions = await async_crud.get_questions(db, skip=skip, limit=limit, after_id=after_id,
+                                               tech_stack_id=tech_stack_id, topic=topic,
+                                               response_model=List[schemas.Question])
+    return set_next_cursor(response, questions, limit)
+
+@app.get("/candidates/", response_model=List[schemas.Candidate])
+async def read_candidates(response: Response, skip: int = 0, limit: int = 100,
+                          after_id: Optional[int] = Depends(get_after_id), db: AnySession = Depends(get_read_db)):
+    candidates = await async_crud.get_candidates(db, skip=skip, limit=limit, after_id=after_id,
+                                                 response_model=List[schemas.Candidate])
+    return set_next_cursor(response, candidates, limit)
+
+@app.post("/candidates/", response_model=schemas.Candidate)
+async def create_candidate(candidate: schemas.CandidateCreate, db: AnySession = Depends(get_db)):
+    if await async_crud.get_candidate_by_email(db, candidate.email):
+        raise HTTPException(status_code=409, detail="Candidate with this email already exists")
+    return await async_crud.create_candidate(db, candidate, response_model=schemas.Candidate)
+
+@app.post("/candidates/bulk", response_model=schemas.CandidateImportResult)
+async def bulk_import_candidates(request: Request, format: Optional[str] = None,
+                                 on_duplicate: Literal["skip", "update"] = "skip", db: AnySession = Depends(get_db)):
+    """
+    Imports candidates from a CSV or .xlsx file sent as the raw request body, a chunk per transaction.
+    Rows that fail validation or repeat a registered email are listed in `errors` by row number.
+    """
+    fmt = upload_format(request, format)
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as upload:
+        await spool_upload(request, upload)
+        try:
+            return await async_crud.run(
+                db, importer.import_candidates, importer.read_rows(upload, fmt, importer.CANDIDATE_COLUMNS),
+                on_duplicate=on_duplicate,
+            )
+        except (ValueError, zipfile.BadZipFile) as e:
+            await async_crud.run(db, lambda session: session.rollback())
+            raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/candidates/{candidate_id}", response_model=schemas.Candidate)
+async def read_candidate(candidate_id: int, db: AnySession = Depends(get_read_db)):
+    candidate = await async_crud.get_candidate(db, candidate_id, response_model=schemas.Candidate)
+    if candidate is None:
+        raise HTTPException(status_code=404, detail="Candidate not found")
+    return candidate
+
+@app.patch("/candidates/{candidate_id}", response_model=schemas.Candidate)
+async def update_candidate(candidate_id: int, changes: schemas.CandidateUpdate, db: AnySession = Depends(get_db)):
+    try:
+        candidate = await async_crud.update_candidate(db, candidate_id, changes, response_model=schemas.Candidate)
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Candidate with this email already exists")
+    if candidate is None:
+        raise HTTPException(status_code=404, detail="Candidate not found")
+    return candidate
+
+@app.delete("/candidates/{candidate_id}", status_code=204)
+async def delete_candidate(candidate_id: int, db: AnySession = Depends(get_db)):
+    try:
+        deleted = await async_crud.delete_candidate(db, candidate_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Candidate not found")
+    return Response(status_code=204)
 
 @app.post("/mocks/generate", response_model=schemas.Mock)
-def generate_mock(mock_data: schemas.MockCreateFromStacks, db: Session = Depends(get_db)):
-    return crud.create_mock_from_stacks(db=db, mock_data=mock_data)
+async def generate_mock(mock_data: schemas.MockCreateFromStacks, db: AnySession = Depends(get_db)):
+    mock = await async_crud.create_mock_from_stacks(db, mock_data=mock_data, response_model=schemas.Mock)
+    # Candidates open a new mock right after it is generated, so prime the cache now
+    mock_cache.cache_for(db).put(mock.id, mock_cache.serialize_mock(mock))
+    return mock
+
+@app.post("/mocks/generate/batch", response_model=schemas.MockBatchResult)
+async def generate_mock_batch(batch: schemas.MockBatchCreate, db: AnySession = Depends(get_db)):
+    # A whole hiring drive in one transaction, with question exposure balanced across it
+    try:
+        return await async_crud.create_mock_batch(db, batch=batch)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/mocks/{mock_id}", response_model=schemas.Mock)
-def read_mock(mock_id: int, db: Session = Depends(get_db)):
-    db_mock = crud.get_mock(db, mock_id=mock_id)
-    if db_mock is None:
+async def read_mock(mock_id: int, request: Request, db: AnySession = Depends(get_db)):
+    # Mocks never change after generation: serve the cached JSON and answer revalidations with 304
+    entry = await mock_cache.cache_for(db).get_or_load(
+        mock_id, lambda: async_crud.run(db, mock_cache.load_mock, mock_id)
+    )
+    if entry is None:
         raise HTTPException(status_code=404, detail="Mock not found")
-    return db_mock
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if mock_cache.etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
 
-@app.post("/sessions/", response_model=schemas.MockSession)
-def create_session(session: schemas.MockSessionCreate, db: Session = Depends(get_db)):
-    return crud.create_mock_session(db=db, session_data=session)
+@app.post("/sessions/", response_model=SessionResponse)
+async def create_session(session: schemas.MockSessionCreate, render=Depends(get_session_renderer),
+                         db: AnySession = Depends(get_db)):
+    body = await async_crud.create_mock_session(db, session_data=session, load=render)
+    return Response(content=body, media_type="application/json")
+
+@app.post("/sessions/adaptive", response_model=schemas.AdaptiveStep)
+async def start_adaptive_session(data: schemas.AdaptiveSessionCreate, db: AnySession = Depends(get_db)):
+    try:
+        return await async_crud.run(db, adaptive.start_session, data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/sessions/{session_id}/submit", response_model=schemas.MockSession)
-def submit_session(session_id: int, answers: List[schemas.SessionAnswerCreate], db: Session = Depends(get_db)):
-    db_session = crud.submit_session(db=db, session_id=session_id, answers=answers)
-    if db_session is None:
+@app.post("/sessions/{session_id}/next-question", response_model=schemas.AdaptiveStep)
+async def next_question(session_id: int, answer: Optional[schemas.SessionAnswerCreate] = None,
+                        db: AnySession = Depends(get_db)):
+    # The answer to the question being asked, if any; it is graded before the next one is picked
+    try:
+        step = await async_crud.run(db, adaptive.next_question, session_id, answer)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if step is None:
+        raise HTTPException(status_code=404, detail="Adaptive session not found")
+    if step.finished:
+        jobs.notify()
+    return step
+
+@app.post("/adaptive/calibrate", response_model=schemas.Job, status_code=202)
+async def queue_calibration(db: AnySession = Depends(get_db)):
+    return await async_crud.run(db, adaptive.queue_calibration, response_model=schemas.Job)
+
+@app.get("/sessions/{session_id}", response_model=SessionResponse)
+async def read_session(session_id: int, render=Depends(get_session_renderer), db: AnySession = Depends(get_read_db)):
+    body = await async_crud.run(db, render, session_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    return db_session
\ No newline at end of file
+    return Response(content=body, media_type="application/json")
+
+@app.patch("/sessions/{session_id}/answers", response_model=schemas.AutosaveResult, status_code=202)
+async def autosave_answers(session_id: int, answers: List[schemas.SessionAnswerCreate],
+                           db: AnySession = Depends(get_db)):
+    # Only a primary-key read happens here; the answers are written behind in batches
+    status = await async_crud.run(db, crud.get_session_status, session_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if status == models.MockStatusEnum.completed:
+        raise HTTPException(status_code=409, detail="Session already submitted")
+    buffer = autosave.buffer_for(db)
+    accepted = buffer.put(session_id, answers)
+    return schemas.AutosaveResult(session_id=session_id, buffered=accepted, pending=buffer.depth)
+
+@app.get("/autosave/stats", response_model=schemas.AutosaveStats)
+async def read_autosave_stats(db: AnySession = Depends(get_db)):
+    return autosave.buffer_for(db).stats()
+
+@app.post("/sessions/{session_id}/submit", response_model=SessionResponse)
+async def submit_session(session_id: int, answers: List[schemas.SessionAnswerCreate],
+                         idempotency_key: Optional[str] = Header(None), render=Depends(get_session_renderer),
+                         db: AnySession = Depends(get_db)):
+    # Autosaved answers land first so the submitted ones override them
+    await async_crud.run(db, autosave.flush_session, session_id)
+    # Clients may retry with the same Idempotency-Key header; only the first submit writes
+    try:
+        body = await async_crud.submit_session(db, session_id=session_id, answers=answers,
+                                               idempotency_key=idempotency_key, load=render)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if body is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    # Autosaves accepted while the submit ran belong to a finished session now
+    autosave.discard_session(db, session_id)
+    jobs.notify()
+    return Response(content=body, media_type="application/json")
+
+@app.post("/sessions/{session_id}/grade", response_model=schemas.GradingReport)
+async def grade_session(session_id: int, db: AnySession = Depends(get_db)):
+    report = await async_crud.run(db, grading.grade_session, session_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return report
+
+@app.post("/mocks/{mock_id}/grade", response_model=schemas.GradingReport)
+async def grade_mock(mock_id: int, db: AnySession = Depends(get_db)):
+    # Grades every completed session of the mock in one batch
+    return await async_crud.run(db, grading.grade_mock, mock_id)
+
+@app.get("/jobs/stats", response_model=schemas.JobStats)
+async def read_job_stats(db: AnySession = Depends(get_read_db)):
+    return await async_crud.run(db, jobs.stats)
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+async def read_job(job_id: int, db: AnySession = Depends(get_read_db)):
+    job = await async_crud.run(db, jobs.get_job, job_id, response_model=schemas.Job)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/analytics/questions", response_model=List[schemas.QuestionStats])
+async def read_question_stats(response: Response, tech_stack_id: Optional[int] = None, skip: int = 0,
+                              limit: int = 100, after_id: Optional[int] = Depends(get_after_id),
+                              db: AnySession = Depends(get_read_db)):
+    # Maintained on submit and grading; a page is an index range scan, however many answers exist
+    stats = await async_crud.run(db, analytics.get_question_stats, tech_stack_id=tech_stack_id, skip=skip,
+                                 limit=limit, after_id=after_id)
+    return set_next_cursor(response, stats, limit, key="question_id")
+
+@app.get("/analytics/questions/{question_id}", response_model=schemas.QuestionStats)
+async def read_question_stat(question_id: int, db: AnySession = Depends(get_read_db)):
+    stats = await async_crud.run(db, analytics.get_question_stat, question_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No answers recorded for this question")
+    return stats
+
+@app.get("/analytics/stacks", response_model=List[schemas.StackStats])
+async def read_stack_stats(db: AnySession = Depends(get_read_db)):
+    return await async_crud.run(db, analytics.get_stack_stats)
+
+@app.get("/export/sessions", response_class=StreamingResponse)
+async def export_sessions(format: Literal["csv", "ndjson", "parquet"] = "csv",
+                          status: Union[models.MockStatusEnum, Literal["any"]] = models.MockStatusEnum.completed,
+                          date_from: Optional[datetime.datetime] = None, date_to: Optional[datetime.datetime] = None,
+                          mock_id: Optional[int] = None, tech_stack_id: Optional[int] = None,
+                          db: AnySession = Depends(get_read_db)):
+    # One row per answer, streamed off a server-side cursor: memory stays flat however much is exported
+    try:
+        encoder = export.encoder_for(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stream = export.stream_for(db, encoder, status=None if status == "any" else status, date_from=date_from,
+                               date_to=date_to, mock_id=mock_id, tech_stack_id=tech_stack_id)
+    return StreamingResponse(stream, media_type=export.FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="sessions.{format}"'})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics(db: AnySession = Depends(get_db)):
+    # Prometheus text format; the gauges are refreshed from their owners at scrape time
+    buffer = autosave.buffer_for(db)
+    metrics.AUTOSAVE_DEPTH.set(buffer.depth)
+    metrics.AUTOSAVE_FLUSHES.set(buffer.flushes)
+    metrics.AUTOSAVE_FAILED_FLUSHES.set(buffer.failed_flushes)
+    job_stats = await async_crud.run(db, jobs.stats)
+    for status in ("queued", "due", "running", "done", "failed"):
+        metrics.JOBS.set(getattr(job_stats, status), status)
+    metrics.JOBS_OLDEST_DUE_SECONDS.set(job_stats.oldest_due_age_seconds)
+    cache = mock_cache.cache_for(db)
+    metrics.MOCK_CACHE_ENTRIES.set(len(cache))
+    metrics.MOCK_CACHE_BYTES.set(cache.size_bytes)
+    metrics.MOCK_CACHE_LOOKUPS.set(cache.hits, "hit")
+    metrics.MOCK_CACHE_LOOKUPS.set(cache.misses, "miss")
+    feed = coherence.feed_for(db)
+    metrics.COHERENCE_CHANGES.set(feed.applied)
+    metrics.COHERENCE_RESETS.set(feed.resets)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/slow-queries", response_model=List[schemas.SlowQuery])
+async def read_slow_queries():
+    return metrics.slow_queries()
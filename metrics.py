@@ -0,0 +1,280 @@
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import schemas
+
+# In-process request and database instrumentation, rendered in the Prometheus text format
+# on /metrics. An ASGI middleware times every request under its route template (never the
+# raw path, which would give one series per id), and cursor events on every Engine add each
+# statement's count and time to the request it ran for. Recording is a bisect and a few
+# additions under a lock, cheap enough to leave on in production.
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged and kept in a ring buffer (/metrics/slow-queries)
+SLOW_QUERY_SECONDS = float(os.getenv("MOCKTEST_SLOW_QUERY_MS", "100")) / 1000
+SLOW_QUERY_LOG_SIZE = int(os.getenv("MOCKTEST_SLOW_QUERY_LOG_SIZE", "100"))
+# Adds a Server-Timing header (app, db time and statement count) to every response
+SERVER_TIMING = os.getenv("MOCKTEST_SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+UNMATCHED_ROUTE = "<unmatched>"
+MAX_STATEMENT_CHARS = 2000
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per combination of label values."""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> per-bucket counts (last slot is +Inf), then sum and count
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(series[0]), series[1], series[2]) for labels, series in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket_labels = _labels(self.label_names, labels, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in values)
+        return lines
+
+
+class Gauge(Counter):
+    """Point-in-time values, set by whoever owns them just before a scrape."""
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Request latency by route template.",
+                            ("method", "route", "status"))
+REQUEST_QUERIES = Histogram("http_request_db_queries", "SQL statements executed per request.",
+                            ("method", "route"), QUERY_BUCKETS)
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Time spent executing SQL per request.",
+                               ("method", "route"))
+QUERY_SECONDS = Histogram("db_query_duration_seconds", "Latency of every SQL statement, including background work.")
+SLOW_QUERIES = Counter("db_slow_queries_total", "Statements slower than the slow-query threshold.", ("route",))
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served.")
+
+AUTOSAVE_DEPTH = Gauge("autosave_pending_answers", "Answers buffered and not yet written.")
+AUTOSAVE_FLUSHES = Gauge("autosave_flushes", "Autosave flushes since start.")
+AUTOSAVE_FAILED_FLUSHES = Gauge("autosave_failed_flushes", "Autosave flushes that failed since start.")
+JOBS = Gauge("jobs", "Background jobs by status.", ("status",))
+JOBS_OLDEST_DUE_SECONDS = Gauge("jobs_oldest_due_age_seconds", "Age of the oldest job waiting for a worker.")
+MOCK_CACHE_ENTRIES = Gauge("mock_cache_entries", "Mock payloads held in memory.")
+MOCK_CACHE_BYTES = Gauge("mock_cache_bytes", "Size of the cached mock payloads.")
+MOCK_CACHE_LOOKUPS = Gauge("mock_cache_lookups", "Mock cache lookups since start.", ("result",))
+COHERENCE_CHANGES = Gauge("cache_coherence_changes", "Other workers' writes replayed into the local caches since start.")
+COHERENCE_RESETS = Gauge("cache_coherence_resets", "Local caches dropped because the change log had moved on.")
+
+REGISTRY = [
+    REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS, IN_FLIGHT, QUERY_SECONDS, SLOW_QUERIES,
+    AUTOSAVE_DEPTH, AUTOSAVE_FLUSHES, AUTOSAVE_FAILED_FLUSHES, JOBS, JOBS_OLDEST_DUE_SECONDS,
+    MOCK_CACHE_ENTRIES, MOCK_CACHE_BYTES, MOCK_CACHE_LOOKUPS, COHERENCE_CHANGES, COHERENCE_RESETS,
+]
+
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        # Starlette stores the matched route in the scope once routing ran
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+# Copied into threadpool calls and greenlets, so statements run for a request find its stats
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+_slow: Deque[schemas.SlowQuery] = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    QUERY_SECONDS.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    if elapsed >= SLOW_QUERY_SECONDS:
+        _record_slow(statement, elapsed, stats)
+
+
+def _record_slow(statement: str, elapsed: float, stats: Optional[RequestStats]):
+    route = stats.route if stats is not None else "<background>"
+    statement = " ".join(statement.split())[:MAX_STATEMENT_CHARS]
+    SLOW_QUERIES.inc(1, route)
+    _slow.append(schemas.SlowQuery(statement=statement, duration_ms=round(elapsed * 1000, 3), route=route,
+                                   at=datetime.now(timezone.utc)))
+    logger.warning("Slow query (%.1f ms) in %s: %s", elapsed * 1000, route, statement)
+
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install():
+    """Listens to the cursor events of every Engine, including ones created later (async engines too)."""
+    global _installed
+    with _install_lock:
+        if not _installed:
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+            _installed = True
+
+
+def slow_queries() -> List[schemas.SlowQuery]:
+    """The most recent slow statements, newest first."""
+    return list(reversed(_slow))
+
+
+def reset():
+    for metric in REGISTRY:
+        metric.clear()
+    _slow.clear()
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no per-request task or body buffering like BaseHTTPMiddleware)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        status = [500]
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if SERVER_TIMING:
+                    elapsed = (time.perf_counter() - started) * 1000
+                    timing = (f'app;dur={elapsed:.1f}, db;dur={stats.db_seconds * 1000:.1f};'
+                              f'desc="{stats.queries} queries"')
+                    message.setdefault("headers", []).append((b"server-timing", timing.encode()))
+            await send(message)
+
+        IN_FLIGHT.inc(1)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.inc(-1)
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            method, route = scope["method"], stats.route
+            REQUEST_SECONDS.observe(elapsed, method, route, status[0])
+            REQUEST_QUERIES.observe(stats.queries, method, route)
+            REQUEST_DB_SECONDS.observe(stats.db_seconds, method, route)
@@ -0,0 +1,151 @@
+import argparse
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.sql import func
+
+# `Base.metadata.create_all` only creates missing tables; it never alters existing ones.
+# Changes to tables that already exist in deployed databases (sql_app.db) are applied
+# here as numbered, idempotent steps, recorded in `schema_migrations`.
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations", _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def _unique_session_answers(conn: Connection):
+    # Keep the latest answer of any duplicated (session, question) pair before enforcing uniqueness
+    conn.exec_driver_sql(
+        "DELETE FROM session_answers WHERE id NOT IN ("
+        " SELECT MAX(id) FROM session_answers GROUP BY mock_session_id, question_id)"
+    )
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_session_answers_session_question"
+        " ON session_answers (mock_session_id, question_id)"
+    )
+
+
+def _question_search_index(conn: Connection):
+    import search
+
+    search.migrate(conn)
+
+
+def _analytics_backfill(conn: Connection):
+    import analytics, models
+
+    for model in (models.QuestionStat, models.StackStat):
+        model.__table__.create(conn, checkfirst=True)
+    # Count the answers already submitted before analytics existed
+    if all(inspect(conn).has_table(name) for name in ("session_answers", "mock_sessions", "questions")):
+        analytics.rebuild(conn)
+
+
+def _join_table_keys(conn: Connection):
+    import models
+
+    if inspect(conn).has_table("mock_questions") and \
+            not inspect(conn).get_pk_constraint("mock_questions")["constrained_columns"]:
+        # A primary key cannot be added to an existing SQLite table: copy the distinct pairs into a keyed one
+        conn.exec_driver_sql("ALTER TABLE mock_questions RENAME TO mock_questions_unkeyed")
+        models.mock_questions.create(conn)
+        conn.exec_driver_sql(
+            "INSERT INTO mock_questions (mock_id, question_id)"
+            " SELECT DISTINCT mock_id, question_id FROM mock_questions_unkeyed"
+            " WHERE mock_id IS NOT NULL AND question_id IS NOT NULL"
+        )
+        conn.exec_driver_sql("DROP TABLE mock_questions_unkeyed")
+    # Foreign-key indexes of tables that predate them
+    for table in (models.mock_questions, models.Question.__table__, models.MockSession.__table__,
+                  models.SessionAnswer.__table__):
+        if inspect(conn).has_table(table.name):
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def _session_ids_autoincrement(conn: Connection):
+    import models
+
+    table = models.MockSession.__table__
+    if conn.dialect.name != "sqlite" or not inspect(conn).has_table(table.name):
+        return
+    ddl = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'mock_sessions'").scalar()
+    if "AUTOINCREMENT" in ddl.upper():
+        return
+    # Without AUTOINCREMENT SQLite reuses the largest id once its row is deleted, as archiving does.
+    # It cannot be added to an existing table: copy the rows into a new one. The new table is
+    # renamed into place, not the old one out of it, so the references to it stay as they are.
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    columns = ", ".join(column.name for column in table.columns if column.name in existing)
+    conn.exec_driver_sql(str(CreateTable(table).compile(dialect=conn.dialect))
+                         .replace("CREATE TABLE mock_sessions ", "CREATE TABLE mock_sessions_autoincrement ", 1))
+    conn.exec_driver_sql(f"INSERT INTO mock_sessions_autoincrement ({columns}) SELECT {columns} FROM mock_sessions")
+    conn.exec_driver_sql("DROP TABLE mock_sessions")
+    conn.exec_driver_sql("ALTER TABLE mock_sessions_autoincrement RENAME TO mock_sessions")
+    for index in table.indexes:
+        index.create(conn)
+
+
+def _job_heartbeats(conn: Connection):
+    if inspect(conn).has_table("jobs") and \
+            "heartbeat_at" not in {column["name"] for column in inspect(conn).get_columns("jobs")}:
+        conn.exec_driver_sql("ALTER TABLE jobs ADD COLUMN heartbeat_at TIMESTAMP")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "unique answer per session and question", _unique_session_answers),
+    (2, "full-text question search index", _question_search_index),
+    (3, "question and stack analytics backfill", _analytics_backfill),
+    (4, "mock_questions primary key and foreign-key indexes", _join_table_keys),
+    (5, "mock session ids are never reused", _session_ids_autoincrement),
+    (6, "job heartbeats", _job_heartbeats),
+]
+
+
+def upgrade(engine: Engine) -> List[int]:
+    """Applies pending migrations in order; returns the versions applied."""
+    applied = []
+    with engine.begin() as conn:
+        _metadata.create_all(bind=conn)
+        done = set(conn.execute(select(schema_migrations.c.version)).scalars())
+        for version, name, step in MIGRATIONS:
+            if version in done:
+                continue
+            step(conn)
+            conn.execute(schema_migrations.insert().values(version=version, name=name))
+            applied.append(version)
+    return applied
+
+
+def init_db(engine: Engine) -> List[int]:
+    """Creates missing tables, then brings existing ones up to date."""
+    import models
+    import search  # registers the FTS index DDL on the questions table
+
+    # One table listing instead of a check per table, so starting up on a current schema stays cheap
+    existing = set(inspect(engine).get_table_names())
+    missing = [table for name, table in models.Base.metadata.tables.items() if name not in existing]
+    if missing:
+        models.Base.metadata.create_all(bind=engine, tables=missing)
+    return upgrade(engine)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create missing tables and apply pending schema migrations.")
+    parser.parse_args(argv)
+
+    from database import engine
+
+    applied = init_db(engine)
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Set
+
+from sqlalchemy.orm import Session, selectinload
+
+import models, schemas
+
+# Mocks are immutable once generated, so their JSON is serialized once and served
+# from memory with a strong ETag until a mock (or one of its questions) is edited.
+
+MAX_BYTES = int(os.getenv("MOCKTEST_MOCK_CACHE_BYTES", str(64 * 1024 * 1024)))
+MAX_ENTRIES = int(os.getenv("MOCKTEST_MOCK_CACHE_ENTRIES", "10000"))
+
+
+class CachedPayload:
+    __slots__ = ("body", "etag", "question_ids")
+
+    def __init__(self, body: bytes, question_ids: Iterable[int]):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.question_ids: FrozenSet[int] = frozenset(question_ids)
+
+
+class PayloadCache:
+    """
+    Size-bounded LRU of pre-serialized payloads.
+    Concurrent misses for one key share a single load (single flight), and every
+    invalidation bumps a generation so a load that raced with it is not stored.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES, max_entries: int = MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, CachedPayload]" = OrderedDict()
+        self._by_question: Dict[int, Set[int]] = {}
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.size_bytes = 0
+        self.hits = self.misses = self.loads = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: int) -> Optional[CachedPayload]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: int, entry: CachedPayload, generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if len(entry.body) > self.max_bytes:
+                return
+            self._remove(key)
+            self._entries[key] = entry
+            self.size_bytes += len(entry.body)
+            for question_id in entry.question_ids:
+                self._by_question.setdefault(question_id, set()).add(key)
+            while self.size_bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: int):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size_bytes -= len(entry.body)
+        for question_id in entry.question_ids:
+            keys = self._by_question.get(question_id)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._by_question[question_id]
+
+    def invalidate(self, key: int):
+        with self._lock:
+            self._generation += 1
+            self._remove(key)
+
+    def invalidate_question(self, question_id: int):
+        """Drops every cached mock that contains the question."""
+        with self._lock:
+            self._generation += 1
+            for key in list(self._by_question.get(question_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_question.clear()
+            self.size_bytes = 0
+
+    async def get_or_load(self, key: int, loader: Callable[[], Awaitable[Optional[CachedPayload]]]):
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark a failure as retrieved even when no other request was waiting on it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            self.loads += 1
+            entry = await loader()
+            if entry is not None:
+                self.put(key, entry, generation)
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._inflight[key]
+
+
+def load_mock(db: Session, mock_id: int) -> Optional[CachedPayload]:
+    """Loads a mock with its questions in one eager query and serializes it once."""
+    db_mock = (db.query(models.Mock).options(selectinload(models.Mock.questions))
+               .filter(models.Mock.id == mock_id).first())
+    if db_mock is None:
+        return None
+    return serialize_mock(schemas.Mock.model_validate(db_mock))
+
+
+def serialize_mock(mock: schemas.Mock) -> CachedPayload:
+    return CachedPayload(mock.model_dump_json().encode(), (q.id for q in mock.questions))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+_caches: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+
+
+def cache_for(db) -> PayloadCache:
+    """Returns the mock payload cache for the database the (sync or async) session is bound to."""
+    bind = db.get_bind()
+    with _registry_lock:
+        cache = _caches.get(bind)
+        if cache is None:
+            cache = _caches[bind] = PayloadCache()
+        return cache
+
+
+# Invalidation hooks for code paths that edit a mock or a question after generation.
+
+def mock_changed(db, mock_id: int):
+    cache = _caches.get(db.get_bind())
+    if cache is not None:
+        cache.invalidate(mock_id)
+
+
+def question_changed(db, question_id: int):
+    cache = _caches.get(db.get_bind())
+    if cache is not None:
+        cache.invalidate_question(question_id)
@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Enum, Text, Table
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Enum, Float, Text, Table, Index, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -14,10 +14,18 @@ class CorrectnessEnum(str, enum.Enum):
     incorrect = "Incorrect"
     partial = "Partial"
 
+class JobStatusEnum(str, enum.Enum):
+    queued = "Queued"
+    running = "Running"
+    done = "Done"
+    failed = "Failed"
+
 # Association table for Mock <-> Question (Many-to-Many)
 mock_questions = Table('mock_questions', Base.metadata,
-    Column('mock_id', Integer, ForeignKey('mocks.id')),
-    Column('question_id', Integer, ForeignKey('questions.id'))
+    # A question appears in a mock once; the key also serves "questions of a mock" lookups
+    Column('mock_id', Integer, ForeignKey('mocks.id'), primary_key=True),
+    Column('question_id', Integer, ForeignKey('questions.id'), primary_key=True),
+    Index('ix_mock_questions_question', 'question_id'),
 )
 
 class TechStack(Base):
@@ -26,10 +34,14 @@ class TechStack(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
     
-    questions = relationship("Question", back_populates="tech_stack")
+    questions = relationship("Question", back_populates="tech_stack", order_by="Question.id")
 
 class Question(Base):
     __tablename__ = "questions"
+    __table_args__ = (
+        # Listing and counting a stack's questions, optionally by topic
+        Index("ix_questions_stack_topic", "tech_stack_id", "topic"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     question_text = Column(Text, nullable=False)
@@ -65,6 +77,13 @@ class Candidate(Base):
 
 class MockSession(Base):
     __tablename__ = "mock_sessions"
+    __table_args__ = (
+        # A mock's sessions by status (grading a mock), and a candidate's sessions
+        Index("ix_mock_sessions_mock_status", "mock_id", "status"),
+        Index("ix_mock_sessions_candidate", "candidate_id"),
+        # AUTOINCREMENT on SQLite, so the ids of archived sessions are never handed out again
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     candidate_id = Column(Integer, ForeignKey("candidates.id"))
@@ -81,6 +100,12 @@ class MockSession(Base):
 
 class SessionAnswer(Base):
     __tablename__ = "session_answers"
+    __table_args__ = (
+        # One answer per question per session; submissions and autosaves upsert against it
+        Index("ux_session_answers_session_question", "mock_session_id", "question_id", unique=True),
+        # The unique index above covers lookups by session; this one those by question
+        Index("ix_session_answers_question", "question_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     mock_session_id = Column(Integer, ForeignKey("mock_sessions.id"))
@@ -89,4 +114,105 @@ class SessionAnswer(Base):
     correctness = Column(Enum(CorrectnessEnum), nullable=True)
 
     session = relationship("MockSession", back_populates="answers")
-    question = relationship("Question")
\ No newline at end of file
+    question = relationship("Question")
+
+class SubmissionReceipt(Base):
+    """Remembers Idempotency-Key values so a retried submit is answered without writing again."""
+    __tablename__ = "submission_receipts"
+
+    idempotency_key = Column(String, primary_key=True)
+    mock_session_id = Column(Integer, ForeignKey("mock_sessions.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Job(Base):
+    """Background work queued in the same database, drained by the in-process worker (see jobs.py)."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # The worker polls for queued jobs that are due
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(Enum(JobStatusEnum), default=JobStatusEnum.queued, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=5, nullable=False)
+    last_error = Column(Text, nullable=True)
+    claimed_by = Column(String, nullable=True)
+    # Set from Python (naive UTC) rather than server_default, so they compare with the worker's clock
+    run_after = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    # Renewed by the worker while it runs the job; a running job whose heartbeat stops is claimed again
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class QuestionStat(Base):
+    """Answer and grade counts of one question over completed sessions, kept current by analytics.py."""
+    __tablename__ = "question_stats"
+    __table_args__ = (
+        Index("ix_question_stats_stack_question", "tech_stack_id", "question_id"),
+    )
+
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    tech_stack_id = Column(Integer, ForeignKey("tech_stacks.id"))
+    answers = Column(Integer, default=0, nullable=False)
+    correct = Column(Integer, default=0, nullable=False)
+    partial = Column(Integer, default=0, nullable=False)
+    incorrect = Column(Integer, default=0, nullable=False)
+
+class StackStat(Base):
+    """Per tech stack totals, plus the sum of per-session scores behind the candidate average."""
+    __tablename__ = "stack_stats"
+
+    tech_stack_id = Column(Integer, ForeignKey("tech_stacks.id"), primary_key=True)
+    answers = Column(Integer, default=0, nullable=False)
+    correct = Column(Integer, default=0, nullable=False)
+    partial = Column(Integer, default=0, nullable=False)
+    incorrect = Column(Integer, default=0, nullable=False)
+    # Completed sessions with at least one graded answer in the stack, and the sum of their scores
+    scored_sessions = Column(Integer, default=0, nullable=False)
+    score_sum = Column(Float, default=0.0, nullable=False)
+
+class QuestionCalibration(Base):
+    """Two-parameter logistic IRT parameters of a question, fitted from graded answers by adaptive.calibrate."""
+    __tablename__ = "question_calibrations"
+
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    # How sharply the chance of a correct answer rises with ability, and the ability at which it is even
+    discrimination = Column(Float, nullable=False)
+    difficulty = Column(Float, nullable=False)
+    responses = Column(Integer, nullable=False)
+    calibrated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class AdaptiveSession(Base):
+    """A session whose questions are picked one at a time from its stacks (adaptive.py)."""
+    __tablename__ = "adaptive_sessions"
+
+    mock_session_id = Column(Integer, ForeignKey("mock_sessions.id"), primary_key=True)
+    tech_stack_ids = Column(JSON, nullable=False)
+    max_questions = Column(Integer, nullable=False)
+    target_standard_error = Column(Float, nullable=False)
+    ability = Column(Float, default=0.0, nullable=False)
+    standard_error = Column(Float, default=1.0, nullable=False)
+    # Served and not answered yet
+    current_question_id = Column(Integer, ForeignKey("questions.id"), nullable=True)
+
+class EntityVersion(Base):
+    """One write to data that workers cache in memory, replayed by the other workers (coherence.py)."""
+    __tablename__ = "entity_versions"
+    __table_args__ = (
+        # Old rows are pruned by age
+        Index("ix_entity_versions_changed_at", "changed_at"),
+        # AUTOINCREMENT on SQLite, so versions keep rising after old rows are pruned
+        {"sqlite_autoincrement": True},
+    )
+
+    version = Column(Integer, primary_key=True)
+    entity = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=True)
+    # The process that made the change, which has already applied it to its own caches
+    origin = Column(String, nullable=False)
+    # Set from Python (naive UTC), like the job timestamps
+    changed_at = Column(DateTime, nullable=False)
@@ -0,0 +1,44 @@
+import base64
+import binascii
+import json
+from typing import Optional, Sequence
+
+# Keyset pagination: a page is "rows with id > last id seen", ordered by id.
+# Unlike OFFSET, SQLite can seek straight to that id through the primary key,
+# so every page costs the same no matter how deep it is.
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(last_id: int) -> str:
+    raw = json.dumps({"after": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """Returns the id to continue after, or raises ValueError for a malformed token."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        after = json.loads(base64.urlsafe_b64decode(padded.encode()))["after"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(after, int):
+        raise ValueError("Invalid pagination cursor")
+    return after
+
+
+def next_cursor(items: Sequence, limit: int, key: str = "id") -> Optional[str]:
+    """A full page may have a successor; a short page is the last one. `key` names the items' id attribute."""
+    if limit <= 0 or len(items) < limit:
+        return None
+    return encode_cursor(getattr(items[-1], key))
+
+
+def paginate(query, id_column, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    """Applies keyset paging when a cursor is given, otherwise the legacy skip/limit paging."""
+    query = query.order_by(id_column)
+    if after_id is not None:
+        return query.filter(id_column > after_id).limit(limit)
+    return query.offset(skip).limit(limit)
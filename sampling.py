@@ -0,0 +1,240 @@
+import random
+import threading
+import weakref
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+
+
+class _Pool:
+    """A list of question ids with O(1) add/discard (swap-remove) and O(k) sampling."""
+
+    __slots__ = ("ids", "positions")
+
+    def __init__(self):
+        self.ids: List[int] = []
+        self.positions: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, question_id: int):
+        if question_id not in self.positions:
+            self.positions[question_id] = len(self.ids)
+            self.ids.append(question_id)
+
+    def discard(self, question_id: int):
+        position = self.positions.pop(question_id, None)
+        if position is None:
+            return
+        last = self.ids.pop()
+        if position < len(self.ids):
+            self.ids[position] = last
+            self.positions[last] = position
+
+
+def _draw_positions(total: int, k: int, rng: random.Random) -> List[int]:
+    """Picks k distinct positions out of range(total) in expected O(k) time."""
+    if k * 2 > total:
+        return rng.sample(range(total), k)
+    seen = set()
+    positions = []
+    while len(positions) < k:
+        position = rng.randrange(total)
+        if position not in seen:
+            seen.add(position)
+            positions.append(position)
+    return positions
+
+
+class QuestionIndex:
+    """
+    In-memory question-id index per tech stack and per (tech stack, topic).
+    It is built once with a single column-only query and then kept current by
+    the crud/import write paths, so mock generation never has to load a whole stack.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stacks: Dict[int, _Pool] = {}
+        self._topics: Dict[Tuple[int, Optional[str]], _Pool] = {}
+        self._placement: Dict[int, Tuple[int, Optional[str]]] = {}
+        # Adds (question_id, placement) and discards (question_id, None) that arrive while a build
+        # reads the table; the build may or may not see them, so it replays them once it is done
+        self._pending: Optional[List[Tuple[int, Optional[Tuple[int, Optional[str]]]]]] = None
+        self._builds = 0
+        self.built = False
+
+    def build(self, db: Session):
+        with self._lock:
+            if self._pending is None:
+                self._pending = []
+            start = len(self._pending)
+            self._builds += 1
+        try:
+            rows = db.execute(
+                select(models.Question.id, models.Question.tech_stack_id, models.Question.topic)
+                .execution_options(yield_per=10000)
+            )
+            with self._lock:
+                self._stacks.clear()
+                self._topics.clear()
+                self._placement.clear()
+                for question_id, stack_id, topic in rows:
+                    self._add(question_id, stack_id, topic)
+                for question_id, placement in self._pending[start:]:
+                    if placement is None:
+                        self._discard(question_id)
+                    else:
+                        self._add(question_id, *placement)
+                self.built = True
+        finally:
+            with self._lock:
+                self._builds -= 1
+                if not self._builds:
+                    self._pending = None
+
+    def _add(self, question_id: int, stack_id: int, topic: Optional[str]):
+        if question_id in self._placement:
+            self._discard(question_id)
+        self._stacks.setdefault(stack_id, _Pool()).add(question_id)
+        self._topics.setdefault((stack_id, topic), _Pool()).add(question_id)
+        self._placement[question_id] = (stack_id, topic)
+
+    def _discard(self, question_id: int):
+        placement = self._placement.pop(question_id, None)
+        if placement is None:
+            return
+        self._stacks[placement[0]].discard(question_id)
+        self._topics[placement].discard(question_id)
+
+    def add(self, question_id: int, stack_id: int, topic: Optional[str] = None):
+        self.add_many([(question_id, stack_id, topic)])
+
+    def add_many(self, rows: Iterable[Tuple[int, int, Optional[str]]]):
+        with self._lock:
+            for question_id, stack_id, topic in rows:
+                if self._pending is not None:
+                    self._pending.append((question_id, (stack_id, topic)))
+                self._add(question_id, stack_id, topic)
+
+    def discard(self, question_id: int):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((question_id, None))
+            self._discard(question_id)
+
+    def tracking(self) -> bool:
+        """True once changes matter: the index is built, or a build is reading the table."""
+        return self.built or self._pending is not None
+
+    def count(self, stack_id: int, topic: Optional[str] = None) -> int:
+        pool = self._stacks.get(stack_id) if topic is None else self._topics.get((stack_id, topic))
+        return len(pool) if pool else 0
+
+    def sample(self, stack_id: int, k: int, topics: Optional[Sequence[str]] = None,
+               rng: Optional[random.Random] = None) -> List[int]:
+        """
+        Draws up to k distinct question ids from a stack, optionally restricted to some topics.
+        Several topic pools are treated as one virtual concatenated list, so nothing is copied.
+        """
+        rng = rng or random
+        with self._lock:
+            if topics:
+                pools = [self._topics[(stack_id, t)] for t in dict.fromkeys(topics) if (stack_id, t) in self._topics]
+            else:
+                pools = [self._stacks[stack_id]] if stack_id in self._stacks else []
+            total = sum(len(pool) for pool in pools)
+            if k <= 0 or total == 0:
+                return []
+            picked = []
+            for position in _draw_positions(total, min(k, total), rng):
+                for pool in pools:
+                    if position < len(pool):
+                        picked.append(pool.ids[position])
+                        break
+                    position -= len(pool)
+            return picked
+
+    def ids(self, stack_id: int, topics: Optional[Sequence[str]] = None) -> List[int]:
+        """A copy of every question id in a stack, optionally restricted to some topics."""
+        with self._lock:
+            if topics:
+                return [question_id for t in dict.fromkeys(topics) if (stack_id, t) in self._topics
+                        for question_id in self._topics[(stack_id, t)].ids]
+            return list(self._stacks[stack_id].ids) if stack_id in self._stacks else []
+
+
+class ExposureDeck:
+    """
+    Deals hands of question ids from a pool in shuffled rounds, like cards: no id is dealt a
+    second time before every other id was dealt once, so across a cohort of mocks each question
+    is used about equally often. An id whose cluster (see dedup) is already in the hand is held
+    back for the next hand rather than skipped, so the balance survives duplicate avoidance.
+    """
+
+    def __init__(self, ids: Iterable[int], rng: Optional[random.Random] = None):
+        self.ids = list(ids)
+        self.rng = rng or random.Random()
+        self._deck: deque = deque()
+
+    def deal(self, k: int, cluster_of: Callable[[int], int], clusters: Set[int]) -> List[int]:
+        """Up to k ids whose clusters are not in `clusters` (which the hand's clusters are added to)."""
+        hand, held = [], []
+        # Looking at every id of the pool once is enough to know the hand cannot be filled
+        for _ in range(len(self.ids)):
+            if len(hand) == k:
+                break
+            if not self._deck:
+                order = self.ids[:]
+                self.rng.shuffle(order)
+                self._deck.extend(order)
+            question_id = self._deck.popleft()
+            cluster = cluster_of(question_id)
+            if cluster in clusters:
+                held.append(question_id)
+                continue
+            clusters.add(cluster)
+            hand.append(question_id)
+        self._deck.extendleft(reversed(held))
+        return hand
+
+
+_indexes: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+
+
+def index_for(db: Session) -> QuestionIndex:
+    """Returns the (lazily built) index for the database the session is bound to."""
+    bind = db.get_bind()
+    with _registry_lock:
+        index = _indexes.get(bind)
+        if index is None:
+            index = _indexes[bind] = QuestionIndex()
+    if not index.built:
+        index.build(db)
+    return index
+
+
+def questions_added(db: Session, rows: Iterable[Tuple[int, int, Optional[str]]]):
+    """Feeds freshly committed (id, tech_stack_id, topic) rows into a built or building index."""
+    index = _indexes.get(db.get_bind())
+    if index is not None and index.tracking():
+        index.add_many(rows)
+
+
+def forget(db: Session):
+    """Drops the index of the session's database; it is rebuilt from the tables on next use."""
+    with _registry_lock:
+        _indexes.pop(db.get_bind(), None)
+
+
+def questions_removed(db: Session, question_ids: Iterable[int]):
+    index = _indexes.get(db.get_bind())
+    if index is not None and index.tracking():
+        for question_id in question_ids:
+            index.discard(question_id)
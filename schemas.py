@@ -1,11 +1,11 @@
 from __future__ import annotations
 
 import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel, EmailStr, ConfigDict
+from pydantic import BaseModel, EmailStr, ConfigDict, field_validator
 
-from models import CorrectnessEnum, MockStatusEnum
+from models import CorrectnessEnum, JobStatusEnum, MockStatusEnum
 
 
 # Pydantic models (or "schemas") are used for data validation and serialization.
@@ -25,6 +25,40 @@ class Question(QuestionBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class QuestionSearchHit(Question):
+    score: float
+
+class DuplicateMatch(BaseModel):
+    question_id: int
+    similarity: float
+
+class DuplicateCluster(BaseModel):
+    cluster_id: int
+    size: int
+    questions: List[Question]
+
+
+# --- Bulk Import Schemas ---
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class BulkImportResult(BaseModel):
+    inserted: int
+    skipped: int
+    stacks_created: int
+    elapsed_seconds: float
+    rows_per_second: float
+    errors: List[ImportRowError] = []
+
+class CandidateImportResult(BaseModel):
+    inserted: int
+    updated: int
+    skipped: int
+    elapsed_seconds: float
+    rows_per_second: float
+    errors: List[ImportRowError] = []
+
 
 # --- TechStack Schemas ---
 class TechStackBase(BaseModel):
@@ -39,6 +73,13 @@ class TechStack(TechStackBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class TechStackSummary(TechStackBase):
+    """Lean listing entry; `questions` is only set when explicitly requested."""
+    id: int
+    question_count: int = 0
+    topic_counts: Dict[str, int] = {}
+    questions: Optional[List[Question]] = None
+
 
 # --- Mock Schemas ---
 class MockBase(BaseModel):
@@ -56,6 +97,8 @@ class MockCreateFromStacks(BaseModel):
     tech_stack_ids: List[int]
     # We can add more config here, e.g., number of questions per stack
     num_questions: Optional[int] = 10
+    # Optionally restrict every stack to these topics
+    topics: Optional[List[str]] = None
 
 class Mock(MockBase):
     id: int
@@ -64,6 +107,33 @@ class Mock(MockBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class MockBatchCreate(BaseModel):
+    """Schema for generating a cohort of mocks: one per candidate, or `count` of them."""
+    name: str
+    description: Optional[str] = None
+    tech_stack_ids: List[int]
+    num_questions: int = 10
+    topics: Optional[List[str]] = None
+    candidate_ids: Optional[List[int]] = None
+    count: Optional[int] = None
+    # Also start a (scheduled) session per candidate
+    create_sessions: bool = False
+    seed: Optional[int] = None
+
+class GeneratedMock(BaseModel):
+    mock_id: int
+    candidate_id: Optional[int] = None
+    session_id: Optional[int] = None
+    question_ids: List[int]
+
+class MockBatchResult(BaseModel):
+    mocks: List[GeneratedMock]
+    questions_used: int
+    # Times the least and the most used question of the eligible pool was picked
+    min_exposure: int
+    max_exposure: int
+    elapsed_seconds: float
+
 
 # --- Candidate Schemas ---
 class CandidateBase(BaseModel):
@@ -76,6 +146,25 @@ class CandidateBase(BaseModel):
 class CandidateCreate(CandidateBase):
     pass
 
+class CandidateImportRow(CandidateBase):
+    # The bulk importer validates addresses itself, checking each domain only once
+    email: str
+
+class CandidateUpdate(BaseModel):
+    # Omitted fields are left alone; name and email may be changed but not cleared
+    name: Optional[str] = None
+    email: Optional[EmailStr] = None
+    profile_exp: Optional[str] = None
+    passing_year: Optional[int] = None
+    graduation_details: Optional[str] = None
+
+    @field_validator("name", "email")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may not be null")
+        return value
+
 class Candidate(CandidateBase):
     id: int
     created_at: datetime.datetime
@@ -99,6 +188,131 @@ class SessionAnswer(SessionAnswerBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+# --- Autosave Schemas ---
+class AutosaveResult(BaseModel):
+    session_id: int
+    buffered: int
+    pending: int
+
+class AutosaveStats(BaseModel):
+    depth: int
+    saves: int
+    coalesced: int
+    flushes: int
+    flushed_rows: int
+    failed_flushes: int
+    # Saves dropped because their session had been submitted
+    discarded: int = 0
+    last_flush_ms: float
+    avg_flush_ms: float
+    max_flush_ms: float
+
+
+# --- Grading Schemas ---
+class GradingReport(BaseModel):
+    sessions: int
+    answers: int
+    graded: int
+    result: str
+    elapsed_seconds: float
+
+
+# --- Job Schemas ---
+class Job(BaseModel):
+    id: int
+    kind: str
+    payload: dict
+    status: JobStatusEnum
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str] = None
+    run_after: datetime.datetime
+    created_at: datetime.datetime
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class JobStats(BaseModel):
+    queued: int
+    due: int
+    running: int
+    done: int
+    failed: int
+    oldest_due_age_seconds: float
+    completed: int
+    retried: int
+    avg_wait_ms: float
+    avg_run_ms: float
+    max_run_ms: float
+
+
+
+# --- Analytics Schemas ---
+class QuestionStats(BaseModel):
+    question_id: int
+    tech_stack_id: Optional[int] = None
+    answers: int
+    graded: int
+    correct: int
+    partial: int
+    incorrect: int
+    # correct / graded
+    pass_rate: Optional[float] = None
+
+class StackStats(BaseModel):
+    tech_stack_id: int
+    answers: int
+    graded: int
+    correct: int
+    partial: int
+    incorrect: int
+    pass_rate: Optional[float] = None
+    scored_sessions: int
+    # Mean per-session score in the stack (correct 1, partially correct 0.5)
+    average_score: Optional[float] = None
+
+class AnalyticsRebuildReport(BaseModel):
+    sessions: int
+    answers: int
+    questions: int
+    stacks: int
+    mismatches: int
+    elapsed_seconds: float
+
+# --- Archive Schemas ---
+class ArchiveReport(BaseModel):
+    sessions: int
+    answers: int
+    # JSON size of the archived answers before and after compression
+    raw_bytes: int
+    stored_bytes: int
+    elapsed_seconds: float
+    sessions_per_second: float
+
+class CompactionReport(BaseModel):
+    bytes_before: int
+    bytes_after: int
+    elapsed_seconds: float
+
+# --- Metrics Schemas ---
+class SlowQuery(BaseModel):
+    statement: str
+    duration_ms: float
+    route: str
+    at: datetime.datetime
+
+# --- Readiness Schemas ---
+class ReadinessReport(BaseModel):
+    ready: bool
+    # Seconds each warm-up step took, in the order they ran
+    steps: Dict[str, float]
+    attempts: int
+    elapsed_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
 # --- MockSession Schemas ---
 class MockSessionBase(BaseModel):
     candidate_id: int
@@ -118,4 +332,75 @@ class MockSession(MockSessionBase):
     candidate: Candidate
     mock: Mock
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+# --- Session View Schemas ---
+# Slim variants of MockSession (?view=), each loaded with column queries only.
+class SessionSummary(BaseModel):
+    id: int
+    candidate_id: int
+    mock_id: int
+    session_date: datetime.datetime
+    status: MockStatusEnum
+
+class CandidateQuestion(BaseModel):
+    """A question as the candidate sees it: never the ideal answer."""
+    id: int
+    question_text: str
+    topic: Optional[str] = None
+
+class CandidateMock(BaseModel):
+    id: int
+    name: Optional[str] = None
+    description: Optional[str] = None
+    questions: List[CandidateQuestion] = []
+
+class CandidateAnswer(BaseModel):
+    question_id: int
+    candidate_answer: Optional[str] = None
+
+class SessionCandidateView(SessionSummary):
+    mock: Optional[CandidateMock] = None
+    answers: List[CandidateAnswer] = []
+
+class ReviewedQuestion(BaseModel):
+    """One mock question side by side with the candidate's answer and its grade."""
+    question_id: int
+    question_text: str
+    topic: Optional[str] = None
+    ideal_answer: Optional[str] = None
+    candidate_answer: Optional[str] = None
+    correctness: Optional[CorrectnessEnum] = None
+
+class SessionReviewerView(SessionSummary):
+    overall_result: Optional[str] = None
+    soft_skills_feedback: Optional[str] = None
+    coding_feedback: Optional[str] = None
+    candidate: Optional[Candidate] = None
+    questions: List[ReviewedQuestion] = []
+
+
+# --- Adaptive Schemas ---
+class AdaptiveSessionCreate(BaseModel):
+    candidate_id: int
+    tech_stack_ids: List[int]
+    # The test ends after this many answers, or once the ability estimate is this precise
+    max_questions: int = 15
+    target_standard_error: float = 0.35
+
+class AdaptiveStep(BaseModel):
+    session_id: int
+    # The question to answer next; None once the test is finished
+    question: Optional[CandidateQuestion] = None
+    answered: int
+    ability: float
+    standard_error: float
+    last_correctness: Optional[CorrectnessEnum] = None
+    finished: bool
+
+class CalibrationReport(BaseModel):
+    sessions: int
+    answers: int
+    questions: int
+    elapsed_seconds: float
@@ -0,0 +1,149 @@
+import os
+import re
+from typing import List, Optional
+
+from sqlalchemy import column, event, func, inspect, literal_column, or_, select, table
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+import models, schemas
+
+# Question search runs on an SQLite FTS5 index over question_text, topic and ideal_answer.
+# It is an external-content table: it stores only the inverted index and reads the text back
+# from `questions`, and triggers keep it in step with every insert, update and delete
+# (including the importer's Core inserts). Other databases fall back to a LIKE scan.
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# bm25 has to read the whole posting list of every term, so its cost grows with how many
+# questions match. Queries matching more than BROAD_QUERY questions (think "python" in a
+# Python bank), after the stack and topic filters, are not ranked: they return the newest
+# matches first with a score of 0. Narrower queries return their RANK_WINDOW best-ranked
+# matches, and paging ends there: a page past RANK_WINDOW is empty.
+BROAD_QUERY = int(os.getenv("MOCKTEST_SEARCH_BROAD_QUERY", "10000"))
+RANK_WINDOW = int(os.getenv("MOCKTEST_SEARCH_RANK_WINDOW", "1000"))
+
+# bm25 column weights: a hit in the question itself outranks one in the topic or ideal answer
+RANK = "bm25(10.0, 4.0, 1.0)"
+
+_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+    " question_text, topic, ideal_answer,"
+    " content='questions', content_rowid='id',"
+    " tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"INSERT INTO questions_fts(questions_fts, rank) VALUES ('rank', '{RANK}')",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_ai AFTER INSERT ON questions BEGIN"
+    " INSERT INTO questions_fts(rowid, question_text, topic, ideal_answer)"
+    " VALUES (new.id, new.question_text, new.topic, new.ideal_answer); END",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_ad AFTER DELETE ON questions BEGIN"
+    " INSERT INTO questions_fts(questions_fts, rowid, question_text, topic, ideal_answer)"
+    " VALUES ('delete', old.id, old.question_text, old.topic, old.ideal_answer); END",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_au AFTER UPDATE ON questions BEGIN"
+    " INSERT INTO questions_fts(questions_fts, rowid, question_text, topic, ideal_answer)"
+    " VALUES ('delete', old.id, old.question_text, old.topic, old.ideal_answer);"
+    " INSERT INTO questions_fts(rowid, question_text, topic, ideal_answer)"
+    " VALUES (new.id, new.question_text, new.topic, new.ideal_answer); END",
+]
+
+questions_fts = table("questions_fts", column("rowid"), column("rank"))
+
+
+def install(conn: Connection, rebuild: bool = False):
+    """Creates the FTS table and its triggers on SQLite; `rebuild` indexes rows that already exist."""
+    if conn.dialect.name != "sqlite":
+        return
+    for statement in _DDL:
+        conn.exec_driver_sql(statement)
+    if rebuild:
+        conn.exec_driver_sql("INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')")
+
+
+def drop_triggers(conn: Connection):
+    """For bulk loads: stop per-row indexing; `install(conn, rebuild=True)` restores it afterwards."""
+    if conn.dialect.name == "sqlite":
+        for suffix in ("ai", "ad", "au"):
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS questions_fts_{suffix}")
+
+
+@event.listens_for(models.Question.__table__, "after_create")
+def _create_index(target, conn, **kw):
+    install(conn)
+
+
+@event.listens_for(models.Question.__table__, "before_drop")
+def _drop_index(target, conn, **kw):
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("DROP TABLE IF EXISTS questions_fts")
+
+
+def migrate(conn: Connection):
+    # Databases created before search existed: index their questions once
+    if inspect(conn).has_table("questions"):
+        install(conn, rebuild=True)
+
+
+def match_expression(query: str, prefix: bool = False) -> str:
+    """
+    Turns free text into an FTS5 query of quoted terms that must all match, so user input
+    can never be parsed as FTS syntax. A trailing `*`, or `prefix` for the last term
+    (search-as-you-type), makes a term match as a prefix. Prefixes of common words expand
+    to large posting lists, which is why it is opt-in.
+    """
+    terms = []
+    for match in TOKEN_RE.finditer(query):
+        starred = query[match.end():match.end() + 1] == "*"
+        terms.append('"' + match.group() + '"' + ("*" if starred else ""))
+    if not terms:
+        raise ValueError("Search query has no searchable terms")
+    if prefix and not terms[-1].endswith("*"):
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _is_broad(db: Session, expression: str, filters: list) -> bool:
+    # Counting stops at the threshold, which is cheap because no ranking is involved
+    probe = select(questions_fts.c.rowid)
+    if filters:
+        probe = probe.join(models.Question, models.Question.id == questions_fts.c.rowid).where(*filters)
+    probe = probe.where(literal_column("questions_fts").match(expression)).limit(BROAD_QUERY + 1).subquery()
+    return db.execute(select(func.count()).select_from(probe)).scalar() > BROAD_QUERY
+
+
+def search_questions(db: Session, query: str, skip: int = 0, limit: int = 20, tech_stack_id: Optional[int] = None,
+                     topic: Optional[str] = None, prefix: bool = False) -> List[schemas.QuestionSearchHit]:
+    """
+    Returns questions matching every term, best bm25 rank first, down to the RANK_WINDOW best
+    (see BROAD_QUERY for very unspecific queries). Raises ValueError for an empty query.
+    """
+    expression = match_expression(query, prefix)
+    filters = []
+    if tech_stack_id is not None:
+        filters.append(models.Question.tech_stack_id == tech_stack_id)
+    if topic is not None:
+        filters.append(models.Question.topic == topic)
+
+    if db.get_bind().dialect.name == "sqlite" and _is_broad(db, expression, filters):
+        stmt = (select(models.Question, literal_column("0.0"))
+                .join(questions_fts, questions_fts.c.rowid == models.Question.id)
+                .where(literal_column("questions_fts").match(expression), *filters)
+                .order_by(questions_fts.c.rowid.desc()))
+    elif db.get_bind().dialect.name == "sqlite":
+        window = select(questions_fts.c.rowid.label("question_id"), questions_fts.c.rank.label("rank"))
+        if filters:
+            window = window.join(models.Question, models.Question.id == questions_fts.c.rowid).where(*filters)
+        window = (window.where(literal_column("questions_fts").match(expression))
+                  .order_by(questions_fts.c.rank).limit(RANK_WINDOW).subquery())
+        stmt = (select(models.Question, window.c.rank)
+                .join(window, window.c.question_id == models.Question.id)
+                .order_by(window.c.rank, models.Question.id))
+    else:
+        stmt = select(models.Question, literal_column("0.0")).where(*filters)
+        for term in TOKEN_RE.findall(query):
+            pattern = f"%{term}%"
+            stmt = stmt.where(or_(models.Question.question_text.ilike(pattern), models.Question.topic.ilike(pattern),
+                                  models.Question.ideal_answer.ilike(pattern)))
+        stmt = stmt.order_by(models.Question.id)
+    rows = db.execute(stmt.offset(skip).limit(limit)).all()
+    # bm25 is lower-is-better; report a score where higher is better
+    return [schemas.QuestionSearchHit(**schemas.Question.model_validate(question).model_dump(), score=-rank)
+            for question, rank in rows]
@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine
-import models, schemas, crud
+import models, schemas, crud, migrations
 
 def seed_data():
     db = SessionLocal()
@@ -40,5 +40,5 @@ def seed_data():
     db.close()
 
 if __name__ == "__main__":
-    models.Base.metadata.create_all(bind=engine)
+    migrations.init_db(engine)
     seed_data()
\ No newline at end of file
@@ -0,0 +1,164 @@
+import functools
+from typing import Callable, Optional, Set
+
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import and_, select
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+import archive, crud, models, schemas
+
+# A session can be returned in several shapes (?view=), and `fields=` narrows any of them to
+# some of its top-level fields. Every view has its own loader that selects only the columns
+# it serializes and skips the nested parts a projection leaves out. The result is dumped to
+# JSON bytes by pydantic-core inside the database call, so routes hand the bytes straight to
+# the response instead of validating and encoding the object a second time.
+
+VIEWS = {
+    "summary": schemas.SessionSummary,
+    "candidate": schemas.SessionCandidateView,
+    "reviewer": schemas.SessionReviewerView,
+    "full": schemas.MockSession,
+}
+# Ideal answers only go out when a reviewer or full view is asked for explicitly
+DEFAULT_VIEW = "candidate"
+
+# Everything below is read from typed columns, so views are built with model_construct
+# rather than validated again field by field.
+
+
+def parse_fields(view: str, fields: Optional[str]) -> Optional[Set[str]]:
+    """Turns `a,b` into a set of the view's top-level fields, always including `id`. Raises ValueError."""
+    if view not in VIEWS:
+        raise ValueError(f"view must be one of: {', '.join(VIEWS)}")
+    if fields is None:
+        return None
+    wanted = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = wanted - VIEWS[view].model_fields.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields for the {view} view: {', '.join(sorted(unknown))}")
+    return wanted | {"id"}
+
+
+def _wants(fields: Optional[Set[str]], name: str) -> bool:
+    return fields is None or name in fields
+
+
+def _session_columns(db: Session, session_id: int, model, fields: Optional[Set[str]]) -> Optional[dict]:
+    table = models.MockSession.__table__
+    columns = [table.c[name] for name in model.model_fields if name in table.c and _wants(fields, name)]
+    row = db.execute(select(*columns).where(table.c.id == session_id)).first()
+    return dict(row._mapping) if row else None
+
+
+def _mock_id(session_id: int):
+    return select(models.MockSession.mock_id).where(models.MockSession.id == session_id).scalar_subquery()
+
+
+def load_summary(db: Session, session_id: int, fields: Optional[Set[str]] = None) -> Optional[schemas.SessionSummary]:
+    data = _session_columns(db, session_id, schemas.SessionSummary, fields)
+    return schemas.SessionSummary.model_construct(**data) if data else None
+
+
+def load_candidate_view(db: Session, session_id: int,
+                        fields: Optional[Set[str]] = None) -> Optional[schemas.SessionCandidateView]:
+    """The session as the candidate taking it sees it: questions without ideal answers, own answers only."""
+    data = _session_columns(db, session_id, schemas.SessionCandidateView, fields)
+    if data is None:
+        return None
+    if _wants(fields, "mock"):
+        Question = models.Question
+        mock = db.execute(select(models.Mock.id, models.Mock.name, models.Mock.description)
+                          .where(models.Mock.id == _mock_id(session_id))).first()
+        questions = db.execute(
+            select(Question.id, Question.question_text, Question.topic)
+            .join(models.mock_questions, models.mock_questions.c.question_id == Question.id)
+            .where(models.mock_questions.c.mock_id == _mock_id(session_id))
+        )
+        data["mock"] = schemas.CandidateMock.model_construct(
+            **mock._mapping, questions=[schemas.CandidateQuestion.model_construct(**row._mapping) for row in questions]
+        ) if mock else None
+    if _wants(fields, "answers"):
+        SessionAnswer = models.SessionAnswer
+        answers = db.execute(select(SessionAnswer.question_id, SessionAnswer.candidate_answer)
+                             .where(SessionAnswer.mock_session_id == session_id).order_by(SessionAnswer.id))
+        data["answers"] = [schemas.CandidateAnswer.model_construct(**row._mapping) for row in answers]
+    return schemas.SessionCandidateView.model_construct(**data)
+
+
+def load_reviewer_view(db: Session, session_id: int,
+                       fields: Optional[Set[str]] = None) -> Optional[schemas.SessionReviewerView]:
+    """Results, the candidate, and every mock question next to its ideal answer, the answer given and its grade."""
+    data = _session_columns(db, session_id, schemas.SessionReviewerView, fields)
+    if data is None:
+        return None
+    if _wants(fields, "candidate"):
+        Candidate = models.Candidate
+        row = db.execute(select(*Candidate.__table__.c)
+                         .join(models.MockSession, models.MockSession.candidate_id == Candidate.id)
+                         .where(models.MockSession.id == session_id)).first()
+        data["candidate"] = schemas.Candidate.model_construct(**row._mapping) if row else None
+    if _wants(fields, "questions"):
+        Question, SessionAnswer = models.Question, models.SessionAnswer
+        # Unanswered questions are listed too, with no answer and no grade
+        rows = db.execute(
+            select(Question.id.label("question_id"), Question.question_text, Question.topic, Question.ideal_answer,
+                   SessionAnswer.candidate_answer, SessionAnswer.correctness)
+            .select_from(models.mock_questions)
+            .join(Question, Question.id == models.mock_questions.c.question_id)
+            .outerjoin(SessionAnswer, and_(SessionAnswer.question_id == Question.id,
+                                           SessionAnswer.mock_session_id == session_id))
+            .where(models.mock_questions.c.mock_id == _mock_id(session_id))
+        )
+        data["questions"] = [schemas.ReviewedQuestion.model_construct(**row._mapping) for row in rows]
+    return schemas.SessionReviewerView.model_construct(**data)
+
+
+@functools.lru_cache(maxsize=None)
+def _adapter(annotation) -> TypeAdapter:
+    return TypeAdapter(annotation)
+
+
+_RELATIONSHIPS = {
+    "candidate": lambda: joinedload(models.MockSession.candidate),
+    "mock": lambda: joinedload(models.MockSession.mock).selectinload(models.Mock.questions),
+    "answers": lambda: selectinload(models.MockSession.answers),
+}
+
+
+def load_full(db: Session, session_id: int, fields: Optional[Set[str]] = None) -> Optional[schemas.MockSession]:
+    """schemas.MockSession; with a projection only the requested relationships are loaded."""
+    if fields is None:
+        db_session = crud.get_session_details(db, session_id)
+        return schemas.MockSession.model_validate(db_session) if db_session else None
+    options = [option() for name, option in _RELATIONSHIPS.items() if name in fields]
+    db_session = (db.query(models.MockSession).options(*options)
+                  .filter(models.MockSession.id == session_id).populate_existing().first())
+    if db_session is None:
+        return None
+    return schemas.MockSession.model_construct(**{
+        name: _adapter(field.annotation).validate_python(getattr(db_session, name), from_attributes=True)
+        for name, field in schemas.MockSession.model_fields.items() if name in fields
+    })
+
+
+_LOADERS = {"summary": load_summary, "candidate": load_candidate_view, "reviewer": load_reviewer_view,
+            "full": load_full}
+
+
+def load(db: Session, session_id: int, view: str = DEFAULT_VIEW,
+         fields: Optional[Set[str]] = None) -> Optional[BaseModel]:
+    return _LOADERS[view](db, session_id, fields)
+
+
+def render(db: Session, session_id: int, view: str = DEFAULT_VIEW, fields: Optional[Set[str]] = None) -> Optional[bytes]:
+    """The session in `view`, projected to `fields`, as JSON bytes (None if it does not exist)."""
+    session = load(db, session_id, view, fields)
+    if session is None:
+        # Old completed sessions are served from the archive database once moved there
+        session = archive.load(db, session_id, view)
+    return _adapter(VIEWS[view]).dump_json(session, include=fields) if session is not None else None
+
+
+def renderer(view: str = DEFAULT_VIEW, fields: Optional[str] = None) -> Callable[[Session, int], Optional[bytes]]:
+    """A `(db, session_id) -> bytes` loader for crud's session-returning functions. Raises ValueError."""
+    return functools.partial(render, view=view, fields=parse_fields(view, fields))
@@ -0,0 +1,198 @@
+import json
+import os
+from dataclasses import dataclass, field, fields, replace
+from typing import List, Mapping, Optional, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+
+# How the app connects to its database: the URL, connection pools and, on SQLite, the
+# pragmas every connection starts with. Requests that only read get an engine of their own,
+# so they never queue for a connection behind writes; on SQLite its connections are
+# query_only, and in WAL mode they read a consistent snapshot while a write commits
+# instead of waiting for it. On Postgres the read engine can point at a replica.
+#
+# Settings come from MOCKTEST_* environment variables, over an optional JSON file of the
+# same settings by field name (MOCKTEST_STORAGE_CONFIG), over the defaults below.
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+JOURNAL_MODES = ("wal", "delete", "truncate", "persist", "memory", "off")
+SYNCHRONOUS_MODES = ("off", "normal", "full", "extra")
+
+
+@dataclass(frozen=True)
+class StorageConfig:
+    url: str = field(default="sqlite:///./sql_app.db", metadata={"env": "MOCKTEST_DATABASE_URL"})
+    # Overrides the derived asyncio-driver URL (MOCKTEST_DB_MODE=async)
+    async_url: Optional[str] = field(default=None, metadata={"env": "MOCKTEST_ASYNC_DATABASE_URL"})
+    # Where read-only requests go, e.g. a Postgres replica; defaults to `url`
+    read_url: Optional[str] = field(default=None, metadata={"env": "MOCKTEST_READ_DATABASE_URL"})
+    # Where archive.py moves old completed sessions; empty turns archiving (and its lookups) off
+    archive_url: Optional[str] = field(default="sqlite:///./sql_app_archive.db",
+                                       metadata={"env": "MOCKTEST_ARCHIVE_DATABASE_URL"})
+
+    pool_size: int = field(default=10, metadata={"env": "MOCKTEST_DB_POOL_SIZE"})
+    max_overflow: int = field(default=20, metadata={"env": "MOCKTEST_DB_MAX_OVERFLOW"})
+    # 0 sends reads through the write engine's pool
+    read_pool_size: int = field(default=20, metadata={"env": "MOCKTEST_DB_READ_POOL_SIZE"})
+    read_max_overflow: int = field(default=20, metadata={"env": "MOCKTEST_DB_READ_MAX_OVERFLOW"})
+    pool_timeout: float = field(default=30.0, metadata={"env": "MOCKTEST_DB_POOL_TIMEOUT"})
+    # Seconds before a pooled connection is replaced (server-side idle timeouts); -1 never
+    pool_recycle: int = field(default=1800, metadata={"env": "MOCKTEST_DB_POOL_RECYCLE"})
+
+    journal_mode: str = field(default="wal", metadata={"env": "MOCKTEST_SQLITE_JOURNAL_MODE"})
+    # NORMAL is durable in WAL mode except for the last commits on power loss, and skips an fsync per commit
+    synchronous: str = field(default="normal", metadata={"env": "MOCKTEST_SQLITE_SYNCHRONOUS"})
+    cache_size_kib: int = field(default=65536, metadata={"env": "MOCKTEST_SQLITE_CACHE_SIZE_KIB"})
+    mmap_size: int = field(default=256 * 1024 * 1024, metadata={"env": "MOCKTEST_SQLITE_MMAP_SIZE"})
+    busy_timeout_ms: int = field(default=5000, metadata={"env": "MOCKTEST_SQLITE_BUSY_TIMEOUT_MS"})
+
+    def __post_init__(self):
+        if self.journal_mode.lower() not in JOURNAL_MODES:
+            raise ValueError(f"journal_mode must be one of: {', '.join(JOURNAL_MODES)}")
+        if self.synchronous.lower() not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of: {', '.join(SYNCHRONOUS_MODES)}")
+
+    @property
+    def is_sqlite(self) -> bool:
+        return make_url(self.url).get_backend_name() == "sqlite"
+
+    @property
+    def in_memory(self) -> bool:
+        """A private in-memory SQLite database, which only one engine can see."""
+        database = make_url(self.url).database
+        return self.is_sqlite and database in (None, "", ":memory:")
+
+    @property
+    def separate_reads(self) -> bool:
+        return self.read_pool_size > 0 and not self.in_memory
+
+
+def _convert(name: str, value):
+    kind = {f.name: f.type for f in fields(StorageConfig)}[name]
+    if kind is int:
+        return int(value)
+    if kind is float:
+        return float(value)
+    return value
+
+
+def load_config(environ: Mapping[str, str] = os.environ) -> StorageConfig:
+    """Builds the configuration from the environment over MOCKTEST_STORAGE_CONFIG. Raises ValueError."""
+    values = {}
+    path = environ.get("MOCKTEST_STORAGE_CONFIG")
+    if path:
+        with open(path) as f:
+            from_file = json.load(f)
+        unknown = from_file.keys() - {f.name for f in fields(StorageConfig)}
+        if unknown:
+            raise ValueError(f"Unknown storage settings in {path}: {', '.join(sorted(unknown))}")
+        values.update(from_file)
+    for f in fields(StorageConfig):
+        if f.metadata["env"] in environ:
+            values[f.name] = environ[f.metadata["env"]]
+    return StorageConfig(**{name: _convert(name, value) for name, value in values.items()})
+
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme.split("+")[0], scheme) + sep + rest
+
+
+def sqlite_pragmas(config: StorageConfig, read_only: bool = False) -> List[str]:
+    pragmas = [f"PRAGMA busy_timeout = {config.busy_timeout_ms}"]
+    if not config.in_memory:
+        pragmas.append(f"PRAGMA journal_mode = {config.journal_mode.upper()}")
+    pragmas += [
+        f"PRAGMA synchronous = {config.synchronous.upper()}",
+        # Negative sizes are in KiB rather than pages
+        f"PRAGMA cache_size = -{config.cache_size_kib}",
+        f"PRAGMA mmap_size = {config.mmap_size}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    return pragmas
+
+
+def _on_connect(engine: Engine, pragmas: List[str]):
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def _engine_kwargs(config: StorageConfig, read_only: bool) -> dict:
+    if config.in_memory:
+        # A single connection held by the default pool; there is nothing to size
+        return {"connect_args": {"check_same_thread": False}}
+    kwargs = {
+        "pool_size": config.read_pool_size if read_only else config.pool_size,
+        "max_overflow": config.read_max_overflow if read_only else config.max_overflow,
+        "pool_timeout": config.pool_timeout,
+        "pool_recycle": config.pool_recycle,
+    }
+    if config.is_sqlite:
+        kwargs["connect_args"] = {"check_same_thread": False, "timeout": config.busy_timeout_ms / 1000}
+    else:
+        # Drops connections the server closed (failover, idle timeouts) before handing them out
+        kwargs["pool_pre_ping"] = True
+    if read_only and not config.is_sqlite:
+        kwargs["execution_options"] = {"postgresql_readonly": True}
+    return kwargs
+
+
+def create_engines(config: StorageConfig) -> Tuple[Engine, Engine]:
+    """(write engine, read engine); they are the same engine unless reads have their own pool."""
+    engine = create_engine(config.url, **_engine_kwargs(config, read_only=False))
+    if config.is_sqlite:
+        _on_connect(engine, sqlite_pragmas(config))
+    if not config.separate_reads:
+        return engine, engine
+    read_engine = create_engine(config.read_url or config.url, **_engine_kwargs(config, read_only=True))
+    if config.is_sqlite:
+        _on_connect(read_engine, sqlite_pragmas(config, read_only=True))
+    return engine, read_engine
+
+
+def create_async_engines(config: StorageConfig):
+    """The asyncio-driver counterparts of `create_engines`."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    async_url = config.async_url or to_async_url(config.url)
+    engine = create_async_engine(async_url, **_engine_kwargs(config, read_only=False))
+    if config.is_sqlite:
+        _on_connect(engine.sync_engine, sqlite_pragmas(config))
+    if not config.separate_reads:
+        return engine, engine
+    read_url = to_async_url(config.read_url) if config.read_url else async_url
+    read_engine = create_async_engine(read_url, **_engine_kwargs(config, read_only=True))
+    if config.is_sqlite:
+        _on_connect(read_engine.sync_engine, sqlite_pragmas(config, read_only=True))
+    return engine, read_engine
+
+
+def create_archive_engine(config: StorageConfig) -> Optional[Engine]:
+    """The archive database's engine, with the same pool and pragma settings; None when archiving is off."""
+    if not config.archive_url:
+        return None
+    archive = replace(config, url=config.archive_url, async_url=None, read_url=None)
+    engine = create_engine(archive.url, **_engine_kwargs(archive, read_only=False))
+    if archive.is_sqlite:
+        _on_connect(engine, sqlite_pragmas(archive))
+    return engine
+
+
+def describe(config: StorageConfig) -> dict:
+    """The settings, with any password in the URLs masked (for logs and benchmark reports)."""
+    described = {}
+    for f in fields(config):
+        value = getattr(config, f.name)
+        if f.name.endswith("url") and value:
+            value = make_url(value).render_as_string(hide_password=True)
+        described[f.name] = value
+    return described
+
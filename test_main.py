@@ -4,10 +4,17 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool # Important for SQLite in-memory or temp files
 import tempfile
-from database import Base
-from main import app, get_db
 import os
 
+# The app's startup must leave ./sql_app.db alone: no migrations, warm-up or job worker on it.
+# Tests that need them bind them to their own database.
+for name in ("MOCKTEST_AUTO_MIGRATE", "MOCKTEST_WARMUP", "MOCKTEST_JOB_WORKERS"):
+    # setdefault: the worker processes of the multi-process test import this module with their own settings
+    os.environ.setdefault(name, "0")
+
+from database import Base
+from main import app, get_db, get_read_db
+
 # Use a temporary file for the database for each test
 @pytest.fixture(name="db_url")
 def db_url_fixture():
@@ -50,11 +57,13 @@ def test_session_fixture(test_engine):
 def client_fixture(test_session):
     # Override the get_db dependency in the FastAPI app to use our test session
     app.dependency_overrides[get_db] = lambda: test_session
+    app.dependency_overrides[get_read_db] = lambda: test_session
     # Yield the TestClient
     with TestClient(app) as c:
         yield c
     # Clean up the dependency override after the test
     app.dependency_overrides.pop(get_db)
+    app.dependency_overrides.pop(get_read_db)
 
 # Now, all your tests can simply request the 'client' fixture
 # and it will automatically provide an isolated test environment.
@@ -148,4 +157,1302 @@ def test_generate_mock():
     assert mock_data["name"] == "Test Generated Mock"
     assert "id" in mock_data
     assert len(mock_data["questions"]) == 2 # Expecting 2 questions
-    # Further checks could ensure distribution, but that's more complex for a basic test
\ No newline at end of file
+    # Further checks could ensure distribution, but that's more complex for a basic test
+
+def test_bulk_import_questions_csv(client):
+    client.post("/tech-stacks/", json={"name": "Python"})
+    csv_body = (
+        "Tech Stack,Topic,Question,Ideal Answer\n"
+        "Python,Core,What is a decorator?,A callable that wraps another callable.\n"
+        "SQL,Core,What is a JOIN?,Combines rows from two tables.\n"
+        "SQL,Core,,missing question\n"
+        "SQL,Indexes,What is a covering index?,An index holding every column a query needs.\n"
+    )
+    response = client.post("/questions/bulk", content=csv_body, headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200
+    result = response.json()
+    assert result["inserted"] == 3
+    assert result["skipped"] == 1
+    assert result["stacks_created"] == 1
+    assert result["errors"] == [{"row": 3, "error": "missing question text"}]
+
+    questions = client.get("/questions/").json()
+    assert len(questions) == 3
+    stacks = {s["name"]: s["id"] for s in client.get("/tech-stacks/").json()}
+    assert {q["tech_stack_id"] for q in questions} == {stacks["Python"], stacks["SQL"]}
+
+    # Stack ids must be whole numbers of existing stacks; bad ones are reported per row
+    csv_body = (
+        "Tech Stack Id,Question\n"
+        f"{stacks['SQL']}.0,What is a view?\n"
+        "inf,What is a trigger?\n"
+        "nan,What is a cursor?\n"
+        "1e400,What is a CTE?\n"
+        "999,What is a sequence?\n"
+        f"{stacks['SQL']}.5,What is a schema?\n"
+    )
+    result = client.post("/questions/bulk", content=csv_body, headers={"Content-Type": "text/csv"}).json()
+    assert (result["inserted"], result["skipped"]) == (1, 5)
+    assert [error["error"] for error in result["errors"]] == [
+        "invalid tech_stack_id 'inf'", "invalid tech_stack_id 'nan'", "invalid tech_stack_id '1e400'",
+        "unknown tech_stack_id 999", f"invalid tech_stack_id '{stacks['SQL']}.5'"]
+    assert len(client.get("/questions/").json()) == 4
+
+
+def test_bulk_import_questions_xlsx_default_stack(client):
+    from io import BytesIO
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["Question No", "Topic", "Question", "Ideal Answer", "correctness"])
+    sheet.append([None, None, None, "RESULT = correct: 1 | incorrect: 0", None])
+    sheet.append([1, "Python Basics", "What is Python?", "A high-level language.", "correct"])
+    sheet.append([2, "Python Basics", "What are Python data types?", "int, float, str...", "correct"])
+    workbook.create_sheet("Index").append(["Candidate name", "test type"])
+    buffer = BytesIO()
+    workbook.save(buffer)
+
+    response = client.post(
+        "/questions/bulk?tech_stack=Python",
+        content=buffer.getvalue(),
+        headers={"Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert result["inserted"] == 2
+    assert result["skipped"] == 1
+    assert [q["topic"] for q in client.get("/questions/").json()] == ["Python Basics", "Python Basics"]
+
+
+def test_generate_mock_samples_by_topic_and_sees_new_questions(client):
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    for text, topic in [("What is a decorator?", "Core"), ("What is the GIL?", "Internals"),
+                        ("How do generators save memory?", "Internals")]:
+        client.post("/questions/", json={"question_text": text, "topic": topic, "tech_stack_id": stack_id})
+
+    response = client.post("/mocks/generate", json={
+        "name": "Internals only", "tech_stack_ids": [stack_id], "num_questions": 5, "topics": ["Internals"]
+    })
+    assert response.status_code == 200
+    assert {q["topic"] for q in response.json()["questions"]} == {"Internals"}
+    assert len(response.json()["questions"]) == 2
+
+    # The index is now built; new questions must be picked up incrementally
+    client.post("/questions/", json={"question_text": "What is the MRO?", "topic": "Internals", "tech_stack_id": stack_id})
+    response = client.post("/mocks/generate", json={
+        "name": "Internals again", "tech_stack_ids": [stack_id], "num_questions": 5, "topics": ["Internals"]
+    })
+    texts = {q["question_text"] for q in response.json()["questions"]}
+    assert texts == {"What is the GIL?", "How do generators save memory?", "What is the MRO?"}
+
+
+def test_question_index_sampling_is_distinct_and_even():
+    import random
+    from sampling import QuestionIndex
+
+    index = QuestionIndex()
+    index.add_many((qid, 1 if qid <= 1000 else 2, "Core" if qid % 2 else "Advanced") for qid in range(1, 1501))
+    index.built = True
+    rng = random.Random(7)
+
+    picked = index.sample(1, 10, rng=rng)
+    assert len(picked) == len(set(picked)) == 10
+    assert all(qid <= 1000 for qid in picked)
+    assert all(qid % 2 for qid in index.sample(2, 50, topics=["Core"], rng=rng))
+
+    index.discard(1001)
+    assert index.count(2) == 499
+    assert 1001 not in index.sample(2, 499, rng=rng)
+
+
+def test_indexes_keep_changes_made_while_they_load(test_session, monkeypatch):
+    import adaptive, crud, schemas
+    from sampling import QuestionIndex
+
+    stack = crud.create_tech_stack(test_session, schemas.TechStackCreate(name="Python"))
+    kept, deleted = [crud.create_question(test_session, schemas.QuestionCreate(
+        question_text=f"Question {i}?", tech_stack_id=stack.id, topic="Core")).id for i in range(2)]
+    index, bank, execute = QuestionIndex(), adaptive.ItemBank(), test_session.execute
+
+    def racing_execute(*args, **kwargs):
+        # Another request commits an add and a delete after the load started, past its snapshot
+        monkeypatch.setattr(test_session, "execute", execute)
+        index.add(999, stack.id, "Core")
+        index.discard(deleted)
+        bank.add(stack.id, [999])
+        bank.remove([deleted])
+        return execute(*args, **kwargs)
+
+    monkeypatch.setattr(test_session, "execute", racing_execute)
+    index.build(test_session)
+    assert index.built and sorted(index.sample(stack.id, 10, topics=["Core"])) == [kept, 999]
+    monkeypatch.setattr(test_session, "execute", racing_execute)
+    assert bank.stack(test_session, stack.id).ids.tolist() == [kept, 999]
+
+
+def test_near_duplicate_questions_are_flagged_clustered_and_never_share_a_mock(client):
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    first = client.post("/questions/", json={"question_text": "What is a decorator in Python?",
+                                             "tech_stack_id": stack_id})
+    assert "X-Near-Duplicates" not in first.headers
+    first = first.json()
+
+    warned = client.post("/questions/", json={"question_text": "What's a Python decorator?", "tech_stack_id": stack_id})
+    assert warned.status_code == 200 and warned.headers["X-Near-Duplicates"] == str(first["id"])
+    rejected = client.post("/questions/?on_duplicate=reject",
+                           json={"question_text": "Explain decorators in python", "tech_stack_id": stack_id})
+    assert rejected.status_code == 409
+    assert rejected.json()["detail"]["duplicates"][0]["question_id"] == first["id"]
+    client.post("/questions/?on_duplicate=allow", json={"question_text": "Explain decorators in python",
+                                                        "tech_stack_id": stack_id})
+    unique = client.post("/questions/?on_duplicate=reject",
+                         json={"question_text": "How does the GIL affect threads?", "tech_stack_id": stack_id}).json()
+
+    clusters = client.get("/questions/duplicates").json()
+    assert len(clusters) == 1 and clusters[0]["size"] == 3
+    assert unique["id"] not in [q["id"] for q in clusters[0]["questions"]]
+
+    # Two of four questions fit a mock only once the three decorator variants count as one
+    for _ in range(10):
+        mock = client.post("/mocks/generate", json={"name": "m", "tech_stack_ids": [stack_id], "num_questions": 4}).json()
+        ids = {q["id"] for q in mock["questions"]}
+        assert len(ids) == 2 and unique["id"] in ids
+
+
+def test_duplicate_index_build_matches_incremental_adds(test_session):
+    import numpy as np
+    from sqlalchemy import insert
+    import models
+    from dedup import DuplicateIndex
+
+    texts = ["What is a closure?", "Explain closures", "What is the event loop?", "Describe the event loop",
+             "What is a generator?", "How do you reverse a linked list?"]
+    incremental = DuplicateIndex()
+    incremental.built = True
+    incremental.add_many(enumerate(texts, start=1))
+    assert incremental.clusters() == [[1, 2], [3, 4]]
+    assert incremental.find("what are closures")[0][0] in (1, 2)
+    assert incremental.find("What is a monad?") == []
+    assert incremental.pick_distinct([2, 1, 5, 3, 4], limit=5, seen=set()) == [2, 5, 3]
+
+    # Single letters tell templated questions apart; questions with no content words match nothing
+    templated = DuplicateIndex()
+    templated.built = True
+    templated.add_many(enumerate(["What is x in C?", "What is y in C?", "What is z in R?", "What is it?",
+                                  "What is that?", "What is C?", "Explain C"], start=1))
+    assert templated.clusters() == [[6, 7]]
+    assert templated.find("What is this?") == []
+
+    # A full build finds every similar pair sharing a band, not only rows next to each other in it
+    words = "list dict tuple set generator closure decorator iterator lambda class object module thread lock".split()
+    rng = np.random.default_rng(1)
+    texts = [" ".join(rng.choice(words, 4, replace=False)) for _ in range(400)]
+    test_session.execute(insert(models.Question), [{"question_text": text} for text in texts])
+    test_session.commit()
+    built = DuplicateIndex()
+    built.build(test_session)
+    incremental = DuplicateIndex()
+    incremental.built = True
+    incremental.add_many(enumerate(texts, start=1))
+    assert built.clusters() == incremental.clusters()
+
+
+def test_get_tech_stacks_lean_and_embedded(client):
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    client.post("/tech-stacks/", json={"name": "Go"})
+    for text, topic in [("What is a decorator?", "Core"), ("What is the GIL?", "Internals"), ("What is PEP 8?", None)]:
+        client.post("/questions/", json={"question_text": text, "topic": topic, "tech_stack_id": stack_id})
+
+    lean = {s["name"]: s for s in client.get("/tech-stacks/").json()}
+    assert "questions" not in lean["Python"]
+    assert lean["Python"]["question_count"] == 3
+    assert lean["Python"]["topic_counts"] == {"Core": 1, "Internals": 1}
+    assert lean["Go"]["question_count"] == 0
+
+    full = {s["name"]: s for s in client.get("/tech-stacks/?include=questions").json()}
+    assert len(full["Python"]["questions"]) == 3
+    assert full["Python"]["questions"][2]["topic"] is None
+    assert full["Go"]["questions"] == []
+    assert client.get("/tech-stacks/?include=answers").status_code == 400
+
+
+def test_questions_keyset_pagination(client):
+    python_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    sql_id = client.post("/tech-stacks/", json={"name": "SQL"}).json()["id"]
+    for i in range(7):
+        client.post("/questions/", json={"question_text": f"Q{i}", "topic": "Core",
+                                         "tech_stack_id": python_id if i % 2 == 0 else sql_id})
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, "tech_stack_id": python_id}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/questions/", params=params)
+        assert response.status_code == 200
+        seen.extend(q["question_text"] for q in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == ["Q0", "Q2", "Q4", "Q6"]
+
+    # Legacy skip/limit paging keeps working
+    assert [q["question_text"] for q in client.get("/questions/?skip=5&limit=5").json()] == ["Q5", "Q6"]
+    assert client.get("/questions/?cursor=not-a-cursor").status_code == 400
+
+
+def test_async_crud_runs_on_async_session(db_url, test_engine):
+    import asyncio
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    import async_crud, schemas
+    from database import to_async_url
+
+    async def scenario():
+        engine = create_async_engine(to_async_url(db_url))
+        try:
+            async with async_sessionmaker(engine, autoflush=False)() as db:
+                stack = await async_crud.create_tech_stack(db, stack=schemas.TechStackCreate(name="Python"),
+                                                           response_model=schemas.TechStack)
+                for i in range(3):
+                    await async_crud.create_question(db, question=schemas.QuestionCreate(
+                        question_text=f"Q{i}", tech_stack_id=stack.id))
+                mock = await async_crud.create_mock_from_stacks(
+                    db, mock_data=schemas.MockCreateFromStacks(name="m", tech_stack_ids=[stack.id], num_questions=2),
+                    response_model=schemas.Mock,
+                )
+                # Relationships were loaded inside the DB call, not lazily on the event loop
+                return mock
+        finally:
+            await engine.dispose()
+
+    mock = asyncio.run(scenario())
+    assert isinstance(mock, schemas.Mock)
+    assert len(mock.questions) == 2
+
+
+def test_read_mock_cached_with_etag(client, test_session):
+    import mock_cache
+
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    question = client.post("/questions/", json={"question_text": "What is a decorator?", "tech_stack_id": stack_id}).json()
+    mock = client.post("/mocks/generate", json={"name": "m", "tech_stack_ids": [stack_id], "num_questions": 1}).json()
+
+    response = client.get(f"/mocks/{mock['id']}")
+    assert response.status_code == 200
+    assert response.json() == mock
+    etag = response.headers["ETag"]
+
+    not_modified = client.get(f"/mocks/{mock['id']}", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    assert client.get("/mocks/999").status_code == 404
+
+    cache = mock_cache.cache_for(test_session)
+    assert mock["id"] in [key for key in cache._entries]
+    mock_cache.question_changed(test_session, question["id"])
+    assert len(cache) == 0
+    assert client.get(f"/mocks/{mock['id']}", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_payload_cache_single_flight_and_eviction():
+    import asyncio
+    from mock_cache import CachedPayload, PayloadCache
+
+    cache = PayloadCache(max_bytes=10)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return CachedPayload(b"12345", [1])
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load(7, loader) for _ in range(20)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(entry is results[0] for entry in results)
+
+    cache.put(8, CachedPayload(b"123456", [2]))
+    assert cache.get(7) is None  # evicted to stay within max_bytes
+    assert cache.evictions == 1 and cache.size_bytes == 6
+
+
+def test_submit_session_upserts_answers_and_is_idempotent(client, test_session):
+    import crud, schemas
+
+    candidate = crud.create_candidate(test_session, schemas.CandidateCreate(name="Ravi", email="ravi@example.com"))
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    q1 = client.post("/questions/", json={"question_text": "What is a decorator?", "tech_stack_id": stack_id}).json()
+    q2 = client.post("/questions/", json={"question_text": "What is the GIL?", "tech_stack_id": stack_id}).json()
+    mock = client.post("/mocks/generate", json={"name": "m", "tech_stack_ids": [stack_id], "num_questions": 2}).json()
+    session = client.post("/sessions/", json={"candidate_id": candidate.id, "mock_id": mock["id"]}).json()
+    assert session["status"] == "In Progress"
+
+    answers = [
+        {"question_id": q1["id"], "candidate_answer": "first draft"},
+        {"question_id": q2["id"], "candidate_answer": "a lock"},
+        {"question_id": q1["id"], "candidate_answer": "a wrapper"},
+    ]
+    headers = {"Idempotency-Key": "submit-1"}
+    first = client.post(f"/sessions/{session['id']}/submit?view=full", json=answers, headers=headers)
+    assert first.status_code == 200
+    data = first.json()
+    assert data["status"] == "Completed"
+    assert data["candidate"]["email"] == "ravi@example.com"
+    assert len(data["mock"]["questions"]) == 2
+    assert sorted(a["candidate_answer"] for a in data["answers"]) == ["a lock", "a wrapper"]
+
+    # A retry with the same key is a no-op, even if the body changed
+    retry = client.post(f"/sessions/{session['id']}/submit?view=full",
+                        json=[{"question_id": q2["id"], "candidate_answer": "x"}], headers=headers)
+    assert retry.json() == data
+
+    # Without a key, resubmitting overwrites in place instead of duplicating
+    again = client.post(f"/sessions/{session['id']}/submit", json=[{"question_id": q2["id"], "candidate_answer": "GIL"}])
+    assert sorted(a["candidate_answer"] for a in again.json()["answers"]) == ["GIL", "a wrapper"]
+
+    other = client.post("/sessions/", json={"candidate_id": candidate.id, "mock_id": mock["id"]}).json()
+    assert client.post(f"/sessions/{other['id']}/submit", json=[], headers=headers).status_code == 409
+    assert client.post("/sessions/999/submit", json=[]).status_code == 404
+
+
+def test_search_questions_ranked_prefix_and_kept_in_sync(client, test_session, monkeypatch):
+    import models, search
+
+    python = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    js = client.post("/tech-stacks/", json={"name": "JavaScript"}).json()["id"]
+    decorator = client.post("/questions/", json={"question_text": "What is a decorator?", "topic": "Functions",
+                                                 "tech_stack_id": python}).json()
+    client.post("/questions/", json={"question_text": "Explain closures", "topic": "Functions",
+                                     "ideal_answer": "Used to build a decorator", "tech_stack_id": python})
+    client.post("/questions/", json={"question_text": "What is a decorator in TypeScript?", "tech_stack_id": js})
+
+    hits = client.get("/questions/search", params={"q": "decor*"}).json()
+    assert len(hits) == 3
+    # Matches in question_text rank above a match in the ideal answer
+    assert hits[-1]["question_text"] == "Explain closures"
+    assert hits[0]["score"] >= hits[1]["score"] >= hits[2]["score"]
+    assert client.get("/questions/search", params={"q": "decor"}).json() == []
+    assert len(client.get("/questions/search", params={"q": "decor", "prefix": "true"}).json()) == 3
+    only_python = client.get("/questions/search", params={"q": "decorator", "tech_stack_id": python,
+                                                           "topic": "Functions"}).json()
+    assert {h["question_text"] for h in only_python} == {"What is a decorator?", "Explain closures"}
+    # User input is never parsed as FTS syntax
+    assert client.get("/questions/search", params={"q": 'decorator" OR NEAR('}).status_code == 200
+    assert client.get("/questions/search", params={"q": "  ?! "}).status_code == 400
+
+    # The window keeps the best-ranked matches, not the first ones found, and paging ends with it
+    monkeypatch.setattr(search, "RANK_WINDOW", 2)
+    best = client.get("/questions/search", params={"q": "decor*"}).json()
+    assert [h["question_text"] for h in best] == [h["question_text"] for h in hits[:2]]
+    assert client.get("/questions/search", params={"q": "decor*", "skip": 2}).json() == []
+    monkeypatch.setattr(search, "RANK_WINDOW", 1000)
+
+    # Too unspecific to rank: newest matches first, unscored
+    monkeypatch.setattr(search, "BROAD_QUERY", 1)
+    broad = client.get("/questions/search", params={"q": "decorator"}).json()
+    assert [h["score"] for h in broad] == [0.0, 0.0, 0.0]
+    assert [h["id"] for h in broad] == sorted((h["id"] for h in broad), reverse=True)
+    # Broadness is judged after the filters: one match in the stack is ranked
+    narrowed = client.get("/questions/search", params={"q": "decorator", "tech_stack_id": js}).json()
+    assert len(narrowed) == 1 and narrowed[0]["score"] > 0
+
+    # Updates and deletes reach the index through triggers
+    row = test_session.get(models.Question, decorator["id"])
+    row.question_text = "What is a metaclass?"
+    test_session.commit()
+    assert [h["id"] for h in client.get("/questions/search", params={"q": "metaclass"}).json()] == [decorator["id"]]
+    test_session.delete(row)
+    test_session.commit()
+    assert client.get("/questions/search", params={"q": "metaclass"}).json() == []
+
+
+def test_migrations_upgrade_existing_database(tmp_path):
+    import sqlite3
+    from sqlalchemy import create_engine, inspect
+    import migrations
+
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE session_answers (id INTEGER PRIMARY KEY, mock_session_id INTEGER, question_id INTEGER,
+                                      candidate_answer TEXT, correctness VARCHAR(9));
+        INSERT INTO session_answers (mock_session_id, question_id, candidate_answer) VALUES (1, 1, 'old'), (1, 1, 'new');
+        CREATE TABLE mock_questions (mock_id INTEGER, question_id INTEGER);
+        INSERT INTO mock_questions VALUES (1, 2), (1, 2), (1, 3), (NULL, 3);
+        CREATE TABLE mock_sessions (id INTEGER PRIMARY KEY, candidate_id INTEGER, mock_id INTEGER,
+                                    session_date DATETIME, status VARCHAR(11));
+        CREATE INDEX ix_mock_sessions_id ON mock_sessions (id);
+        INSERT INTO mock_sessions (candidate_id, mock_id, status) VALUES (1, 1, 'completed'), (2, 1, 'scheduled');
+    """)
+    conn.close()
+
+    engine = create_engine(f"sqlite:///{path}")
+    assert migrations.upgrade(engine) == [1, 2, 3, 4, 5, 6]
+    assert migrations.upgrade(engine) == []
+    with engine.begin() as c:
+        assert c.exec_driver_sql("SELECT candidate_answer FROM session_answers").scalars().all() == ["new"]
+        assert c.exec_driver_sql("SELECT mock_id, question_id FROM mock_questions").all() == [(1, 2), (1, 3)]
+        assert c.exec_driver_sql("SELECT id, candidate_id, status FROM mock_sessions").all() == [
+            (1, 1, "completed"), (2, 2, "scheduled")]
+        # The newest session's id is not handed out again once it is deleted (archived)
+        c.exec_driver_sql("DELETE FROM mock_sessions WHERE id = 2")
+        c.exec_driver_sql("INSERT INTO mock_sessions (candidate_id, mock_id) VALUES (3, 1)")
+        assert c.exec_driver_sql("SELECT max(id) FROM mock_sessions").scalar() == 3
+    inspector = inspect(engine)
+    assert inspector.get_pk_constraint("mock_questions")["constrained_columns"] == ["mock_id", "question_id"]
+    assert "ix_session_answers_question" in {index["name"] for index in inspector.get_indexes("session_answers")}
+    assert {"ix_mock_sessions_id", "ix_mock_sessions_mock_status"} <= {
+        index["name"] for index in inspector.get_indexes("mock_sessions")}
+    engine.dispose()
+
+
+def test_autosave_coalesces_and_flushes_on_submit(client, test_session, db_url, monkeypatch):
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    import autosave, crud, models, schemas
+
+    candidate = crud.create_candidate(test_session, schemas.CandidateCreate(name="Jaya", email="jaya@example.com"))
+    stack_id = client.post("/tech-stacks/", json={"name": "AWS"}).json()["id"]
+    q1 = client.post("/questions/", json={"question_text": "What is S3?", "tech_stack_id": stack_id}).json()
+    q2 = client.post("/questions/", json={"question_text": "What is IAM?", "tech_stack_id": stack_id}).json()
+    mock = client.post("/mocks/generate", json={"name": "m", "tech_stack_ids": [stack_id], "num_questions": 2}).json()
+    session = client.post("/sessions/", json={"candidate_id": candidate.id, "mock_id": mock["id"]}).json()
+
+    for draft in ["Obj", "Object", "Object storage"]:
+        response = client.patch(f"/sessions/{session['id']}/answers",
+                                json=[{"question_id": q1["id"], "candidate_answer": draft}])
+        assert response.status_code == 202
+    client.patch(f"/sessions/{session['id']}/answers", json=[{"question_id": q2["id"], "candidate_answer": "Identity"}])
+    assert client.patch("/sessions/999/answers", json=[]).status_code == 404
+
+    buffer = autosave.buffer_for(test_session)
+    assert buffer.saves == 4 and buffer.coalesced == 2
+
+    # Final submit flushes the autosaved drafts, then its own answers win
+    submitted = client.post(f"/sessions/{session['id']}/submit",
+                            json=[{"question_id": q2["id"], "candidate_answer": "Identity and Access Management"}])
+    answers = {a["question_id"]: a["candidate_answer"] for a in submitted.json()["answers"]}
+    assert answers == {q1["id"]: "Object storage", q2["id"]: "Identity and Access Management"}
+    assert buffer.depth == 0
+
+    stats = client.get("/autosave/stats").json()
+    assert stats["flushes"] >= 1 and stats["flushed_rows"] == 2
+    response = client.patch(f"/sessions/{session['id']}/answers", json=[{"question_id": q1["id"], "candidate_answer": "late"}])
+    assert response.status_code == 409
+
+    # A save accepted while the submit ran is dropped by the timer flush, not written over the submission
+    buffer.put(session["id"], [schemas.SessionAnswerCreate(question_id=q1["id"], candidate_answer="late")])
+    assert buffer.flush() == 0 and buffer.depth == 0 and buffer.discarded == 1
+    test_session.expire_all()
+    stored = test_session.query(models.SessionAnswer).filter_by(mock_session_id=session["id"], question_id=q1["id"]).one()
+    assert stored.candidate_answer == "Object storage"
+
+    # A submit that commits while a flush is under way wins: the status is checked by the write itself
+    racing = client.post("/sessions/", json={"candidate_id": candidate.id, "mock_id": mock["id"]}).json()["id"]
+    buffer.put(racing, [schemas.SessionAnswerCreate(question_id=q1["id"], candidate_answer="stale draft")])
+    upsert = crud.upsert_open_answer_rows
+
+    def submit_first(db, rows):
+        crud.submit_session(test_session, racing, [schemas.SessionAnswerCreate(question_id=q1["id"],
+                                                                               candidate_answer="FINAL")])
+        return upsert(db, rows)
+
+    monkeypatch.setattr(crud, "upsert_open_answer_rows", submit_first)
+    assert buffer.flush() == 0
+    monkeypatch.undo()
+    test_session.expire_all()
+    assert test_session.query(models.SessionAnswer).filter_by(mock_session_id=racing).one().candidate_answer == "FINAL"
+
+    # The timer thread has no event loop: with an asyncio engine it writes through a blocking one
+    open_session = client.post("/sessions/", json={"candidate_id": candidate.id, "mock_id": mock["id"]}).json()
+    async_engine = create_async_engine(db_url.replace("sqlite://", "sqlite+aiosqlite://"))
+    async_buffer = autosave.buffer_for(async_sessionmaker(async_engine)())
+    async_buffer.put(open_session["id"], [schemas.SessionAnswerCreate(question_id=q2["id"], candidate_answer="draft")])
+    assert async_buffer.flush() == 1 and async_buffer.failed_flushes == 0
+    assert test_session.query(models.SessionAnswer).filter_by(mock_session_id=open_session["id"]).one().candidate_answer == "draft"
+
+
+def test_grading_scores_answers_against_ideal_answers(client, test_session):
+    import crud, schemas
+
+    candidate = crud.create_candidate(test_session, schemas.CandidateCreate(name="Anil", email="anil@example.com"))
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    ideal = {
+        "What is the GIL?": "The Global Interpreter Lock ensures only one thread executes Python bytecode at a time.",
+        "How do generators save memory?": "Generators produce values one at a time using yield instead of building whole lists.",
+        "What is a decorator?": "A decorator is a callable that takes a function and returns a wrapped function.",
+    }
+    ids = {}
+    for text, answer in ideal.items():
+        ids[text] = client.post("/questions/", json={"question_text": text, "ideal_answer": answer,
+                                                      "tech_stack_id": stack_id}).json()["id"]
+    mock = client.post("/mocks/generate", json={"name": "m", "tech_stack_ids": [stack_id], "num_questions": 3}).json()
+    session = client.post("/sessions/", json={"candidate_id": candidate.id, "mock_id": mock["id"]}).json()
+    client.post(f"/sessions/{session['id']}/submit", json=[
+        {"question_id": ids["What is the GIL?"],
+         "candidate_answer": "The global interpreter lock ensures only one thread executes bytecode at a time"},
+        {"question_id": ids["How do generators save memory?"],
+         "candidate_answer": "They use yield to produce values lazily"},
+        {"question_id": ids["What is a decorator?"], "candidate_answer": "No idea, sorry"},
+    ])
+
+    report = client.post(f"/mocks/{mock['id']}/grade").json()
+    assert report["sessions"] == 1 and report["graded"] == 3
+    assert report["result"] == "correct: 1 | incorrect: 1 | partially correct: 1"
+
+    test_session.expire_all()
+    graded = crud.get_session_details(test_session, session["id"])
+    by_question = {a.question_id: a.correctness.value for a in graded.answers}
+    assert by_question == {ids["What is the GIL?"]: "Correct", ids["How do generators save memory?"]: "Partial",
+                           ids["What is a decorator?"]: "Incorrect"}
+    assert graded.overall_result == report["result"]
+    assert client.post("/sessions/999/grade").status_code == 404
+
+
+def test_submit_queues_grading_job_and_worker_retries_failures(client, test_session, monkeypatch):
+    import time
+    from datetime import timedelta
+    import crud, jobs, models, schemas
+
+    candidate = crud.create_candidate(test_session, schemas.CandidateCreate(name="Meena", email="meena@example.com"))
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    q = client.post("/questions/", json={"question_text": "What is the GIL?", "tech_stack_id": stack_id,
+                                         "ideal_answer": "A lock that lets one thread run bytecode at a time"}).json()
+    mock = client.post("/mocks/generate", json={"name": "m", "tech_stack_ids": [stack_id], "num_questions": 1}).json()
+    session = client.post("/sessions/", json={"candidate_id": candidate.id, "mock_id": mock["id"]}).json()
+    submitted = client.post(f"/sessions/{session['id']}/submit?view=full", json=[
+        {"question_id": q["id"], "candidate_answer": "a lock that lets one thread run bytecode at a time"}
+    ]).json()
+    # Submit returns before grading runs
+    assert submitted["overall_result"] is None
+    stats = client.get("/jobs/stats").json()
+    assert stats["queued"] == 1 and stats["due"] == 1
+
+    assert jobs.drain(test_session) == 1
+    job = client.get("/jobs/1").json()
+    assert job["kind"] == "grade_session" and job["status"] == "Done" and job["attempts"] == 1
+    test_session.expire_all()
+    assert crud.get_session_details(test_session, session["id"]).overall_result == "correct: 1 | incorrect: 0 | partially correct: 0"
+
+    @jobs.handler("always_fails")
+    def always_fails(db, payloads):
+        raise RuntimeError("boom")
+
+    try:
+        failing = jobs.enqueue(test_session, "always_fails", {}, max_attempts=2)
+        test_session.commit()
+        assert jobs.drain(test_session) == 1
+        test_session.refresh(failing)
+        assert failing.status == models.JobStatusEnum.queued and failing.attempts == 1
+        assert "boom" in failing.last_error and failing.run_after > jobs.utcnow()
+        # Not due again until the backoff has passed
+        assert jobs.drain(test_session) == 0
+
+        failing.run_after = jobs.utcnow()
+        test_session.commit()
+        assert jobs.drain(test_session) == 1
+        test_session.refresh(failing)
+        assert failing.status == models.JobStatusEnum.failed and failing.finished_at is not None
+    finally:
+        del jobs._handlers["always_fails"]
+    assert client.get("/jobs/999").status_code == 404
+
+    # A claim whose heartbeat keeps being renewed is not taken over, however long the job runs
+    long_ago = jobs.utcnow() - timedelta(seconds=2 * jobs.STALE_AFTER)
+    job = jobs.enqueue(test_session, "grade_session", {"session_id": session["id"]}, max_attempts=2)
+    test_session.commit()
+    token, claimed = jobs.claim(test_session)
+    assert [j.id for j in claimed] == [job.id]
+    job.started_at = long_ago
+    test_session.commit()
+    assert jobs.renew(test_session, token) == 1
+    assert jobs.claim(test_session)[1] == []
+    # Once it stops, the job is claimed again while it has attempts left, and failed after the last
+    job.heartbeat_at = long_ago
+    test_session.commit()
+    assert [j.attempts for j in jobs.claim(test_session)[1]] == [2]
+    job.heartbeat_at = long_ago
+    test_session.commit()
+    assert jobs.claim(test_session)[1] == []
+    test_session.refresh(job)
+    assert job.status == models.JobStatusEnum.failed and "stopped responding" in job.last_error
+    assert jobs.renew(test_session, token) == 0
+
+    # The worker renews the heartbeat while a batch runs
+    @jobs.handler("slow")
+    def slow(db, payloads):
+        time.sleep(0.3)
+
+    monkeypatch.setattr(jobs, "HEARTBEAT", 0.05)
+    try:
+        job = jobs.enqueue(test_session, "slow", {})
+        test_session.commit()
+        assert jobs.drain(test_session) == 1
+        test_session.refresh(job)
+        assert job.status == models.JobStatusEnum.done
+        assert (job.heartbeat_at - job.started_at).total_seconds() >= 0.2
+    finally:
+        del jobs._handlers["slow"]
+
+
+def test_ideal_answer_index_vectorized_matches_pairwise():
+    import numpy as np
+    from grading import IdealAnswerIndex
+
+    index = IdealAnswerIndex()
+    index.add(1, "alpha beta gamma")
+    index.add(2, "delta epsilon")
+    index.add(3, None)
+    index.built = True
+    scores = index.score([1, 2, 1, 3], ["alpha beta gamma", "epsilon zeta", "", "anything"])
+    assert scores[0] == pytest.approx(1.0)
+    assert 0 < scores[1] < 1
+    assert scores[2] == 0
+    assert np.isnan(scores[3])
+    # No shared term anywhere in the batch
+    assert np.isnan(index.score([1, 3], ["omega", "omega"])).tolist() == [False, True]
+
+
+def test_metrics_endpoint_reports_routes_queries_and_slow_statements(client, monkeypatch):
+    import metrics
+
+    metrics.reset()
+    monkeypatch.setattr(metrics, "SLOW_QUERY_SECONDS", 0.0)
+    client.post("/tech-stacks/", json={"name": "Python"})
+    for _ in range(2):
+        client.get("/tech-stacks/?limit=5")
+    client.get("/mocks/12345")
+
+    # Series are labelled with the route template, never the raw path
+    assert metrics.REQUEST_SECONDS.count("GET", "/tech-stacks/", 200) == 2
+    assert metrics.REQUEST_SECONDS.count("GET", "/mocks/{mock_id}", 404) == 1
+    assert metrics.REQUEST_QUERIES.count("POST", "/tech-stacks/") == 1
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="GET",route="/tech-stacks/",status="200"} 2' in body
+    assert 'http_request_db_queries_bucket{method="POST",route="/tech-stacks/",le="+Inf"} 1' in body
+    assert 'jobs{status="queued"} 0' in body
+    assert "autosave_pending_answers 0" in body
+
+    slow = client.get("/metrics/slow-queries").json()
+    assert slow and any(entry["route"] == "/tech-stacks/" and "tech_stacks" in entry["statement"] for entry in slow)
+    assert metrics.SLOW_QUERIES.value("/tech-stacks/") >= 3
+
+
+def test_session_views_and_field_projection(client, test_session):
+    import crud, schemas
+
+    candidate = crud.create_candidate(test_session, schemas.CandidateCreate(name="Asha", email="asha@example.com"))
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    q1 = client.post("/questions/", json={"question_text": "What is a closure?", "tech_stack_id": stack_id,
+                                          "ideal_answer": "A function capturing its enclosing scope"}).json()
+    q2 = client.post("/questions/", json={"question_text": "What is the GIL?", "tech_stack_id": stack_id,
+                                          "ideal_answer": "A lock around bytecode execution"}).json()
+    mock = client.post("/mocks/generate", json={"name": "m", "tech_stack_ids": [stack_id], "num_questions": 2}).json()
+    summary = client.post("/sessions/?view=summary", json={"candidate_id": candidate.id, "mock_id": mock["id"]}).json()
+    assert summary == {"id": summary["id"], "candidate_id": candidate.id, "mock_id": mock["id"],
+                       "session_date": summary["session_date"], "status": "In Progress"}
+    session_id = summary["id"]
+    client.patch(f"/sessions/{session_id}/answers", json=[{"question_id": q1["id"], "candidate_answer": "draft"}])
+
+    # Candidates never see ideal answers
+    response = client.get(f"/sessions/{session_id}?view=candidate")
+    assert "ideal_answer" not in response.text and "enclosing" not in response.text
+    view = response.json()
+    assert {q["id"] for q in view["mock"]["questions"]} == {q1["id"], q2["id"]}
+
+    submitted = client.post(f"/sessions/{session_id}/submit?view=summary",
+                            json=[{"question_id": q1["id"], "candidate_answer": "a captured scope"}]).json()
+    assert submitted["status"] == "Completed" and "answers" not in submitted
+
+    review = client.get(f"/sessions/{session_id}?view=reviewer").json()
+    assert review["candidate"]["email"] == "asha@example.com"
+    by_question = {q["question_id"]: q for q in review["questions"]}
+    assert by_question[q1["id"]]["candidate_answer"] == "a captured scope"
+    assert by_question[q2["id"]]["candidate_answer"] is None
+    assert by_question[q2["id"]]["ideal_answer"] == "A lock around bytecode execution"
+
+    # fields= projects any view; id is always kept
+    assert client.get(f"/sessions/{session_id}?fields=status").json() == {"id": session_id, "status": "Completed"}
+    partial = client.get(f"/sessions/{session_id}?view=full&fields=answers,status").json()
+    assert set(partial) == {"id", "status", "answers"} and len(partial["answers"]) == 1
+    # Without ?view= a session comes back in the candidate view; ideal answers and candidate details need asking for
+    assert client.get(f"/sessions/{session_id}").json() == client.get(f"/sessions/{session_id}?view=candidate").json()
+    assert client.get(f"/sessions/{session_id}?view=full").json()["candidate"]["name"] == "Asha"
+    assert client.get(f"/sessions/{session_id}?view=summary&fields=answers").status_code == 400
+    assert client.get(f"/sessions/{session_id}?view=everything").status_code == 422
+    assert client.get("/sessions/999?view=summary").status_code == 404
+
+
+def test_generate_mock_batch_balances_exposure(client, test_session):
+    import crud, schemas
+
+    candidates = [crud.create_candidate(test_session, schemas.CandidateCreate(name=f"C{i}", email=f"c{i}@example.com")).id
+                  for i in range(6)]
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    for text in ["What is a decorator?", "Explain the GIL", "How do generators work?"]:
+        client.post("/questions/", json={"question_text": text, "tech_stack_id": stack_id})
+
+    response = client.post("/mocks/generate/batch", json={
+        "name": "Drive", "tech_stack_ids": [stack_id], "num_questions": 2,
+        "candidate_ids": candidates, "create_sessions": True, "seed": 7,
+    })
+    assert response.status_code == 200
+    result = response.json()
+    assert len(result["mocks"]) == 6
+    # 6 mocks x 2 questions over a pool of 3: every question is used exactly 4 times
+    assert result["questions_used"] == 3 and result["min_exposure"] == result["max_exposure"] == 4
+    first = result["mocks"][0]
+    assert first["candidate_id"] == candidates[0] and len(set(first["question_ids"])) == 2
+    session = client.get(f"/sessions/{first['session_id']}?view=summary").json()
+    assert session["mock_id"] == first["mock_id"] and session["status"] == "Scheduled"
+    assert sorted(q["id"] for q in client.get(f"/mocks/{first['mock_id']}").json()["questions"]) == sorted(first["question_ids"])
+
+    assert client.post("/mocks/generate/batch", json={"name": "x", "tech_stack_ids": [stack_id], "count": 3}).json()["mocks"][2]["session_id"] is None
+    assert client.post("/mocks/generate/batch", json={"name": "x", "tech_stack_ids": [stack_id], "candidate_ids": [999]}).status_code == 400
+    assert client.post("/mocks/generate/batch", json={"name": "x", "tech_stack_ids": [stack_id], "count": 2,
+                                                      "create_sessions": True}).status_code == 400
+
+
+def test_analytics_follow_submits_and_regrades(client, test_session):
+    import analytics, crud, jobs, models, schemas
+
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    q1 = client.post("/questions/", json={"question_text": "What is the GIL?", "tech_stack_id": stack_id,
+                                          "ideal_answer": "a lock that lets one thread run bytecode"}).json()
+    q2 = client.post("/questions/", json={"question_text": "What is a decorator?", "tech_stack_id": stack_id,
+                                          "ideal_answer": "a function wrapping another function"}).json()
+    mock = client.post("/mocks/generate", json={"name": "m", "tech_stack_ids": [stack_id], "num_questions": 2}).json()
+    sessions = []
+    for i in range(2):
+        candidate = crud.create_candidate(test_session, schemas.CandidateCreate(name=f"C{i}", email=f"a{i}@example.com"))
+        sessions.append(client.post("/sessions/?view=summary", json={"candidate_id": candidate.id, "mock_id": mock["id"]}).json()["id"])
+
+    client.post(f"/sessions/{sessions[0]}/submit?view=summary", json=[
+        {"question_id": q1["id"], "candidate_answer": "a lock that lets one thread run bytecode"},
+        {"question_id": q2["id"], "candidate_answer": "no idea"},
+    ])
+    client.post(f"/sessions/{sessions[1]}/submit?view=summary", json=[
+        {"question_id": q1["id"], "candidate_answer": "nothing relevant"},
+    ])
+    stat = client.get(f"/analytics/questions/{q1['id']}").json()
+    assert stat["answers"] == 2 and stat["graded"] == 0 and stat["pass_rate"] is None
+
+    jobs.drain(test_session)
+    stat = client.get(f"/analytics/questions/{q1['id']}").json()
+    assert (stat["graded"], stat["correct"], stat["incorrect"], stat["pass_rate"]) == (2, 1, 1, 0.5)
+    [stack] = client.get("/analytics/stacks").json()
+    # Session 0 scored 1/2 in the stack, session 1 scored 0
+    assert stack["answers"] == 3 and stack["scored_sessions"] == 2 and stack["average_score"] == 0.25
+
+    # Resubmitting and regrading replace what the session counted for
+    client.post(f"/sessions/{sessions[1]}/submit?view=summary", json=[
+        {"question_id": q1["id"], "candidate_answer": "a lock that lets one thread run bytecode"},
+    ])
+    assert client.get(f"/analytics/questions/{q1['id']}").json()["graded"] == 1
+    client.post(f"/sessions/{sessions[1]}/grade")
+    client.post(f"/sessions/{sessions[1]}/grade")
+    stat = client.get(f"/analytics/questions/{q1['id']}").json()
+    assert (stat["answers"], stat["correct"], stat["incorrect"]) == (2, 2, 0)
+    assert client.get("/analytics/stacks").json()[0]["average_score"] == 0.75
+
+    page = client.get("/analytics/questions", params={"tech_stack_id": stack_id, "limit": 1})
+    assert len(page.json()) == 1 and page.headers["X-Next-Cursor"]
+    assert client.get("/analytics/questions/999").status_code == 404
+
+    # The incremental tables agree with a full recomputation; a rebuild repairs drift
+    assert analytics.rebuild(test_session, check=True).mismatches == 0
+    test_session.get(models.QuestionStat, q1["id"]).answers = 99
+    test_session.commit()
+    assert analytics.rebuild(test_session, check=True).mismatches == 1
+    report = analytics.rebuild(test_session)
+    test_session.commit()
+    assert report.sessions == 2 and report.answers == 3
+    assert client.get(f"/analytics/questions/{q1['id']}").json()["answers"] == 2
+
+
+def test_export_sessions_streams_csv_and_ndjson(client, test_session):
+    import csv, io, json
+    import crud, schemas
+
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    q1 = client.post("/questions/", json={"question_text": "What is the GIL?", "tech_stack_id": stack_id}).json()
+    q2 = client.post("/questions/", json={"question_text": "What is a decorator?", "tech_stack_id": stack_id}).json()
+    mock = client.post("/mocks/generate", json={"name": "m", "tech_stack_ids": [stack_id], "num_questions": 2}).json()
+    candidate = crud.create_candidate(test_session, schemas.CandidateCreate(name="Ann", email="ann@example.com"))
+    done = client.post("/sessions/?view=summary", json={"candidate_id": candidate.id, "mock_id": mock["id"]}).json()["id"]
+    client.post("/sessions/?view=summary", json={"candidate_id": candidate.id, "mock_id": mock["id"]})
+    client.post(f"/sessions/{done}/submit?view=summary", json=[
+        {"question_id": q1["id"], "candidate_answer": "a lock, \"mostly\"\nharmless"},
+        {"question_id": q2["id"], "candidate_answer": "a wrapper"},
+    ])
+
+    response = client.get("/export/sessions")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    # Only the completed session, one row per answer; quoting survives the round trip
+    assert [(int(row["session_id"]), int(row["question_id"])) for row in rows] == [(done, q1["id"]), (done, q2["id"])]
+    assert rows[0]["candidate_answer"] == "a lock, \"mostly\"\nharmless"
+    assert rows[0]["status"] == "Completed" and rows[0]["tech_stack"] == "Python" and rows[0]["mock_name"] == "m"
+
+    lines = client.get("/export/sessions", params={"format": "ndjson", "status": "any"}).text.splitlines()
+    records = [json.loads(line) for line in lines]
+    # The unsubmitted session still appears once, without answer columns
+    assert len(records) == 3 and records[2]["question_id"] is None and records[2]["status"] == "In Progress"
+    assert client.get("/export/sessions", params={"mock_id": mock["id"] + 1}).text.count("\n") == 1
+    assert client.get("/export/sessions", params={"date_to": "2000-01-01T00:00:00"}).text.count("\n") == 1
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        response = client.get("/export/sessions", params={"format": "parquet"})
+        assert response.status_code == 400 and "pyarrow" in response.json()["detail"]
+
+
+def test_candidate_crud_and_bulk_import(client, test_session):
+    import io
+    import importer
+
+    ann = client.post("/candidates/", json={"name": "Ann", "email": "ann@example.com"}).json()
+    assert client.post("/candidates/", json={"name": "Ann", "email": "ann@example.com"}).status_code == 409
+    assert client.patch(f"/candidates/{ann['id']}", json={"passing_year": 2020}).json()["passing_year"] == 2020
+    assert client.get(f"/candidates/{ann['id']}").json()["name"] == "Ann"
+    # Name and email can be changed but not cleared; a taken email is refused without writing anything
+    assert client.patch(f"/candidates/{ann['id']}", json={"email": None}).status_code == 422
+    assert client.patch(f"/candidates/{ann['id']}", json={"name": None}).status_code == 422
+    other = client.post("/candidates/", json={"name": "Ola", "email": "ola@example.com"}).json()
+    assert client.patch(f"/candidates/{other['id']}", json={"name": "Olga", "email": "ann@example.com"}).status_code == 409
+    assert client.get(f"/candidates/{other['id']}").json()["name"] == "Ola"
+    assert client.get("/candidates/").status_code == 200
+    assert client.delete(f"/candidates/{other['id']}").status_code == 204
+
+    csv_body = (
+        "Full Name,Email Address,Experience,Year of Passing\n"
+        "Bob,bob@example.com,2 years,2021\n"
+        "Ann Lee,ann@example.com,5 years,\n"
+        "Nobody,not-an-email,,\n"
+        "Bob again,bob@example.com,,\n"
+        "Cy,cy@example.com,,twenty\n"
+    )
+    result = client.post("/candidates/bulk", content=csv_body, headers={"Content-Type": "text/csv"}).json()
+    assert (result["inserted"], result["updated"], result["skipped"]) == (1, 0, 4)
+    errors = {error["row"]: error["error"] for error in result["errors"]}
+    assert errors[2] == f"email already registered (candidate {ann['id']})"
+    assert errors[3].startswith("email:") and errors[4] == "duplicate of row 1 (bob@example.com)"
+    assert errors[5].startswith("passing_year:")
+
+    # Updating keeps stored values the row leaves empty; chunks are looked up one query each
+    rows = importer.read_csv_rows(io.StringIO(csv_body.replace("not-an-email", "dan@example.com")),
+                                  importer.CANDIDATE_COLUMNS)
+    result = importer.import_candidates(test_session, rows, on_duplicate="update", chunk_size=2)
+    assert (result.inserted, result.updated, result.skipped) == (1, 2, 2)
+    ann = client.get(f"/candidates/{ann['id']}").json()
+    assert (ann["name"], ann["profile_exp"], ann["passing_year"]) == ("Ann Lee", "5 years", 2020)
+    assert len(client.get("/candidates/").json()) == 3
+
+    assert client.delete(f"/candidates/{ann['id']}").status_code == 204
+    assert client.get(f"/candidates/{ann['id']}").status_code == 404
+    assert client.delete(f"/candidates/{ann['id']}").status_code == 404
+
+
+def test_storage_config_pragmas_and_read_only_engine(tmp_path):
+    import json
+    import sqlalchemy
+    import storage
+
+    settings = tmp_path / "storage.json"
+    settings.write_text(json.dumps({"synchronous": "full", "read_pool_size": 2, "busy_timeout_ms": 1000}))
+    config = storage.load_config({"MOCKTEST_DATABASE_URL": f"sqlite:///{tmp_path / 'app.db'}",
+                                  "MOCKTEST_STORAGE_CONFIG": str(settings), "MOCKTEST_DB_READ_POOL_SIZE": "3"})
+    # The environment wins over the file, which wins over the defaults
+    assert (config.synchronous, config.read_pool_size, config.busy_timeout_ms, config.journal_mode) == \
+        ("full", 3, 1000, "wal")
+    with pytest.raises(ValueError):
+        storage.load_config({"MOCKTEST_SQLITE_JOURNAL_MODE": "fast"})
+
+    engine, read_engine = storage.create_engines(config)
+    try:
+        assert engine is not read_engine
+        Base.metadata.create_all(engine)
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 2  # FULL
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 1000
+        with engine.begin() as conn:
+            conn.exec_driver_sql("INSERT INTO tech_stacks (name) VALUES ('Python')")
+        with read_engine.connect() as conn:
+            # Reads see committed writes, but the read pool can never write
+            assert conn.exec_driver_sql("SELECT name FROM tech_stacks").scalar() == "Python"
+            with pytest.raises(sqlalchemy.exc.OperationalError):
+                conn.exec_driver_sql("INSERT INTO tech_stacks (name) VALUES ('SQL')")
+    finally:
+        engine.dispose()
+        read_engine.dispose()
+
+    # An in-memory database exists once per connection, so reads cannot get an engine of their own
+    memory, memory_reads = storage.create_engines(storage.StorageConfig(url="sqlite://"))
+    assert memory is memory_reads
+
+
+def test_archive_moves_old_sessions_and_lookups_fall_back(client, test_engine, test_session, tmp_path):
+    import datetime
+    from sqlalchemy import create_engine, func, select, update
+    import analytics, archive, crud, jobs, models, schemas
+
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    for text in ["What is the GIL?", "What is a decorator?"]:
+        client.post("/questions/", json={"question_text": text, "tech_stack_id": stack_id, "ideal_answer": text})
+    mock = client.post("/mocks/generate", json={"name": "m", "tech_stack_ids": [stack_id], "num_questions": 2}).json()
+    candidate = crud.create_candidate(test_session, schemas.CandidateCreate(name="Ravi", email="ravi@example.com"))
+    ids = [client.post("/sessions/?view=summary", json={"candidate_id": candidate.id, "mock_id": mock["id"]}).json()["id"]
+           for _ in range(3)]
+    for session_id in ids[:2]:
+        client.post(f"/sessions/{session_id}/submit?view=summary", json=[
+            {"question_id": question["id"], "candidate_answer": question["question_text"] * 20}
+            for question in mock["questions"]])
+    jobs.drain(test_session)
+    # Only the first session is old enough; the third is not completed
+    test_session.execute(update(models.MockSession).where(models.MockSession.id.in_([ids[0], ids[2]]))
+                         .values(session_date=datetime.datetime(2020, 1, 1)))
+    test_session.commit()
+    views = ["full", "summary", "candidate", "reviewer"]
+    before = {view: client.get(f"/sessions/{ids[0]}?view={view}").json() for view in views}
+    exports = [{"format": "ndjson"}, {"format": "ndjson", "tech_stack_id": stack_id},
+               {"format": "ndjson", "mock_id": mock["id"] + 1}, {"format": "csv", "date_to": "2021-01-01T00:00:00"}]
+    exported = [client.get("/export/sessions", params=params).text for params in exports]
+
+    archive_engine = create_engine(f"sqlite:///{tmp_path / 'archive.db'}")
+    archive.attach(test_engine, archive_engine)
+    try:
+        report = archive.archive_sessions(test_session, archive_engine, datetime.timedelta(days=30), batch_size=1)
+        assert (report.sessions, report.answers) == (1, 2)
+        assert report.stored_bytes < report.raw_bytes
+        assert archive.archive_sessions(test_session, archive_engine, datetime.timedelta(days=30)).sessions == 0
+
+        assert test_session.get(models.MockSession, ids[0]) is None
+        assert test_session.scalar(select(func.count()).select_from(models.SessionAnswer)) == 2
+        # Every view of the archived session reads exactly as it did from the hot tables
+        for view in views:
+            assert client.get(f"/sessions/{ids[0]}?view={view}").json() == before[view]
+        assert client.get(f"/sessions/{ids[0]}?fields=status,answers").json().keys() == {"id", "status", "answers"}
+        assert client.get("/sessions/999").status_code == 404
+        # Exports still include the archived session, row for row
+        assert [client.get("/export/sessions", params=params).text for params in exports] == exported
+        assert exported[0].count(f'"session_id": {ids[0]},') == 2
+
+        assert analytics.rebuild(test_session, check=True).mismatches == 0
+        assert client.delete(f"/candidates/{candidate.id}").status_code == 409
+        compaction = archive.compact(test_engine)
+        assert 0 < compaction.bytes_after <= compaction.bytes_before
+    finally:
+        archive.detach(test_engine)
+        archive_engine.dispose()
+
+
+def test_adaptive_session_calibrates_and_picks_questions(client, test_session, monkeypatch):
+    from sqlalchemy import delete
+    import adaptive, crud, jobs, models, schemas
+
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    ideal = [f"answer number {i} explains concept {i} with example {i}" for i in range(6)]
+    questions = [client.post("/questions/", json={"question_text": f"Question {i}?", "tech_stack_id": stack_id,
+                                                 "ideal_answer": ideal[i]}).json()["id"] for i in range(6)]
+    mock = crud.create_mock_from_stacks(test_session, schemas.MockCreateFromStacks(
+        name="history", tech_stack_ids=[stack_id], num_questions=6))
+    # Candidate j of 40 knows question i when j / 40 > i / 6, so question 0 is the easiest
+    for j in range(40):
+        candidate = crud.create_candidate(test_session, schemas.CandidateCreate(name=f"C{j}", email=f"h{j}@example.com"))
+        session = crud.create_mock_session(test_session, schemas.MockSessionCreate(candidate_id=candidate.id, mock_id=mock.id))
+        crud.submit_session(test_session, session.id, [
+            schemas.SessionAnswerCreate(question_id=question_id, candidate_answer=ideal[i] if j / 40 > i / 6 else "no idea")
+            for i, question_id in enumerate(questions)])
+    jobs.drain(test_session)
+
+    job = client.post("/adaptive/calibrate")
+    assert job.status_code == 202 and job.json()["kind"] == "calibrate_questions"
+    jobs.drain(test_session)
+    difficulty = {row.question_id: row.difficulty for row in test_session.query(models.QuestionCalibration)}
+    assert [difficulty[question_id] for question_id in questions] == sorted(difficulty.values())
+    report = adaptive.calibrate(test_session)
+    assert (report.sessions, report.answers, report.questions) == (40, 240, 6)
+
+    candidate = crud.create_candidate(test_session, schemas.CandidateCreate(name="Ira", email="ira@example.com"))
+    step = client.post("/sessions/adaptive", json={"candidate_id": candidate.id, "tech_stack_ids": [stack_id],
+                                                   "max_questions": 3}).json()
+    session_id, first = step["session_id"], step["question"]
+    assert step["answered"] == 0 and first["id"] in questions and "ideal_answer" not in first
+    # Asking again without answering serves the same question
+    assert client.post(f"/sessions/{session_id}/next-question").json()["question"] == first
+    assert client.post(f"/sessions/{session_id}/next-question",
+                       json={"question_id": -1, "candidate_answer": "x"}).status_code == 409
+
+    step = client.post(f"/sessions/{session_id}/next-question",
+                       json={"question_id": first["id"], "candidate_answer": ideal[questions.index(first["id"])]}).json()
+    assert step["last_correctness"] == "Correct" and step["ability"] > 0
+    # A correct answer moves the test to a harder question
+    assert difficulty[step["question"]["id"]] > difficulty[first["id"]]
+    served = [first["id"], step["question"]["id"]]
+    step = client.post(f"/sessions/{session_id}/next-question",
+                       json={"question_id": served[1], "candidate_answer": "no idea"}).json()
+    served.append(step["question"]["id"])
+    assert step["last_correctness"] == "Incorrect" and len(set(served)) == 3
+    step = client.post(f"/sessions/{session_id}/next-question",
+                       json={"question_id": served[2], "candidate_answer": "no idea"}).json()
+    assert step["finished"] and step["question"] is None and step["answered"] == 3
+
+    details = client.get(f"/sessions/{session_id}").json()
+    assert details["status"] == "Completed"
+    assert sorted(q["id"] for q in details["mock"]["questions"]) == sorted(served)
+    assert client.post(f"/sessions/{session_id}/next-question").status_code == 409
+    assert client.post(f"/sessions/{mock.id}/next-question").status_code == 404
+    assert client.post("/sessions/adaptive", json={"candidate_id": candidate.id, "tech_stack_ids": [999]}).status_code == 400
+
+    # New questions join a loaded stack's arrays with the prior's parameters
+    added = client.post("/questions/", json={"question_text": "Question 6?", "tech_stack_id": stack_id}).json()["id"]
+    params = adaptive.bank_for(test_session).stack(test_session, stack_id)
+    assert params.ids[-1] == added and params.difficulty[-1] == adaptive.DEFAULT_DIFFICULTY
+
+    # Questions deleted behind the bank's back are skipped, whether about to be served or being asked
+    best = adaptive.select_question(adaptive.bank_for(test_session), test_session, [stack_id], 0.0, [])
+    test_session.execute(delete(models.Question).where(models.Question.id == best))
+    test_session.commit()
+    step = client.post("/sessions/adaptive", json={"candidate_id": candidate.id, "tech_stack_ids": [stack_id],
+                                                   "max_questions": 2}).json()
+    asked = step["question"]["id"]
+    assert asked != best and best not in adaptive.bank_for(test_session).stack(test_session, stack_id).ids
+    test_session.execute(delete(models.Question).where(models.Question.id == asked))
+    test_session.commit()
+    step = client.post(f"/sessions/{step['session_id']}/next-question").json()
+    assert step["question"]["id"] not in (best, asked) and step["answered"] == 0
+
+    # A double submit of the same answer moves the session on once; the loser serves the winner's step
+    session_id, asked = step["session_id"], step["question"]["id"]
+    record, won = adaptive._record_answer, []
+
+    def racing_record(db, *args):
+        if not won:
+            won.append(None)
+            other = sessionmaker(autoflush=False, bind=test_session.get_bind())()
+            won[0] = adaptive.next_question(other, session_id, schemas.SessionAnswerCreate(
+                question_id=asked, candidate_answer="no idea"))
+            other.close()
+        return record(db, *args)
+
+    monkeypatch.setattr(adaptive, "_record_answer", racing_record)
+    step = client.post(f"/sessions/{session_id}/next-question", json={"question_id": asked, "candidate_answer": "no idea"})
+    assert step.status_code == 200 and step.json()["question"]["id"] == won[0].question.id != asked
+    assert step.json()["answered"] == 1
+
+
+def test_crud_queries_use_indexes(test_engine, test_session):
+    from sqlalchemy import event
+    import analytics, crud, grading, jobs, mock_cache, schemas, session_views
+
+    # Whole-table reads that are intended: (caller, table) -> why
+    allowed_scans = {
+        ("create_mock_from_stacks", "questions"): "builds the sampling and duplicate indexes, once per engine",
+        ("grade_session", "questions"): "builds the ideal-answer index, once per engine",
+        ("get_tech_stack_summaries", "tech_stacks"): "first page of a keyset listing, read in key order",
+        ("get_tech_stacks", "tech_stacks"): "first page of a keyset listing, read in key order",
+        ("get_candidates", "candidates"): "first page of a keyset listing, read in key order",
+        ("get_mocks", "mocks"): "first page of a keyset listing, read in key order",
+        ("jobs.stats", "jobs"): "counts every job by status off the covering index",
+        ("get_stack_stats", "stack_stats"): "one row per tech stack",
+    }
+    captured, caller = [], ["setup"]
+
+    @event.listens_for(test_engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            captured.append((caller[0], statement, parameters))
+
+    def call(name, fn, *args, **kwargs):
+        caller[0] = name
+        return fn(test_session, *args, **kwargs)
+
+    stack = call("create_tech_stack", crud.create_tech_stack, schemas.TechStackCreate(name="Python"))
+    for i in range(12):
+        call("create_question", crud.create_question, schemas.QuestionCreate(
+            question_text=f"What does feature {i} of the standard library do?", topic="Core" if i % 2 else "Advanced",
+            tech_stack_id=stack.id, ideal_answer=f"It handles case {i}"))
+    call("get_tech_stack", crud.get_tech_stack, stack.id)
+    call("get_tech_stack_by_name", crud.get_tech_stack_by_name, "Python")
+    call("get_tech_stacks", crud.get_tech_stacks)
+    call("get_tech_stack_summaries", crud.get_tech_stack_summaries, include_questions=True)
+    call("get_questions", crud.get_questions, tech_stack_id=stack.id, topic="Core")
+    call("get_questions", crud.get_questions, tech_stack_id=stack.id, after_id=3)
+    first = call("create_candidate", crud.create_candidate, schemas.CandidateCreate(name="A", email="a@example.com"))
+    second = call("create_candidate", crud.create_candidate, schemas.CandidateCreate(name="B", email="b@example.com"))
+    call("get_candidate", crud.get_candidate, first.id)
+    call("get_candidates", crud.get_candidates)
+    call("get_candidate_by_email", crud.get_candidate_by_email, "a@example.com")
+    call("update_candidate", crud.update_candidate, first.id, schemas.CandidateUpdate(name="Asha"))
+    mock = call("create_mock_from_stacks", crud.create_mock_from_stacks,
+                schemas.MockCreateFromStacks(name="m", tech_stack_ids=[stack.id], num_questions=5))
+    call("create_mock_batch", crud.create_mock_batch, schemas.MockBatchCreate(
+        name="b", tech_stack_ids=[stack.id], num_questions=3, candidate_ids=[first.id, second.id], create_sessions=True))
+    call("get_mocks", crud.get_mocks)
+    call("get_mock", crud.get_mock, mock.id)
+    call("load_mock", mock_cache.load_mock, mock.id)
+    session = call("create_mock_session", crud.create_mock_session,
+                   schemas.MockSessionCreate(candidate_id=first.id, mock_id=mock.id))
+    question_ids = [question.id for question in mock.questions]
+    call("upsert_session_answers", crud.upsert_session_answers, session.id,
+         [schemas.SessionAnswerCreate(question_id=question_id, candidate_answer="draft") for question_id in question_ids[:2]])
+    call("get_session_status", crud.get_session_status, session.id)
+    call("submit_session", crud.submit_session, session.id,
+         [schemas.SessionAnswerCreate(question_id=question_id, candidate_answer="an answer") for question_id in question_ids])
+    call("get_session_details", crud.get_session_details, session.id)
+    for view in session_views.VIEWS:
+        call("render", session_views.render, session.id, view)
+    call("grade_session", grading.grade_session, session.id)
+    call("grade_mock", grading.grade_mock, mock.id)
+    call("jobs.drain", jobs.drain)
+    call("jobs.stats", jobs.stats)
+    call("get_question_stats", analytics.get_question_stats, tech_stack_id=stack.id)
+    call("get_stack_stats", analytics.get_stack_stats)
+    third = call("create_candidate", crud.create_candidate, schemas.CandidateCreate(name="C", email="c@example.com"))
+    with pytest.raises(ValueError):
+        call("delete_candidate", crud.delete_candidate, first.id)
+    call("delete_candidate", crud.delete_candidate, third.id)
+    event.remove(test_engine, "before_cursor_execute", capture)
+
+    scans = {}
+    cursor = test_engine.raw_connection().cursor()
+    for name, statement, parameters in captured:
+        if isinstance(parameters, list):  # executemany: one parameter set plans the same
+            parameters = parameters[0]
+        for row in cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall():
+            detail = row[-1]
+            # "SCAN t", with or without "USING (COVERING) INDEX", reads every row of t
+            if detail.startswith("SCAN ") and (name, detail.split()[1]) not in allowed_scans:
+                scans.setdefault(f"{name}: {detail}", " ".join(statement.split()))
+    assert len({name for name, _, _ in captured}) > 25
+    assert scans == {}
+
+
+def test_ready_only_after_warmup_fills_caches(client, test_engine, test_session, monkeypatch):
+    import asyncio
+    import database, mock_cache, warmup
+
+    monkeypatch.setattr(warmup, "ENABLED", True)
+    stack_id = client.post("/tech-stacks/", json={"name": "Python"}).json()["id"]
+    client.post("/questions/", json={"question_text": "What is a decorator?", "tech_stack_id": stack_id})
+    mock = client.post("/mocks/generate", json={"name": "m", "tech_stack_ids": [stack_id], "num_questions": 1}).json()
+    cache = mock_cache.cache_for(test_session)
+    cache.clear()
+
+    # Warm up against the test database instead of the configured one
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+    for name, value in (("engine", test_engine), ("read_engine", test_engine),
+                        ("SessionLocal", TestingSessionLocal), ("ReadSessionLocal", TestingSessionLocal)):
+        monkeypatch.setattr(database, name, value)
+    warmup.state.reset()
+    response = client.get("/ready")
+    assert response.status_code == 503 and response.json()["ready"] is False
+
+    asyncio.run(warmup.run())
+    response = client.get("/ready")
+    assert response.status_code == 200
+    report = response.json()
+    assert report["ready"] and report["error"] is None and report["attempts"] == 1
+    assert list(report["steps"]) == ["connections", "tech_stacks", "question_indexes", "recent_mocks"]
+    assert cache.get(mock["id"]) is not None
+
+
+def _serve_as_worker(conn):
+    # One app worker for the multi-process test: serves the requests sent over the pipe, in its own process
+    import time
+    import coherence, database, mock_cache
+    from main import app
+
+    with TestClient(app) as client:
+        while client.get("/ready").status_code != 200:
+            time.sleep(0.01)
+        conn.send("ready")
+        while (command := conn.recv()) is not None:
+            method, url, body = command
+            if method == "STATS":
+                # The session get_db hands out, for its bind only; it never connects
+                db = (database.AsyncSessionLocal or database.SessionLocal)()
+                cache, feed = mock_cache.cache_for(db), coherence.feed_for(db)
+                conn.send({"hits": cache.hits, "misses": cache.misses, "replayed": feed.applied})
+            else:
+                response = client.request(method, url, json=body)
+                conn.send((response.status_code, response.json()))
+
+
+def test_workers_see_each_others_writes_within_the_interval(tmp_path, monkeypatch):
+    import multiprocessing
+    import time
+    from sqlalchemy import create_engine
+    import migrations
+
+    url = f"sqlite:///{tmp_path / 'shared.db'}"
+    engine = create_engine(url)
+    migrations.init_db(engine)
+    engine.dispose()
+    for name, value in {"MOCKTEST_DATABASE_URL": url, "MOCKTEST_ARCHIVE_DATABASE_URL": "", "MOCKTEST_JOB_WORKERS": "0",
+                        "MOCKTEST_AUTO_MIGRATE": "0", "MOCKTEST_WARMUP": "1", "MOCKTEST_COHERENCE_INTERVAL": "0.2"}.items():
+        monkeypatch.setenv(name, value)
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for _ in range(3):
+        conn, child_conn = context.Pipe()
+        process = context.Process(target=_serve_as_worker, args=(child_conn,), daemon=True)
+        process.start()
+        workers.append((process, conn))
+
+    def call(worker, method, path, body=None):
+        conn = workers[worker][1]
+        conn.send((method, path, body))
+        assert conn.poll(60)
+        return conn.recv()
+
+    def settle():
+        # Longer than the check interval, so every worker's next request replays the writes
+        time.sleep(0.5)
+
+    a, b, c = 0, 1, 2
+    try:
+        for _, conn in workers:
+            assert conn.poll(60) and conn.recv() == "ready"
+        # Every worker has built its (empty) question indexes while warming up
+        _, stack = call(a, "POST", "/tech-stacks/", {"name": "Python"})
+        texts = ["How does the garbage collector reclaim cycles?", "When would you reach for a metaclass?",
+                 "Explain descriptors and the attribute lookup order.", "What makes a generator lazy?"]
+        question_ids = [call(a, "POST", "/questions/", {"question_text": text, "tech_stack_id": stack["id"],
+                                                        "ideal_answer": "an ideal answer"})[1]["id"] for text in texts]
+        settle()
+        status, mock = call(b, "POST", "/mocks/generate", {"name": "m", "tech_stack_ids": [stack["id"]], "num_questions": 4})
+        assert status == 200 and sorted(q["id"] for q in mock["questions"]) == question_ids
+        # B flags near-duplicates of questions that only A has written
+        assert call(b, "POST", "/questions/?on_duplicate=reject",
+                    {"question_text": texts[0], "tech_stack_id": stack["id"]})[0] == 409
+
+        for _ in range(5):
+            assert call(c, "GET", f"/mocks/{mock['id']}")[1] == mock
+
+        # An adaptive session on A adds a question to its mock, which C has cached meanwhile
+        _, candidate = call(a, "POST", "/candidates/", {"name": "Ira", "email": "ira@example.com"})
+        _, step = call(a, "POST", "/sessions/adaptive", {"candidate_id": candidate["id"], "tech_stack_ids": [stack["id"]],
+                                                         "max_questions": 3})
+        adaptive_mock_id = call(a, "GET", f"/sessions/{step['session_id']}")[1]["mock_id"]
+        settle()
+        assert len(call(c, "GET", f"/mocks/{adaptive_mock_id}")[1]["questions"]) == 1
+        call(a, "POST", f"/sessions/{step['session_id']}/next-question",
+             {"question_id": step["question"]["id"], "candidate_answer": "no idea"})
+        settle()
+        assert len(call(c, "GET", f"/mocks/{adaptive_mock_id}")[1]["questions"]) == 2
+        # Only the changed mock was dropped; the other one is still served from C's cache
+        assert call(c, "GET", f"/mocks/{mock['id']}")[1] == mock
+
+        stats = call(c, "STATS", None)
+        assert (stats["hits"], stats["misses"]) == (5, 3)
+        assert call(b, "STATS", None)["replayed"] >= len(question_ids)
+    finally:
+        for process, conn in workers:
+            conn.send(None)
+            process.join(30)
@@ -0,0 +1,174 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import adaptive, async_crud, coherence, crud, database, dedup, grading, migrations, mock_cache, models, sampling, schemas
+
+logger = logging.getLogger(__name__)
+
+# A fresh worker pays for everything that is built on first use: opening pooled connections
+# (and their SQLite pragmas), the question indexes behind sampling, dedup and grading, the
+# adaptive parameter arrays and the mock payload cache. Warm-up does that work in the
+# background right after startup, and GET /ready reports 503 until it has finished, so a
+# load balancer only sends traffic to warm workers. GET / stays the liveness check.
+#
+# Schema changes are applied at startup too, unless MOCKTEST_AUTO_MIGRATE=0: deployments that
+# start several workers should run `python migrations.py` once beforehand and turn it off, so
+# the workers neither race each other on DDL nor each pay for the schema check.
+
+AUTO_MIGRATE = os.getenv("MOCKTEST_AUTO_MIGRATE", "1") != "0"
+ENABLED = os.getenv("MOCKTEST_WARMUP", "1") != "0"
+# Connections opened ahead of time per pool (capped at the pool size)
+CONNECTIONS = int(os.getenv("MOCKTEST_WARMUP_CONNECTIONS", "4"))
+# Newest mocks whose payloads are put in the cache
+RECENT_MOCKS = int(os.getenv("MOCKTEST_WARMUP_RECENT_MOCKS", "50"))
+# A failed warm-up (e.g. the database is not reachable yet) is retried after this long, doubling up to a minute
+RETRY_SECONDS = 1.0
+
+
+class Readiness:
+    """Progress of this worker's warm-up, as reported by GET /ready."""
+
+    def __init__(self):
+        self.ready = False
+        self.started = time.perf_counter()
+        self.elapsed_seconds: Optional[float] = None
+        self.steps: Dict[str, float] = {}
+        self.attempts = 0
+        self.error: Optional[str] = None
+
+    def reset(self):
+        self.__init__()
+
+    def report(self) -> schemas.ReadinessReport:
+        return schemas.ReadinessReport(ready=self.ready, steps=dict(self.steps), attempts=self.attempts,
+                                       elapsed_seconds=self.elapsed_seconds, error=self.error)
+
+
+state = Readiness()
+
+
+def migrate():
+    """Creates missing tables and applies pending migrations (blocking; run before serving)."""
+    if AUTO_MIGRATE:
+        migrations.init_db(database.engine)
+
+
+def _pool_size(engine) -> int:
+    size = getattr(engine.pool, "size", None)
+    return min(CONNECTIONS, size()) if callable(size) else 1
+
+
+def _open_connections(engines) -> int:
+    opened = 0
+    for engine in engines:
+        # Held open together, so the pool has to create each of them
+        with contextlib.ExitStack() as stack:
+            for _ in range(_pool_size(engine)):
+                stack.enter_context(engine.connect())
+                opened += 1
+    return opened
+
+
+async def _open_async_connections(engines) -> int:
+    opened = 0
+    for engine in engines:
+        async with contextlib.AsyncExitStack() as stack:
+            for _ in range(_pool_size(engine.sync_engine)):
+                await stack.enter_async_context(engine.connect())
+                opened += 1
+    return opened
+
+
+def _question_indexes(db: Session) -> int:
+    # Marks where the change log stands before the indexes are read, so no write falls in between
+    coherence.refresh(db, force=True)
+    sampling.index_for(db)
+    dedup.index_for(db)
+    grading.index_for(db)
+    bank = adaptive.bank_for(db)
+    stack_ids = db.execute(select(models.TechStack.id)).scalars().all()
+    for stack_id in stack_ids:
+        bank.stack(db, stack_id)
+    return len(stack_ids)
+
+
+def _recent_mocks(db: Session) -> int:
+    cache = mock_cache.cache_for(db)
+    mock_ids = db.execute(select(models.Mock.id).order_by(models.Mock.id.desc()).limit(RECENT_MOCKS)).scalars()
+    loaded = 0
+    # Oldest first, so the newest end up most recently used
+    for mock_id in reversed(mock_ids.all()):
+        entry = mock_cache.load_mock(db, mock_id)
+        if entry is not None:
+            cache.put(mock_id, entry)
+            loaded += 1
+    return loaded
+
+
+async def _with_session(session_factory, fn: Callable[[Session], int]) -> int:
+    # The same session flavour as get_db, so the caches keyed by engine are the ones requests use
+    if database.DB_MODE == "async":
+        async with session_factory() as db:
+            return await async_crud.run(db, fn)
+    db = session_factory()
+    try:
+        return await async_crud.run(db, fn)
+    finally:
+        db.close()
+
+
+def _steps() -> List[tuple]:
+    async_mode = database.DB_MODE == "async"
+    write_factory = database.AsyncSessionLocal if async_mode else database.SessionLocal
+    read_factory = database.AsyncReadSessionLocal if async_mode else database.ReadSessionLocal
+    engines = list(dict.fromkeys([database.engine, database.read_engine]))
+
+    async def connections():
+        opened = await run_in_threadpool(_open_connections, engines)
+        if async_mode:
+            opened += await _open_async_connections(
+                list(dict.fromkeys([database.async_engine, database.async_read_engine])))
+        return opened
+
+    return [
+        ("connections", connections),
+        ("tech_stacks", lambda: _with_session(read_factory, lambda db: len(crud.get_tech_stack_summaries(db)))),
+        ("question_indexes", lambda: _with_session(write_factory, _question_indexes)),
+        ("recent_mocks", lambda: _with_session(write_factory, _recent_mocks)),
+    ]
+
+
+async def run():
+    """Warms this worker up, retrying until it succeeds; marks it ready when done."""
+    if not ENABLED:
+        state.ready = True
+        state.elapsed_seconds = round(time.perf_counter() - state.started, 4)
+        return
+    delay = RETRY_SECONDS
+    while True:
+        state.attempts += 1
+        try:
+            for name, step in _steps():
+                started = time.perf_counter()
+                count = await step()
+                state.steps[name] = round(time.perf_counter() - started, 4)
+                logger.debug("Warm-up step %s: %s in %.3fs", name, count, state.steps[name])
+        except Exception as e:
+            state.error = f"{type(e).__name__}: {e}"
+            logger.exception("Warm-up failed (attempt %d), retrying in %.0fs", state.attempts, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+            continue
+        state.error = None
+        state.elapsed_seconds = round(time.perf_counter() - state.started, 4)
+        state.ready = True
+        logger.info("Worker warmed up in %.3fs", state.elapsed_seconds)
+        return